@@ -41,6 +41,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Outermost to measure the whole request, unused unless SCRAPPER_METRICS_ENABLED is set
+    'scrapper.metrics.MetricsMiddleware',
+    # Unused unless SCRAPPER_PROFILE_ROUTES lists routes which can be profiled
+    'scrapper.profiling.ProfilerMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -122,5 +126,12 @@ USE_TZ = True
 STATIC_URL = '/static/'
 
 REST_FRAMEWORK = {
-    'TEST_REQUEST_DEFAULT_FORMAT': 'json'
+    'TEST_REQUEST_DEFAULT_FORMAT': 'json',
+    # Default page size of cursor paginated lists, clients may override
+    # it with `?page_size=` up to PkCursorPagination.max_page_size
+    'PAGE_SIZE': 100,
+    'DEFAULT_RENDERER_CLASSES': (
+        'scrapper.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class ScrapperConfig(AppConfig):
     name = 'scrapper'
+
+    def ready(self):
+        # Connect signal receivers
+        from scrapper import signals  # noqa: F401
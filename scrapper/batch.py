@@ -0,0 +1,149 @@
+import json
+import logging
+from collections import OrderedDict
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import transaction
+from django.urls import Resolver404, resolve
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of operations in single batch request
+BATCH_MAX_OPERATIONS = getattr(settings, 'SCRAPPER_BATCH_MAX_OPERATIONS', 1000)
+
+METHODS = ('GET', 'POST', 'PUT', 'DELETE')
+
+# Status of operations not run because earlier one failed in all-or-nothing batch
+FAILED_DEPENDENCY = 424
+
+# Headers of batch request which are not passed to its operations
+_SKIPPED_META = ('CONTENT_TYPE', 'CONTENT_LENGTH', 'QUERY_STRING', 'PATH_INFO', 'REQUEST_METHOD', 'wsgi.input')
+_SKIPPED_META_PREFIXES = ('HTTP_IF_', 'HTTP_ACCEPT')
+
+# Routes which cannot be nested in batch
+_EXCLUDED_ROUTES = ('batch',)
+
+
+def validate_operations(data):
+    """
+    Validate batch of operations, each having `method`, `path` and optional `body`.
+    Returns tuple of cleaned operations and list of errors, only one of them is not None.
+    """
+    if not isinstance(data, list):
+        return None, [{'non_field_errors': ['Expected a list of operations.']}]
+    if len(data) > BATCH_MAX_OPERATIONS:
+        return None, [{'non_field_errors': ['Ensure there are no more than %d operations.' % BATCH_MAX_OPERATIONS]}]
+
+    operations = []
+    errors = []
+    for index, operation in enumerate(data):
+        if not isinstance(operation, dict):
+            errors.append({'index': index, 'errors': {'non_field_errors': ['Expected a dictionary.']}})
+            continue
+        operation_errors = {}
+        method = operation.get('method')
+        if not isinstance(method, str) or method.upper() not in METHODS:
+            operation_errors['method'] = ['Expected one of: %s.' % ', '.join(METHODS)]
+        path = operation.get('path')
+        if not isinstance(path, str) or not path:
+            operation_errors['path'] = ['This field is required.']
+        if operation_errors:
+            errors.append({'index': index, 'errors': operation_errors})
+            continue
+        operations.append((method.upper(), path, operation.get('body')))
+
+    if errors:
+        return None, errors
+    return operations, None
+
+
+def _split_path(path):
+    url = urlsplit(path)
+    return url.path if url.path.startswith('/') else '/' + url.path, url.query
+
+
+def _make_request(request, method, path, body):
+    """
+    Build request of single operation, sharing user and session of batch request.
+    """
+    path, query = _split_path(path)
+    content = b'' if body is None else json.dumps(body).encode()
+    environ = {
+        key: value for key, value in request.META.items()
+        if key not in _SKIPPED_META and not key.startswith(_SKIPPED_META_PREFIXES)
+    }
+    environ.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(content)),
+        'HTTP_ACCEPT': 'application/json',
+        'wsgi.input': BytesIO(content),
+    })
+    operation_request = WSGIRequest(environ)
+    for name in ('user', 'session'):
+        if hasattr(request, name):
+            setattr(operation_request, name, getattr(request, name))
+    # Batch request itself passed CSRF check
+    operation_request._dont_enforce_csrf_checks = True
+    # Data read inside batch transaction is not committed yet, see scrapper.caching
+    operation_request._skip_response_cache = True
+    return operation_request
+
+
+def _response_data(response):
+    if hasattr(response, 'data'):
+        return response.data
+    if response.streaming or not response.content:
+        return None
+    # Response served from cache, see scrapper.caching
+    if response.get('Content-Type', '').startswith('application/json'):
+        return json.loads(response.content.decode())
+    return None
+
+
+def _run_operation(request, method, path, body):
+    try:
+        match = resolve(_split_path(path)[0])
+    except Resolver404:
+        match = None
+    if match is None or match.url_name in _EXCLUDED_ROUTES:
+        return 404, {'detail': 'Not found.'}
+
+    try:
+        response = match.func(_make_request(request, method, path, body), *match.args, **match.kwargs)
+    except Exception:
+        logger.exception('Batch operation %s %s failed', method, path)
+        return 500, {'detail': 'Internal server error.'}
+    return response.status_code, _response_data(response)
+
+
+def run_batch(request, operations, atomic=True):
+    """
+    Run operations against API views within single transaction.
+
+    In all-or-nothing (`atomic`) mode the first failed operation rolls back
+    the whole batch and the rest is not run. Otherwise every operation runs
+    in its own savepoint, so only failed ones are rolled back.
+    Returns if anything was committed and list of (status, data) results.
+    """
+    results = []
+    with transaction.atomic():
+        for method, path, body in operations:
+            savepoint = transaction.savepoint()
+            status, data = _run_operation(request, method, path, body)
+            results.append(OrderedDict([('status', status), ('data', data)]))
+            if status < 400:
+                transaction.savepoint_commit(savepoint)
+                continue
+            transaction.savepoint_rollback(savepoint)
+            if atomic:
+                transaction.set_rollback(True)
+                skipped = len(operations) - len(results)
+                results.extend(OrderedDict([('status', FAILED_DEPENDENCY), ('data', None)]) for _ in range(skipped))
+                return False, results
+    return any(result['status'] < 400 for result in results), results
@@ -0,0 +1,262 @@
+import math
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework import fields
+
+from scrapper.caching import bump_version_on_commit
+from scrapper.changes import record
+from scrapper.clusters import cluster_index
+from scrapper.dedup import make_dedup_key
+from scrapper.geocoding import GEOCODE_ON_SAVE, fill_place_data
+from scrapper.models import Change, Place
+from scrapper.search import INDEXED_FIELDS, search_index
+from scrapper.spatial import place_index
+from scrapper.stats import places_moved
+
+# Upper bound of rows inserted by single INSERT statement. It is further
+# lowered to fit in backend's limit of query variables (999 on older SQLite).
+BULK_BATCH_SIZE = getattr(settings, 'SCRAPPER_BULK_BATCH_SIZE', 500)
+
+# Upserts of more places than this rebuild in-memory indexes as whole,
+# smaller ones register their places one by one
+BULK_INDEX_THRESHOLD = getattr(settings, 'SCRAPPER_BULK_INDEX_THRESHOLD', 5000)
+
+_REQUIRED = fields.Field.default_error_messages['required']
+_NULL = fields.Field.default_error_messages['null']
+_INVALID_NUMBER = fields.FloatField.default_error_messages['invalid']
+_NUMBER_TOO_LONG = fields.FloatField.default_error_messages['max_string_length']
+_INVALID_STRING = fields.CharField.default_error_messages['invalid']
+_STRING_TOO_LONG = fields.CharField.default_error_messages['max_length']
+_NULL_CHARACTERS = 'Null characters are not allowed.'
+
+_CHAR_FIELDS = tuple(
+    (name, Place._meta.get_field(name).max_length) for name in ('city', 'country')
+)
+_FLOAT_FIELDS = ('latitude', 'longitude')
+
+# Fields overwritten when saved place turns out to be duplicate of existing one
+UPSERT_FIELDS = ('city', 'country', 'latitude', 'longitude', 'geohash', 'city_key', 'country_key', 'updated_at')
+
+
+def validate_place_data(data):
+    """
+    Validate single place with the same rules as PlaceSerializer does.
+
+    This skips DRF's generic field machinery which is too slow for thousands
+    of rows. Returns tuple of cleaned data dict and errors dict, only one of
+    them is not None.
+    """
+    if not isinstance(data, dict):
+        return None, {'non_field_errors': ['Invalid data. Expected a dictionary.']}
+
+    cleaned = {}
+    errors = {}
+
+    for name, max_length in _CHAR_FIELDS:
+        if name not in data:
+            continue
+        value = data[name]
+        if value is None:
+            errors[name] = [str(_NULL)]
+        elif isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            errors[name] = [str(_INVALID_STRING)]
+        else:
+            value = str(value).strip()
+            if len(value) > max_length:
+                errors[name] = [str(_STRING_TOO_LONG).format(max_length=max_length)]
+            elif '\x00' in value:
+                errors[name] = [_NULL_CHARACTERS]
+            else:
+                cleaned[name] = value
+
+    for name in _FLOAT_FIELDS:
+        if name not in data:
+            errors[name] = [str(_REQUIRED)]
+            continue
+        value = data[name]
+        if value is None:
+            errors[name] = [str(_NULL)]
+        elif isinstance(value, str) and len(value) > fields.FloatField.MAX_STRING_LENGTH:
+            errors[name] = [str(_NUMBER_TOO_LONG)]
+        else:
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                value = None
+            if value is not None and math.isfinite(value):
+                cleaned[name] = value
+            else:
+                errors[name] = [str(_INVALID_NUMBER)]
+
+    if errors:
+        return None, errors
+    return cleaned, None
+
+
+def get_batch_size(batch_size=None):
+    """
+    Get number of places inserted at once which fits in backend's limits.
+    """
+    batch_size = batch_size or BULK_BATCH_SIZE
+    place_fields = [f for f in Place._meta.concrete_fields if not f.primary_key]
+    return max(1, min(batch_size, connection.ops.bulk_batch_size(place_fields, [None] * batch_size)))
+
+
+def as_saved(data):
+    """
+    Get copy of place data as it is saved, with blank city and country geocoded.
+    """
+    data = dict(data)
+    if GEOCODE_ON_SAVE:
+        fill_place_data(data)
+    return data
+
+
+def _dedup_key(data):
+    return make_dedup_key(data.get('city', ''), data.get('country', ''), data['latitude'], data['longitude'])
+
+
+def find_duplicate(data):
+    """
+    Get existing place which is duplicate of one with given data, if any.
+    """
+    key = _dedup_key(as_saved(data))
+    return Place.objects.filter(dedup_key=key).order_by('pk').first()
+
+
+def find_place_pks(rows, batch_size=None):
+    """
+    Get ids of saved places which have the same dedup keys as given place data.
+    """
+    batch_size = get_batch_size(batch_size)
+    keys = list(set(_dedup_key(as_saved(row)) for row in rows))
+    pks = []
+    for start in range(0, len(keys), batch_size):
+        chunk = keys[start:start + batch_size]
+        pks.extend(Place.objects.filter(dedup_key__in=chunk).values_list('pk', flat=True))
+    return pks
+
+
+def upsert_places(rows, batch_size=None):
+    """
+    Save already validated places, given as dicts of field values.
+
+    Places having the same dedup key as existing ones update them in place,
+    the rest are inserted. Returns tuple of numbers of created and updated places.
+    """
+    batch_size = get_batch_size(batch_size)
+    places = {}
+    for row in rows:
+        place = Place(**as_saved(row))
+        place.update_derived_fields()
+        # Later duplicate in the same batch wins
+        places[place.dedup_key] = place
+    if not places:
+        return 0, 0
+
+    keys = list(places)
+    incremental = len(places) <= BULK_INDEX_THRESHOLD
+    # Previous city and country of updated places are taken out of search index
+    tracked = INDEXED_FIELDS if incremental and search_index.is_tracking else ()
+    existing = {}
+    old_values = {}
+    for start in range(0, len(keys), batch_size):
+        chunk = keys[start:start + batch_size]
+        rows = Place.objects.filter(dedup_key__in=chunk).values_list(
+            'dedup_key', 'pk', 'latitude', 'longitude', *tracked)
+        for key, pk, latitude, longitude, *old in rows:
+            existing[key] = (pk, (latitude, longitude))
+            old_values[key] = tuple(old)
+
+    created, updated = [], []
+    # Duplicates can lie a bit off the places they update, groups' stats follow them
+    moves = {}
+    now = timezone.now()
+    for key, place in places.items():
+        if key in existing:
+            place.pk, point = existing[key]
+            place.updated_at = now
+            updated.append(place)
+            if point != (place.latitude, place.longitude):
+                moves[place.pk] = (point, (place.latitude, place.longitude))
+        else:
+            created.append(place)
+
+    Place.objects.bulk_create(created, batch_size=batch_size)
+    Place.objects.bulk_update(updated, UPSERT_FIELDS)
+    places_moved(moves)
+
+    # Not every backend sets primary keys of bulk created rows
+    created_keys = [place.dedup_key for place in created if place.pk is None]
+    for start in range(0, len(created_keys), batch_size):
+        chunk = created_keys[start:start + batch_size]
+        for key, pk in Place.objects.filter(dedup_key__in=chunk).values_list('dedup_key', 'pk'):
+            places[key].pk = pk
+    record(Change.PLACE, Change.UPSERT, sorted(place.pk for place in places.values()))
+    # Bulk operations send no signals, so indexes are notified here
+    if incremental:
+        _register_on_commit(places.values(), old_values, tracked)
+    else:
+        transaction.on_commit(place_index.mark_stale)
+        transaction.on_commit(search_index.mark_stale)
+        transaction.on_commit(cluster_index.mark_stale)
+    bump_version_on_commit('place')
+    return len(created), len(updated)
+
+
+def _register_on_commit(places, old_values, tracked):
+    """
+    Register upserted places with in-memory indexes after commit, the way
+    signals of single saved place do. Search index is notified only when
+    `tracked` fields of updated places were read, see `upsert_places`.
+    """
+    points = [(place.pk, place.latitude, place.longitude) for place in places]
+    search_changes = [
+        (old_values.get(place.dedup_key) or None, tuple(getattr(place, name) for name in INDEXED_FIELDS))
+        for place in places
+    ] if tracked else []
+
+    def register():
+        for pk, latitude, longitude in points:
+            place_index.place_changed(pk, latitude, longitude)
+            cluster_index.place_changed(pk, latitude, longitude)
+        for old, new in search_changes:
+            search_index.place_changed(old, new)
+
+    transaction.on_commit(register)
+
+
+def bulk_create_places(items, batch_size=None):
+    """
+    Validate and save many places in single transaction.
+
+    Invalid items are skipped and reported, they do not abort the rest.
+    Duplicates of existing places update them instead of being inserted.
+    Returns tuple of numbers of created and updated places and list of errors,
+    each having index of the item in `items` and its validation errors.
+    """
+    batch_size = get_batch_size(batch_size)
+    created = 0
+    updated = 0
+    errors = []
+    batch = []
+
+    with transaction.atomic():
+        for index, item in enumerate(items):
+            cleaned, item_errors = validate_place_data(item)
+            if item_errors:
+                errors.append({'index': index, 'errors': item_errors})
+                continue
+            batch.append(cleaned)
+            if len(batch) >= batch_size:
+                batch_created, batch_updated = upsert_places(batch, batch_size)
+                created += batch_created
+                updated += batch_updated
+                batch = []
+        batch_created, batch_updated = upsert_places(batch, batch_size)
+        created += batch_created
+        updated += batch_updated
+
+    return created, updated, errors
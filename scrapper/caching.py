@@ -0,0 +1,147 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+from scrapper.changes import ChangeLogWatch
+from scrapper.metrics import timed
+
+# Seconds for which rendered responses are kept in cache
+RESPONSE_CACHE_TIMEOUT = getattr(settings, 'SCRAPPER_RESPONSE_CACHE_TIMEOUT', 300)
+
+# Seconds for which the latest logged change is remembered. Changes of other
+# processes invalidate cached responses at most this late, unless the cache
+# holding versions is shared between them.
+CHANGE_LOG_INTERVAL = getattr(settings, 'SCRAPPER_CHANGE_LOG_INTERVAL', 1)
+
+VERSION_KEY_PREFIX = 'scrapper:version:'
+MODIFIED_KEY_PREFIX = 'scrapper:modified:'
+RESPONSE_KEY_PREFIX = 'scrapper:response:'
+
+# Headers of cached response restored together with its content
+CACHED_HEADERS = ('Content-Type', 'Link', 'X-Row-Count')
+
+# Changes are logged in the database by every process, so the latest of them
+# tells apart data changed by other workers and commands, whose version bumps
+# go to their own cache when it is not shared
+change_log = ChangeLogWatch(CHANGE_LOG_INTERVAL)
+
+
+def _new_version():
+    # Start from current time so version lost from cache is not reused
+    return int(time.time() * 1000000)
+
+
+def get_versions(scopes):
+    """
+    Get current versions and last modification times of given scopes.
+    Versions end with id of the latest logged change, see `change_log`.
+    """
+    keys = [VERSION_KEY_PREFIX + scope for scope in scopes]
+    modified_keys = [MODIFIED_KEY_PREFIX + scope for scope in scopes]
+    values = cache.get_many(keys + modified_keys)
+    versions = []
+    for key in keys:
+        version = values.get(key)
+        if version is None:
+            cache.add(key, _new_version(), None)
+            version = cache.get(key)
+        versions.append(version)
+    change_pk, changed = change_log.latest()
+    versions.append(change_pk)
+    modified = max([values.get(key, 0) for key in modified_keys] + [changed or 0]) or None
+    return versions, modified
+
+
+def bump_version(*scopes):
+    """
+    Mark data of given scopes as changed, invalidating their cached responses.
+    """
+    now = int(time.time())
+    for scope in scopes:
+        key = VERSION_KEY_PREFIX + scope
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_version(), None)
+        cache.set(MODIFIED_KEY_PREFIX + scope, now, None)
+
+
+def bump_version_on_commit(*scopes):
+    """
+    Bump versions right away and once more after commit, so responses
+    cached between the two do not outlive the change.
+    """
+    bump_version(*scopes)
+    transaction.on_commit(lambda: bump_version(*scopes))
+
+
+def _not_modified(request, etag, modified):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        return if_none_match.strip() == '*' or etag in (e.strip() for e in if_none_match.split(','))
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return bool(modified and if_modified_since and modified <= if_modified_since)
+
+
+def versioned_response(scopes):
+    """
+    Serve GET requests of decorated view conditionally and from cache.
+
+    `scopes` is a function receiving view's keyword arguments and returning
+    names of data versions the response depends on. ETag is derived from the
+    versions, so matching `If-None-Match` gets 304 and repeated requests get
+    cached bytes, both without database queries, apart from reading the
+    latest logged change once per CHANGE_LOG_INTERVAL.
+
+    Requests marked with `_skip_response_cache` always run the view and their
+    responses are not cached, e.g. operations of batch, which can read data of
+    transaction rolled back later, and profiled requests.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or getattr(request, '_skip_response_cache', False):
+                return view(request, *args, **kwargs)
+
+            versions, modified = get_versions(scopes(**kwargs))
+            signature = '|'.join([
+                request.path,
+                request.META.get('QUERY_STRING', ''),
+                request.META.get('HTTP_ACCEPT', ''),
+            ] + [str(v) for v in versions])
+            etag = quote_etag(hashlib.md5(signature.encode()).hexdigest())
+
+            if _not_modified(request, etag, modified):
+                response = HttpResponseNotModified()
+            else:
+                cached = cache.get(RESPONSE_KEY_PREFIX + etag)
+                if cached is not None:
+                    content, headers = cached
+                    response = HttpResponse(content)
+                    for header, value in headers:
+                        response[header] = value
+                else:
+                    response = view(request, *args, **kwargs)
+                    if response.status_code != 200 or response.streaming:
+                        return response
+                    if hasattr(response, 'render'):
+                        with timed('render'):
+                            response.render()
+                    headers = [(header, response[header]) for header in CACHED_HEADERS
+                               if response.has_header(header)]
+                    cache.set(RESPONSE_KEY_PREFIX + etag, (response.content, headers), RESPONSE_CACHE_TIMEOUT)
+
+            response['ETag'] = etag
+            if modified:
+                response['Last-Modified'] = http_date(modified)
+            patch_vary_headers(response, ('Accept',))
+            return response
+        return wrapper
+    return decorator
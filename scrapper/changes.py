@@ -0,0 +1,220 @@
+import datetime
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, transaction
+from django.db.models import Case, Max, Min, Value, When
+from django.utils import timezone
+
+from scrapper.fastjson import group_rows, place_rows
+from scrapper.models import Change, Group, Place
+
+# Number of changes returned by single delta sync request by default and at most
+CHANGES_PAGE_SIZE = getattr(settings, 'SCRAPPER_CHANGES_PAGE_SIZE', 500)
+CHANGES_MAX_PAGE_SIZE = getattr(settings, 'SCRAPPER_CHANGES_MAX_PAGE_SIZE', 5000)
+
+# Days for which changes are kept, clients which did not sync for longer sync again from scratch
+CHANGES_RETENTION_DAYS = getattr(settings, 'SCRAPPER_CHANGES_RETENTION_DAYS', 30)
+
+# Number of ids passed to single `IN (...)` lookup, it must fit in SQLite's
+# limit of 999 query variables
+LOOKUP_CHUNK_SIZE = 500
+
+
+def _chunks(items, size=LOOKUP_CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def record(kind, action, object_pks):
+    """
+    Log upserts or deletions of places or groups with given ids.
+    """
+    Change.objects.bulk_create([Change(kind=kind, action=action, object_id=pk) for pk in object_pks])
+
+
+def record_memberships(action, memberships):
+    """
+    Log places added to or removed from groups, given as (group id, place id) pairs.
+    """
+    Change.objects.bulk_create([
+        Change(kind=Change.MEMBERSHIP, action=action, object_id=group_pk, place_id=place_pk)
+        for group_pk, place_pk in memberships
+    ])
+
+
+def touch_groups(group_pks):
+    """
+    Set `updated_at` of groups whose places changed.
+    """
+    now = timezone.now()
+    for chunk in _chunks(group_pks):
+        Group.objects.filter(pk__in=chunk).update(updated_at=now)
+
+
+def latest_change():
+    """
+    Get id and creation time, as timestamp, of the latest logged change, or (0, None).
+    """
+    latest = Change.objects.order_by('-pk').values_list('pk', 'created_at').first()
+    if latest is None:
+        return 0, None
+    return latest[0], int(latest[1].timestamp())
+
+
+class ChangeLogWatch(object):
+    """
+    Tell in-memory indexes if changes were logged since they read database.
+
+    Indexes are kept in sync by signals of their own process only, writes of
+    other workers and of management commands are known from the log alone.
+    Log is read at most once per `interval` seconds.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._latest = None
+        self._changed_at = None
+        self._checked_at = None
+
+    def reset(self):
+        """
+        Remember the latest change, called before data is read from database.
+        """
+        self._latest, self._changed_at = latest_change()
+        self._checked_at = time.monotonic()
+
+    def latest(self):
+        """
+        Get id and creation timestamp of the latest change as `latest_change`
+        does, reading the log again only once interval passed.
+        """
+        if self._checked_at is None or time.monotonic() - self._checked_at >= self.interval:
+            self.reset()
+        return self._latest, self._changed_at
+
+    def changed(self):
+        """
+        Check if changes were logged since reset or previous check, once interval passed.
+        First check only remembers the latest change.
+        """
+        if self._checked_at is not None and time.monotonic() - self._checked_at < self.interval:
+            return False
+        latest = self._latest
+        self.reset()
+        return latest is not None and self._latest > latest
+
+
+def _rows_by_pk(rows, pks):
+    found = {}
+    for chunk in _chunks(pks):
+        found.update((row['id'], row) for row in rows.filter(pk__in=chunk))
+    return found
+
+
+def sequence_changes(limit):
+    """
+    Number committed changes which have no sequence yet, at most `limit` of them.
+
+    Ids are taken in order of inserts, but transactions can commit out of
+    that order, so reader holding the id of a later change would skip an
+    earlier one committed after it was read. Only committed changes are
+    visible here and every run continues after the highest sequence, so
+    sequences follow order of commits. Concurrent runs collide on unique
+    sequence and the later one leaves the work to the other.
+    Returns if more changes wait.
+    """
+    try:
+        with transaction.atomic():
+            pending = list(Change.objects.filter(sequence__isnull=True)
+                           .order_by('pk').values_list('pk', flat=True)[:limit + 1])
+            if not pending:
+                return False
+            last = Change.objects.aggregate(last=Max('sequence'))['last'] or 0
+            for start in range(0, min(len(pending), limit), LOOKUP_CHUNK_SIZE):
+                chunk = pending[start:min(start + LOOKUP_CHUNK_SIZE, limit)]
+                Change.objects.filter(pk__in=chunk).update(sequence=Case(
+                    *[When(pk=pk, then=Value(last + start + index + 1)) for index, pk in enumerate(chunk)]
+                ))
+    except (IntegrityError, OperationalError):
+        return True
+    return len(pending) > limit
+
+
+def oldest_token():
+    """
+    Get the oldest token changes can be listed from, older ones were pruned.
+    """
+    first = Change.objects.aggregate(first=Min('sequence'))['first']
+    return first - 1 if first else 0
+
+
+def latest_token():
+    """
+    Get token of the latest numbered change, from which client synced from scratch continues.
+    """
+    return Change.objects.aggregate(last=Max('sequence'))['last'] or 0
+
+
+def prune_changes(days=None):
+    """
+    Delete numbered changes older than given number of days, the latest one is kept
+    so tokens stay comparable. Returns number of deleted changes.
+    """
+    days = CHANGES_RETENTION_DAYS if days is None else days
+    before = timezone.now() - datetime.timedelta(days=days)
+    deleted, _ = Change.objects.filter(
+        sequence__lt=latest_token(), created_at__lt=before
+    ).delete()
+    return deleted
+
+
+def changes_since(token, page_size=None):
+    """
+    Get changes logged after given token, oldest first, at most `page_size` of them.
+
+    Upserts carry current data of the object, only the last upsert of every
+    object within the page is kept. Upserts of objects deleted since are
+    skipped, as their tombstones follow. Deleting place or group removes
+    its memberships too, without separate entries for them.
+    Returns list of changes, token to continue from and if more changes wait.
+    """
+    page_size = page_size or CHANGES_PAGE_SIZE
+    pending = sequence_changes(page_size + 1)
+    rows = list(
+        Change.objects.filter(sequence__gt=token)
+        .order_by('sequence')
+        .values_list('sequence', 'kind', 'action', 'object_id', 'place_id')[:page_size + 1]
+    )
+    has_more = len(rows) > page_size or pending
+    rows = rows[:page_size]
+    next_token = rows[-1][0] if rows else token
+
+    last_upserts = {}
+    for index, (_, kind, action, object_pk, _) in enumerate(rows):
+        if action == Change.UPSERT:
+            last_upserts[kind, object_pk] = index
+    data = {
+        Change.PLACE: _rows_by_pk(place_rows(Place.objects.all()),
+                                  [pk for kind, pk in last_upserts if kind == Change.PLACE]),
+        Change.GROUP: _rows_by_pk(group_rows(Group.objects.active()),
+                                  [pk for kind, pk in last_upserts if kind == Change.GROUP]),
+    }
+
+    changes = []
+    for index, (_, kind, action, object_pk, place_pk) in enumerate(rows):
+        if kind == Change.MEMBERSHIP:
+            changes.append(OrderedDict([
+                ('type', kind), ('action', action), ('group', object_pk), ('place', place_pk),
+            ]))
+        elif action == Change.UPSERT:
+            if last_upserts[kind, object_pk] != index or object_pk not in data[kind]:
+                continue
+            changes.append(OrderedDict([
+                ('type', kind), ('action', action), ('id', object_pk), ('data', data[kind][object_pk]),
+            ]))
+        else:
+            changes.append(OrderedDict([('type', kind), ('action', action), ('id', object_pk)]))
+    return changes, next_token, has_more
@@ -0,0 +1,362 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+
+from scrapper.changes import ChangeLogWatch
+from scrapper.geo import split_bbox
+from scrapper.models import Group, Place
+from scrapper.spatial import to_unit_vectors
+from scrapper.streaming import iterate_in_chunks
+
+# Highest zoom level of map tiles which places are clustered for
+CLUSTER_MAX_ZOOM = getattr(settings, 'SCRAPPER_CLUSTER_MAX_ZOOM', 20)
+
+# Number of grid cells along side of map tile, power of two, 4 gives 64 pixel cells on 256 pixel tiles
+CLUSTER_CELLS_PER_TILE = getattr(settings, 'SCRAPPER_CLUSTER_CELLS_PER_TILE', 4)
+
+# Number of grid cells single request can cover, bigger boxes need lower zoom
+CLUSTER_MAX_CELLS = getattr(settings, 'SCRAPPER_CLUSTER_MAX_CELLS', 10000)
+
+# Number of changes kept aside of sorted arrays before they are rebuilt
+CLUSTER_REBUILD_THRESHOLD = getattr(settings, 'SCRAPPER_CLUSTER_REBUILD_THRESHOLD', 10000)
+
+# Seconds after which grids are built again if changes were logged meanwhile
+CLUSTER_REBUILD_INTERVAL = getattr(settings, 'SCRAPPER_CLUSTER_REBUILD_INTERVAL', 300)
+
+# Number of groups whose places are kept clustered in memory
+CLUSTER_GROUP_CACHE_SIZE = getattr(settings, 'SCRAPPER_CLUSTER_GROUP_CACHE_SIZE', 32)
+
+_CELL_BITS = CLUSTER_CELLS_PER_TILE.bit_length() - 1
+
+# Places are placed on grid of the highest zoom, cells of lower zooms are made of its cells
+GRID_BITS = CLUSTER_MAX_ZOOM + _CELL_BITS
+if GRID_BITS > 31:
+    raise ValueError('SCRAPPER_CLUSTER_MAX_ZOOM is too high for SCRAPPER_CLUSTER_CELLS_PER_TILE.')
+
+# Web Mercator projection ends here
+MAX_LATITUDE = 85.0511287798
+
+_MORTON_MASKS = [(16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+                 (2, 0x3333333333333333), (1, 0x5555555555555555)]
+
+Membership = Group.places.through
+
+
+def _spread_bits(values):
+    values = values.astype(np.uint64)
+    for shift, mask in _MORTON_MASKS:
+        values = (values | (values << np.uint64(shift))) & np.uint64(mask)
+    return values
+
+
+def morton_codes(xs, ys):
+    """
+    Interleave bits of grid coordinates, so cells of every lower zoom cover contiguous ranges of codes.
+    """
+    return _spread_bits(np.asarray(xs)) | (_spread_bits(np.asarray(ys)) << np.uint64(1))
+
+
+def _grid_x(longitudes, size):
+    x = (np.asarray(longitudes, dtype=np.float64) + 180) / 360
+    return np.clip(np.floor(x * size), 0, size - 1).astype(np.int64)
+
+
+def _grid_y(latitudes, size):
+    latitudes = np.clip(np.asarray(latitudes, dtype=np.float64), -MAX_LATITUDE, MAX_LATITUDE)
+    y = 0.5 - np.arcsinh(np.tan(np.radians(latitudes))) / (2 * np.pi)
+    return np.clip(np.floor(y * size), 0, size - 1).astype(np.int64)
+
+
+def grid_codes(latitudes, longitudes):
+    """
+    Get Morton codes of cells of the highest zoom grid containing given points.
+    """
+    size = 1 << GRID_BITS
+    return morton_codes(_grid_x(longitudes, size), _grid_y(latitudes, size))
+
+
+def bbox_cells(zoom, bbox=None):
+    """
+    Get x and y coordinates of grid cells at zoom which intersect bounding box,
+    the whole world without it. Raises ValueError when there are more than
+    CLUSTER_MAX_CELLS of them.
+    """
+    size = 1 << (zoom + _CELL_BITS)
+    boxes = split_bbox(bbox) if bbox is not None else [(-180.0, -90.0, 180.0, 90.0)]
+    columns = []
+    for min_lon, min_lat, max_lon, max_lat in boxes:
+        columns.append(np.arange(_grid_x(min_lon, size), _grid_x(max_lon, size) + 1))
+        # North is at the top of the grid
+        rows = np.arange(_grid_y(max_lat, size), _grid_y(min_lat, size) + 1)
+    columns = np.unique(np.concatenate(columns))
+    if len(columns) * len(rows) > CLUSTER_MAX_CELLS:
+        raise ValueError('Bounding box covers more than %d cells at zoom %d, zoom in or shrink it.'
+                         % (CLUSTER_MAX_CELLS, zoom))
+    xs, ys = np.meshgrid(columns, rows)
+    return xs.ravel(), ys.ravel()
+
+
+def _centroids(sums):
+    x, y, z = sums[:, 0], sums[:, 1], sums[:, 2]
+    return np.degrees(np.arctan2(z, np.hypot(x, y))), np.degrees(np.arctan2(y, x))
+
+
+class ClusterGrid(object):
+    """
+    Places sorted by Morton code of their cell of the highest zoom grid.
+
+    Every cell of any zoom covers contiguous range of sorted places, so its
+    count and sum of unit vectors are found by binary search in prefix sums.
+    Places changed since build are masked out of the sums and counted aside.
+    """
+
+    def __init__(self, pks, latitudes, longitudes):
+        codes = grid_codes(latitudes, longitudes)
+        order = np.argsort(codes, kind='stable')
+        self.codes = codes[order]
+        self.pks = np.asarray(pks, dtype=np.int64)[order]
+        vectors = to_unit_vectors(latitudes, longitudes).reshape(-1, 3)[order]
+        self.sums = np.concatenate([np.zeros((1, 3)), np.cumsum(vectors, axis=0)])
+        self._pk_order = np.argsort(self.pks, kind='stable')
+        self._lock = threading.Lock()
+        # place id -> (latitude, longitude), None if place left
+        self._changes = {}
+        self._overlay = None
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Build grid from (place id, latitude, longitude) rows.
+        """
+        rows = list(rows)
+        if not rows:
+            return cls([], [], [])
+        return cls(*zip(*rows))
+
+    def _position(self, pk):
+        index = np.searchsorted(self.pks, pk, sorter=self._pk_order)
+        if index < len(self.pks) and self.pks[self._pk_order[index]] == pk:
+            return int(self._pk_order[index])
+        return None
+
+    def contains(self, pk):
+        with self._lock:
+            if pk in self._changes:
+                return self._changes[pk] is not None
+        return self._position(pk) is not None
+
+    def register(self, pk, point):
+        """
+        Move place to (latitude, longitude) point, None removes it.
+        """
+        with self._lock:
+            self._changes[pk] = point
+            self._overlay = None
+
+    @property
+    def changes(self):
+        return len(self._changes)
+
+    def _snapshot(self):
+        """
+        Get Morton codes and unit vectors of places to subtract and to add to sums.
+        """
+        with self._lock:
+            if self._overlay is not None:
+                return self._overlay
+            positions = [position for position in map(self._position, self._changes) if position is not None]
+            positions = np.array(positions, dtype=np.int64)
+            removed = (self.codes[positions], self.sums[positions + 1] - self.sums[positions])
+            points = [point for point in self._changes.values() if point is not None]
+            if points:
+                latitudes, longitudes = zip(*points)
+                added = (grid_codes(latitudes, longitudes), to_unit_vectors(latitudes, longitudes).reshape(-1, 3))
+            else:
+                added = (np.empty(0, dtype=np.uint64), np.empty((0, 3)))
+            self._overlay = removed, added
+            return self._overlay
+
+    def clusters(self, zoom, bbox=None):
+        """
+        Get clusters of places in grid cells at zoom which intersect bounding box.
+        Returns list of (count, latitude, longitude) of non-empty cells, centroid
+        being spherical. Raises ValueError if box covers too many cells.
+        """
+        xs, ys = bbox_cells(zoom, bbox)
+        shift = np.uint64(2 * (GRID_BITS - zoom - _CELL_BITS))
+        cells = np.sort(morton_codes(xs, ys))
+        starts = np.searchsorted(self.codes, cells << shift)
+        ends = np.searchsorted(self.codes, (cells + np.uint64(1)) << shift)
+        counts = ends - starts
+        sums = self.sums[ends] - self.sums[starts]
+
+        (removed_codes, removed_vectors), (added_codes, added_vectors) = self._snapshot()
+        for codes, vectors, sign in ((removed_codes, removed_vectors, -1), (added_codes, added_vectors, 1)):
+            if not len(codes):
+                continue
+            place_cells = codes >> shift
+            index = np.minimum(np.searchsorted(cells, place_cells), len(cells) - 1)
+            inside = cells[index] == place_cells
+            np.add.at(counts, index[inside], sign)
+            np.add.at(sums, index[inside], sign * vectors[inside])
+
+        found = counts > 0
+        latitudes, longitudes = _centroids(sums[found])
+        return list(zip(counts[found].tolist(), latitudes.tolist(), longitudes.tolist()))
+
+
+class PlaceClusterIndex(object):
+    """
+    Grid clustering of all places and of places of recently clustered groups.
+
+    Grid of all places is built from database on first use, grids of groups
+    on their first request, and then kept in sync by calls from
+    scrapper.signals, scrapper.bulk and scrapper.purge. Grids with many
+    changes kept aside are rebuilt, the one of all places in background.
+    Changes of other processes are picked up from the change log.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._grid = None
+        self._stale = False
+        self._rebuilding = False
+        self._groups = OrderedDict()
+        # Changes registered during build, keyed by None for all places, replayed on the new grid
+        self._replay = {}
+        self._log = ChangeLogWatch(CLUSTER_REBUILD_INTERVAL)
+
+    def rebuild(self):
+        """
+        Build grid of all places from database and swap it in.
+        Grids of groups are built again when they are requested next time.
+        """
+        with self._lock:
+            self._stale = False
+            self._replay[None] = []
+            self._groups.clear()
+            self._log.reset()
+        rows = []
+        for chunk in iterate_in_chunks(Place.objects.all(), ('pk', 'latitude', 'longitude')):
+            rows.extend(chunk)
+        grid = ClusterGrid.from_rows(rows)
+        with self._lock:
+            for pk, point in self._replay.pop(None):
+                grid.register(pk, point)
+            self._grid = grid
+
+    def _group_grid(self, group_pk):
+        with self._lock:
+            grid = self._groups.get(group_pk)
+            if grid is not None:
+                self._groups.move_to_end(group_pk)
+                return grid
+            self._replay[group_pk] = []
+        rows = (Membership.objects.filter(group_id=group_pk)
+                .values_list('place_id', 'place__latitude', 'place__longitude'))
+        grid = ClusterGrid.from_rows(rows.iterator())
+        with self._lock:
+            replay = self._replay.pop(group_pk, None)
+            if replay is None:
+                # Group's places changed in bulk meanwhile, grid is used just once
+                return grid
+            for is_member, pk, point in replay:
+                if is_member or grid.contains(pk):
+                    grid.register(pk, point)
+            self._groups[group_pk] = grid
+            while len(self._groups) > CLUSTER_GROUP_CACHE_SIZE:
+                self._groups.popitem(last=False)
+        return grid
+
+    def mark_stale(self):
+        """
+        Schedule rebuild after changes which were not registered one by one,
+        like bulk upserts, and forget grids of groups.
+        """
+        with self._lock:
+            self._stale = True
+            self._groups.clear()
+
+    def place_changed(self, place_id, latitude, longitude):
+        self._register(place_id, (latitude, longitude))
+
+    def place_deleted(self, place_id):
+        self._register(place_id, None)
+
+    def _register(self, place_id, point):
+        with self._lock:
+            if None in self._replay:
+                self._replay[None].append((place_id, point))
+            if self._grid is not None:
+                self._grid.register(place_id, point)
+            for group_pk, grid in list(self._groups.items()):
+                if grid.contains(place_id):
+                    self._register_in_group(group_pk, grid, place_id, point)
+            # Places of groups being built are not known yet, so they are checked on replay
+            for group_pk, replay in self._replay.items():
+                if group_pk is not None and replay is not None:
+                    replay.append((False, place_id, point))
+
+    def memberships_changed(self, group_pk, places):
+        """
+        Register places added to group, given as dict of place id -> (latitude, longitude),
+        or removed from it, given with None instead of coordinates.
+        """
+        with self._lock:
+            grid = self._groups.get(group_pk)
+            for place_id, point in places.items():
+                if grid is not None:
+                    self._register_in_group(group_pk, grid, place_id, point)
+                if self._replay.get(group_pk) is not None:
+                    self._replay[group_pk].append((True, place_id, point))
+
+    def groups_changed(self, group_pks):
+        """
+        Forget grids of groups whose places were changed without registering them one by one.
+        """
+        with self._lock:
+            for group_pk in group_pks:
+                self._groups.pop(group_pk, None)
+                if group_pk in self._replay:
+                    # Grid being built may have missed the change
+                    self._replay[group_pk] = None
+
+    def _register_in_group(self, group_pk, grid, place_id, point):
+        grid.register(place_id, point)
+        if grid.changes >= CLUSTER_REBUILD_THRESHOLD:
+            del self._groups[group_pk]
+
+    def clusters(self, zoom, bbox=None, group_pk=None):
+        """
+        Get clusters of all places, or of group's places, in grid cells at zoom
+        intersecting bounding box. Returns list of (count, latitude, longitude).
+        Raises ValueError if box covers too many cells.
+        """
+        with self._lock:
+            # Places changed by other processes are known from the change log only
+            if self._log.changed():
+                self.mark_stale()
+        if group_pk is not None:
+            return self._group_grid(group_pk).clusters(zoom, bbox)
+        if self._grid is None:
+            self.rebuild()
+        with self._lock:
+            grid = self._grid
+            if (self._stale or grid.changes >= CLUSTER_REBUILD_THRESHOLD) and not self._rebuilding:
+                self._rebuilding = True
+                threading.Thread(target=self._background_rebuild, daemon=True).start()
+        return grid.clusters(zoom, bbox)
+
+    def _background_rebuild(self):
+        try:
+            self.rebuild()
+        finally:
+            self._rebuilding = False
+            connection.close()
+
+
+# Process wide index kept in sync by scrapper.signals
+cluster_index = PlaceClusterIndex()
@@ -0,0 +1,30 @@
+import hashlib
+
+from django.conf import settings
+
+# Number of decimal places of coordinates taken into account when
+# comparing places, 5 places is about one meter
+DEDUP_PRECISION = getattr(settings, 'SCRAPPER_DEDUP_PRECISION', 5)
+
+
+def normalize_name(value):
+    """
+    Case fold name and strip surrounding whitespace.
+    """
+    return (value or '').strip().casefold()
+
+
+def make_dedup_key(city, country, latitude, longitude):
+    """
+    Build key which is equal for places considered duplicates.
+
+    Coordinates are rounded and city and country are case folded with
+    surrounding whitespace stripped. Key is hashed to keep it short.
+    """
+    normalized = '%.*f|%.*f|%s|%s' % (
+        DEDUP_PRECISION, round(latitude, DEDUP_PRECISION) + 0.0,
+        DEDUP_PRECISION, round(longitude, DEDUP_PRECISION) + 0.0,
+        normalize_name(city),
+        normalize_name(country),
+    )
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
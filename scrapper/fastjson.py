@@ -0,0 +1,190 @@
+from operator import itemgetter
+
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from scrapper.membership import MEMBERSHIP_CHUNK_SIZE, Membership
+from scrapper.metrics import timed
+from scrapper.pagination import PkCursorPagination, is_unpaginated
+from scrapper.serializers import GroupSerializer, PlaceSerializer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+PLACE_FIELDS = PlaceSerializer.Meta.fields
+GROUP_FIELDS = GroupSerializer.Meta.fields
+
+# Query parameter listing comma separated fields which are selected and returned
+FIELDS_QUERY_PARAM = 'fields'
+
+# Format of responses holding header row followed by arrays of values, see CompactJSONRenderer
+COMPACT_FORMAT = 'compact'
+
+# Same output as DRF's JSONRenderer with default settings, which reject NaN and infinities
+_encoder = JSONEncoder(ensure_ascii=False, allow_nan=False, separators=(',', ':'))
+
+# Dates and times are left to DRF's encoder, which writes UTC as `Z` and cuts microseconds
+_ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME if orjson is not None else 0
+
+
+def _float_repr_compatible(value):
+    """
+    Check if orjson formats float the same way as Python's repr does.
+    They differ in exponent notation of very small and very large numbers
+    and in NaN and infinities.
+    """
+    return value == 0 or 1e-4 <= abs(value) < 1e16
+
+
+def _orjson_compatible(data):
+    """
+    Check if all floats in data, nested in lists and dicts, are formatted alike by orjson and json.
+    """
+    if data.__class__ is float:
+        return _float_repr_compatible(data)
+    if isinstance(data, dict):
+        data = data.values()
+    elif not isinstance(data, (list, tuple)):
+        return True
+    for value in data:
+        if value.__class__ is float:
+            if not _float_repr_compatible(value):
+                return False
+        elif isinstance(value, (dict, list, tuple)) and not _orjson_compatible(value):
+            return False
+    return True
+
+
+def _dumps(data):
+    if _orjson_compatible(data):
+        try:
+            return orjson.dumps(data, option=_ORJSON_OPTIONS)
+        except TypeError:
+            # Raised for types orjson does not serialize, like dates, decimals,
+            # lazy strings, sets, non-str keys and ints wider than 64 bits
+            return _encoder.encode(data).encode()
+    # Only parts holding incompatible floats are left to the slower encoder
+    if isinstance(data, (list, tuple)):
+        return b'[' + b','.join(_dumps(item) for item in data) + b']'
+    if isinstance(data, dict) and all(key.__class__ is str for key in data):
+        return b'{' + b','.join(
+            orjson.dumps(key) + b':' + _dumps(value) for key, value in data.items()
+        ) + b'}'
+    return _encoder.encode(data).encode()
+
+
+def dumps(data):
+    """
+    Encode data into bytes identical to DRF's JSONRenderer compact output.
+
+    orjson is used when it is installed, except for values it formats
+    differently or does not serialize, which go through DRF's encoder.
+    """
+    if orjson is not None:
+        content = _dumps(data)
+        if b'\xe2\x80\xa8' in content or b'\xe2\x80\xa9' in content:
+            content = content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return content
+    content = _encoder.encode(data)
+    return content.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
+
+
+def requested_fields(request, available):
+    """
+    Get fields listed in `?fields=`, in requested order, or all available ones.
+    Renderers which need specific fields, declared as their `fields`, get those.
+    Raises ValueError when unknown field is requested.
+    """
+    renderer_fields = getattr(getattr(request, 'accepted_renderer', None), 'fields', None)
+    if renderer_fields:
+        return tuple(renderer_fields)
+    value = request.query_params.get(FIELDS_QUERY_PARAM)
+    if value is None:
+        return tuple(available)
+    fields = []
+    for name in value.split(','):
+        name = name.strip()
+        if name and name not in fields:
+            fields.append(name)
+    unknown = [name for name in fields if name not in available]
+    if unknown:
+        raise ValueError('Unknown fields: %s.' % ', '.join(unknown))
+    if not fields:
+        raise ValueError('At least one of fields is required: %s.' % ', '.join(available))
+    return tuple(fields)
+
+
+def is_compact(request):
+    """
+    Check if accepted renderer takes compact rows, like `?format=compact` one.
+    """
+    return getattr(getattr(request, 'accepted_renderer', None), 'compact_rows', False)
+
+
+def place_rows(queryset, fields=PLACE_FIELDS):
+    """
+    Select places as dicts equal to PlaceSerializer's output, limited to given fields.
+    Primary key is always selected, pagination depends on it, `project` drops it.
+    """
+    if 'id' not in fields:
+        return queryset.values('id', *fields)
+    return queryset.values(*fields)
+
+
+def project(fields, compact=False):
+    """
+    Build transform for `rows_response`, turning rows into dicts of given fields
+    or, when compact, into header row followed by arrays of values.
+    """
+    def transform(rows):
+        if compact:
+            if len(fields) == 1:
+                name = fields[0]
+                return [list(fields)] + [[row[name]] for row in rows]
+            getter = itemgetter(*fields)
+            return [list(fields)] + [getter(row) for row in rows]
+        if 'id' not in fields:
+            return [{name: row[name] for name in fields} for row in rows]
+        return list(rows)
+    return transform
+
+
+def group_rows(queryset):
+    """
+    Select groups as dicts with id and name, `with_places` completes them.
+    """
+    return queryset.values('id', 'name')
+
+
+def with_places(groups):
+    """
+    Add ids of places, ordered ascending, to groups selected with group_rows,
+    making them equal to GroupSerializer's output. Uses one query per chunk of groups.
+    """
+    groups = list(groups)
+    places = {}
+    for group in groups:
+        group['places'] = places[group['id']] = []
+    group_pks = list(places)
+    for start in range(0, len(group_pks), MEMBERSHIP_CHUNK_SIZE):
+        memberships = Membership.objects.filter(group_id__in=group_pks[start:start + MEMBERSHIP_CHUNK_SIZE])
+        for group_pk, place_pk in memberships.order_by('group_id', 'place_id').values_list('group_id', 'place_id'):
+            places[group_pk].append(place_pk)
+    return groups
+
+
+def rows_response(request, rows, transform=list):
+    """
+    Respond with rows selected by place_rows or group_rows, cursor paginated
+    unless client asked for whole list. `transform` turns rows into final data.
+    """
+    if is_unpaginated(request):
+        with timed('serialize'):
+            return Response(transform(rows))
+    paginator = PkCursorPagination()
+    page = paginator.paginate_queryset(rows, request)
+    with timed('serialize'):
+        data = transform(page)
+    return paginator.get_paginated_response(data)
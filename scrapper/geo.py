@@ -0,0 +1,167 @@
+from django.db.models import Q
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Precision of geohash stored with every place, 9 characters is about 5 meters
+GEOHASH_PRECISION = 9
+
+# Maximum number of geohash cells used to cover queried bounding box
+MAX_COVER_CELLS = 32
+
+# Query parameter with bounding box in `minLon,minLat,maxLon,maxLat` order
+BBOX_QUERY_PARAM = 'bbox'
+
+
+def _bits(precision):
+    """
+    Get number of latitude and longitude bits in geohash of given precision.
+    """
+    total = 5 * precision
+    return total // 2, (total + 1) // 2
+
+
+def _cell_index(value, low, high, bits):
+    """
+    Get index of cell containing value when [low, high] is split into 2^bits cells.
+    """
+    cells = 1 << bits
+    index = int((value - low) / (high - low) * cells)
+    return min(max(index, 0), cells - 1)
+
+
+def _interleave(lat_index, lon_index, precision):
+    """
+    Merge cell indices into single Z-order code, longitude bit goes first.
+    """
+    lat_bits, lon_bits = _bits(precision)
+    code = 0
+    for bit in range(5 * precision):
+        if bit % 2 == 0:
+            lon_bits -= 1
+            code = (code << 1) | ((lon_index >> lon_bits) & 1)
+        else:
+            lat_bits -= 1
+            code = (code << 1) | ((lat_index >> lat_bits) & 1)
+    return code
+
+
+def _code_to_geohash(code, precision):
+    chars = []
+    for _ in range(precision):
+        chars.append(GEOHASH_ALPHABET[code & 31])
+        code >>= 5
+    return ''.join(reversed(chars))
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """
+    Encode coordinates as geohash string.
+    """
+    lat_bits, lon_bits = _bits(precision)
+    lat_index = _cell_index(latitude, -90.0, 90.0, lat_bits)
+    lon_index = _cell_index(longitude, -180.0, 180.0, lon_bits)
+    return _code_to_geohash(_interleave(lat_index, lon_index, precision), precision)
+
+
+def parse_bbox(value):
+    """
+    Parse `minLon,minLat,maxLon,maxLat` string into tuple of floats.
+
+    `minLon` greater than `maxLon` means box crossing the antimeridian.
+    Raises ValueError on malformed box.
+    """
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(v) for v in value.split(','))
+    except ValueError:
+        raise ValueError('Bounding box must be given as minLon,minLat,maxLon,maxLat.')
+    if not (-180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+        raise ValueError('Longitude must be in [-180, 180] range.')
+    if not (-90 <= min_lat <= max_lat <= 90):
+        raise ValueError('Latitude must be in [-90, 90] range and minLat must not exceed maxLat.')
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def split_bbox(bbox):
+    """
+    Split box crossing the antimeridian into two boxes which do not.
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    if min_lon <= max_lon:
+        return [bbox]
+    return [(min_lon, min_lat, 180.0, max_lat), (-180.0, min_lat, max_lon, max_lat)]
+
+
+def geohash_cover(bbox):
+    """
+    Get geohash ranges covering box which does not cross the antimeridian.
+
+    Precision is the highest one at which box is covered by no more than
+    MAX_COVER_CELLS cells. Cells adjacent in Z-order are merged into single
+    range. Returns list of (low, high) geohash bounds, high is exclusive
+    and None if range reaches the end of geohash space.
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    precision = 1
+    while precision < GEOHASH_PRECISION:
+        lat_bits, lon_bits = _bits(precision + 1)
+        rows = _cell_index(max_lat, -90.0, 90.0, lat_bits) - _cell_index(min_lat, -90.0, 90.0, lat_bits) + 1
+        cols = _cell_index(max_lon, -180.0, 180.0, lon_bits) - _cell_index(min_lon, -180.0, 180.0, lon_bits) + 1
+        if rows * cols > MAX_COVER_CELLS:
+            break
+        precision += 1
+
+    lat_bits, lon_bits = _bits(precision)
+    codes = sorted(
+        _interleave(lat_index, lon_index, precision)
+        for lat_index in range(_cell_index(min_lat, -90.0, 90.0, lat_bits),
+                               _cell_index(max_lat, -90.0, 90.0, lat_bits) + 1)
+        for lon_index in range(_cell_index(min_lon, -180.0, 180.0, lon_bits),
+                               _cell_index(max_lon, -180.0, 180.0, lon_bits) + 1)
+    )
+
+    ranges = []
+    start = end = codes[0]
+    for code in codes[1:] + [None]:
+        if code is not None and code == end + 1:
+            end = code
+            continue
+        high = end + 1
+        ranges.append((
+            _code_to_geohash(start, precision),
+            _code_to_geohash(high, precision) if high < (1 << 5 * precision) else None,
+        ))
+        if code is not None:
+            start = end = code
+    return ranges
+
+
+def bbox_q(bbox):
+    """
+    Build filter selecting places inside bounding box.
+
+    Geohash ranges let database prune rows with index on geohash column,
+    exact coordinates comparison removes places from cells' margins.
+    """
+    query = Q()
+    for box in split_bbox(bbox):
+        min_lon, min_lat, max_lon, max_lat = box
+        cells = Q()
+        for low, high in geohash_cover(box):
+            cell = Q(geohash__gte=low)
+            if high is not None:
+                cell &= Q(geohash__lt=high)
+            cells |= cell
+        query |= cells & Q(latitude__gte=min_lat, latitude__lte=max_lat,
+                           longitude__gte=min_lon, longitude__lte=max_lon)
+    return query
+
+
+def filter_bbox(request, queryset):
+    """
+    Narrow places queryset to bounding box given in request, if any.
+    Raises ValueError on malformed box.
+    """
+    value = request.query_params.get(BBOX_QUERY_PARAM)
+    if value is None:
+        return queryset
+    return queryset.filter(bbox_q(parse_bbox(value)))
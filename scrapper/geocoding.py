@@ -0,0 +1,221 @@
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from scrapper.caching import bump_version_on_commit
+from scrapper.changes import record
+from scrapper.models import Change, Place
+from scrapper.search import search_index
+from scrapper.spatial import KDTree, chord_to_km, to_unit_vectors
+from scrapper.streaming import iterate_in_chunks
+
+# Gazetteer in GeoNames format (like cities500.txt), reverse geocoding is off without it
+GAZETTEER_PATH = getattr(settings, 'SCRAPPER_GAZETTEER_PATH', None)
+
+# Optional GeoNames countryInfo.txt, used to store country names instead of ISO codes
+GAZETTEER_COUNTRIES_PATH = getattr(settings, 'SCRAPPER_GAZETTEER_COUNTRIES_PATH', None)
+
+# Places further than this from every city in gazetteer are left as they are
+GEOCODE_MAX_DISTANCE_KM = getattr(settings, 'SCRAPPER_GEOCODE_MAX_DISTANCE_KM', 50)
+
+# If city and country of saved places are filled in when left blank
+GEOCODE_ON_SAVE = getattr(settings, 'SCRAPPER_GEOCODE_ON_SAVE', True)
+
+# Number of decimal places of coordinates sharing memoized result, 2 places is about one kilometer
+GEOCODE_CELL_PRECISION = getattr(settings, 'SCRAPPER_GEOCODE_CELL_PRECISION', 2)
+
+# Number of memoized cells, memo is cleared when it grows bigger
+GEOCODE_CACHE_SIZE = getattr(settings, 'SCRAPPER_GEOCODE_CACHE_SIZE', 100000)
+
+# Number of places filled in per transaction by geocode_places
+GEOCODE_CHUNK_SIZE = getattr(settings, 'SCRAPPER_GEOCODE_CHUNK_SIZE', 1000)
+
+# Columns of GeoNames geoname table
+_NAME, _LATITUDE, _LONGITUDE, _COUNTRY_CODE = 1, 4, 5, 8
+
+
+def read_gazetteer(path):
+    """
+    Read names, coordinates and country codes of cities from GeoNames TSV file.
+    Malformed lines are skipped.
+    """
+    names, latitudes, longitudes, country_codes = [], [], [], []
+    with open(path, encoding='utf-8') as gazetteer:
+        for line in gazetteer:
+            if line.startswith('#'):
+                continue
+            columns = line.rstrip('\r\n').split('\t')
+            if len(columns) <= _COUNTRY_CODE:
+                continue
+            try:
+                latitude, longitude = float(columns[_LATITUDE]), float(columns[_LONGITUDE])
+            except ValueError:
+                continue
+            names.append(columns[_NAME])
+            latitudes.append(latitude)
+            longitudes.append(longitude)
+            country_codes.append(columns[_COUNTRY_CODE])
+    return names, latitudes, longitudes, country_codes
+
+
+def read_country_names(path):
+    """
+    Read mapping of ISO codes to country names from GeoNames countryInfo.txt.
+    """
+    countries = {}
+    with open(path, encoding='utf-8') as country_info:
+        for line in country_info:
+            if line.startswith('#'):
+                continue
+            columns = line.rstrip('\r\n').split('\t')
+            if len(columns) > 4 and columns[0]:
+                countries[columns[0]] = columns[4]
+    return countries
+
+
+class ReverseGeocoder(object):
+    """
+    Find name and country of city nearest to given coordinates.
+
+    Cities are kept in KD-tree loaded from gazetteer on first lookup, with
+    names and countries indexed by tree ids. Nearest cities are memoized by
+    coordinates rounded to cells of `cell_precision` decimal places, the
+    distance is measured from the given point.
+    """
+
+    def __init__(self, path=None, countries_path=None, max_distance_km=None, cell_precision=None,
+                 cache_size=None):
+        self.path = path
+        self.countries_path = countries_path
+        self.max_distance_km = GEOCODE_MAX_DISTANCE_KM if max_distance_km is None else max_distance_km
+        self.cell_precision = GEOCODE_CELL_PRECISION if cell_precision is None else cell_precision
+        self.cache_size = cache_size or GEOCODE_CACHE_SIZE
+        self._lock = threading.Lock()
+        self._tree = None
+        self._names = None
+        self._countries = None
+        self._country_of = None
+        self._vectors = None
+        self._memo = {}
+
+    @property
+    def is_available(self):
+        return bool(self.path)
+
+    def load(self):
+        """
+        Read gazetteer and build the tree, unless it was done already.
+        """
+        with self._lock:
+            if self._tree is not None:
+                return
+            names, latitudes, longitudes, country_codes = read_gazetteer(self.path)
+            country_names = read_country_names(self.countries_path) if self.countries_path else {}
+            codes, country_of = np.unique(np.array(country_codes, dtype=str), return_inverse=True)
+            self._names = names
+            self._countries = [country_names.get(code, code) for code in codes.tolist()]
+            self._country_of = country_of.astype(np.int32)
+            self._memo = {}
+            self._vectors = to_unit_vectors(latitudes, longitudes)
+            self._tree = KDTree(np.arange(len(names)), self._vectors)
+
+    def _lookup(self, latitude, longitude):
+        """
+        Get id of city nearest to given point, None if there is no city close enough.
+        """
+        distances, ids = self._tree.nearest(to_unit_vectors(latitude, longitude), 1)
+        if not len(ids) or chord_to_km(distances[0]) > self.max_distance_km:
+            return None
+        return int(ids[0])
+
+    def lookup(self, latitude, longitude):
+        """
+        Get (city, country, distance in km) of city nearest to given point,
+        or None if there is no city close enough.
+        """
+        if self._tree is None:
+            self.load()
+        cell = (round(float(latitude), self.cell_precision), round(float(longitude), self.cell_precision))
+        try:
+            city = self._memo[cell]
+        except KeyError:
+            city = self._lookup(*cell)
+            if len(self._memo) >= self.cache_size:
+                self._memo = {}
+            self._memo[cell] = city
+        if city is None:
+            return None
+        offset = to_unit_vectors(latitude, longitude) - self._vectors[city]
+        distance = float(chord_to_km(np.dot(offset, offset)))
+        return self._names[city], self._countries[self._country_of[city]], distance
+
+
+def fill_place_data(data, geocoder=None):
+    """
+    Fill blank `city` and `country` of place data dict from its coordinates.
+    Returns if anything was filled in.
+    """
+    geocoder = geocoder or reverse_geocoder
+    if not geocoder.is_available or (data.get('city') and data.get('country')):
+        return False
+    found = geocoder.lookup(data['latitude'], data['longitude'])
+    if found is None:
+        return False
+    filled = False
+    for name, value in zip(('city', 'country'), found):
+        if not data.get(name):
+            data[name] = value[:Place._meta.get_field(name).max_length]
+            filled = True
+    return filled
+
+
+def fill_place(place, geocoder=None):
+    """
+    Fill blank `city` and `country` of place from its coordinates.
+    Returns if anything was filled in, derived fields are then recomputed.
+    """
+    data = {'city': place.city, 'country': place.country,
+            'latitude': place.latitude, 'longitude': place.longitude}
+    if not fill_place_data(data, geocoder):
+        return False
+    place.city = data['city']
+    place.country = data['country']
+    place.update_derived_fields()
+    return True
+
+
+def geocode_places(chunk_size=None, geocoder=None):
+    """
+    Fill blank city and country of all saved places, chunk by chunk.
+    Returns tuple of numbers of checked and filled in places.
+    """
+    geocoder = geocoder or reverse_geocoder
+    chunk_size = chunk_size or GEOCODE_CHUNK_SIZE
+    blank = Place.objects.filter(Q(city='') | Q(country=''))
+    checked = filled = 0
+    fields = ('pk', 'city', 'country', 'latitude', 'longitude')
+    for rows in iterate_in_chunks(blank, fields, chunk_size):
+        now = timezone.now()
+        places = []
+        for pk, city, country, latitude, longitude in rows:
+            place = Place(pk=pk, city=city, country=country, latitude=latitude, longitude=longitude)
+            if fill_place(place, geocoder):
+                place.updated_at = now
+                places.append(place)
+        with transaction.atomic():
+            Place.objects.bulk_update(places, ['city', 'country', 'dedup_key', 'city_key', 'country_key', 'updated_at'])
+            record(Change.PLACE, Change.UPSERT, [place.pk for place in places])
+            if places:
+                bump_version_on_commit('place')
+                transaction.on_commit(search_index.mark_stale)
+        checked += len(rows)
+        filled += len(places)
+    return checked, filled
+
+
+# Process wide geocoder using gazetteer from settings
+reverse_geocoder = ReverseGeocoder(GAZETTEER_PATH, GAZETTEER_COUNTRIES_PATH)
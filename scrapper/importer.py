@@ -0,0 +1,258 @@
+import csv
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from scrapper.bulk import BULK_BATCH_SIZE, upsert_places, validate_place_data
+from scrapper.membership import add_places
+from scrapper.models import Group, ImportCheckpoint
+from scrapper.serializers import GroupSerializer
+
+FORMATS = ('ndjson', 'csv')
+
+# Seconds between progress reports
+PROGRESS_INTERVAL = 5
+
+
+class RecordError(Exception):
+    pass
+
+
+def read_lines(stream, offset=0):
+    """
+    Yield decoded lines of binary stream together with offset of their end.
+    """
+    stream.seek(offset)
+    for line in stream:
+        offset += len(line)
+        yield offset, line.decode('utf-8')
+
+
+def read_ndjson(lines):
+    """
+    Yield (offset, record) pairs from NDJSON lines, skipping empty ones.
+    """
+    for offset, line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield offset, json.loads(line)
+        except ValueError as exc:
+            yield offset, RecordError('Invalid JSON - %s' % exc)
+
+
+def read_csv(lines, header):
+    """
+    Yield (offset, record) pairs from CSV lines, using given header row.
+    """
+    position = {'offset': None}
+
+    def track(lines):
+        for offset, line in lines:
+            position['offset'] = offset
+            yield line
+
+    for row in csv.reader(track(lines)):
+        if not row:
+            continue
+        if len(row) != len(header):
+            yield position['offset'], RecordError('Expected %d columns, got %d' % (len(header), len(row)))
+            continue
+        yield position['offset'], dict(zip(header, row))
+
+
+def read_records(stream, fmt, offset=0):
+    """
+    Yield (offset, record) pairs from NDJSON or CSV file opened in binary mode.
+    Offset is position in file right after the record, usable for resuming.
+    """
+    if fmt == 'ndjson':
+        return read_ndjson(read_lines(stream, offset))
+
+    stream.seek(0)
+    header_line = stream.readline()
+    header = next(csv.reader([header_line.decode('utf-8')]))
+    return read_csv(read_lines(stream, max(offset, len(header_line))), header)
+
+
+def batched(records, size):
+    """
+    Group records into lists of given size, the last one may be shorter.
+    """
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Checkpoint(object):
+    """
+    Progress of import, saved in the same transaction as every batch, so
+    committed records and checkpoint can not get out of sync.
+    """
+
+    def __init__(self, name, source):
+        self.name = name
+        self.source = os.path.abspath(source)
+        self.offset = 0
+        self.rows = 0
+        self.errors = 0
+
+    def load(self):
+        state = ImportCheckpoint.objects.filter(name=self.name).first()
+        if state is None:
+            return False
+        if state.source != self.source:
+            raise CommandError('Checkpoint %s belongs to other file: %s' % (self.name, state.source))
+        self.offset, self.rows, self.errors = state.offset, state.rows, state.errors
+        return True
+
+    def save(self):
+        ImportCheckpoint.objects.update_or_create(name=self.name, defaults={
+            'source': self.source,
+            'offset': self.offset,
+            'rows': self.rows,
+            'errors': self.errors,
+        })
+
+    def remove(self):
+        ImportCheckpoint.objects.filter(name=self.name).delete()
+
+
+class BaseImportCommand(BaseCommand):
+    """
+    Import records from NDJSON or CSV file in transactional batches.
+
+    Subclasses implement `clean`, validating single record, and `write`,
+    saving list of cleaned records. Progress is checkpointed in transaction
+    of every batch, so interrupted import continues where it stopped.
+    """
+    record_name = 'rows'
+    default_batch_size = BULK_BATCH_SIZE
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File with one record per line.')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='Input format, guessed from file extension by default.')
+        parser.add_argument('--batch-size', type=int, default=self.default_batch_size,
+                            help='Number of records written in single transaction.')
+        parser.add_argument('--checkpoint',
+                            help='Checkpoint name, defaults to absolute input path.')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore existing checkpoint and import from the beginning.')
+        parser.add_argument('--max-reported-errors', type=int, default=20,
+                            help='Number of invalid records printed out.')
+
+    def clean(self, record):
+        """
+        Return cleaned record or raise RecordError.
+        """
+        raise NotImplementedError
+
+    def write(self, cleaned_records):
+        """
+        Save cleaned records, called inside transaction.
+        """
+        raise NotImplementedError
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+        checkpoint = Checkpoint(options['checkpoint'] or os.path.abspath(path), path)
+        if options['restart']:
+            checkpoint.remove()
+        elif checkpoint.load():
+            self.stdout.write('Resuming from byte %d after %d %s.' % (
+                checkpoint.offset, checkpoint.rows, self.record_name))
+
+        self.max_reported_errors = options['max_reported_errors']
+        self.reported_errors = 0
+        started = last_report = time.monotonic()
+        imported = 0
+
+        with open(path, 'rb') as stream:
+            records = read_records(stream, fmt, checkpoint.offset)
+            for batch in batched(records, options['batch_size']):
+                cleaned = []
+                for offset, record in batch:
+                    try:
+                        if isinstance(record, RecordError):
+                            raise record
+                        cleaned.append(self.clean(record))
+                    except RecordError as exc:
+                        checkpoint.errors += 1
+                        self.report_error(offset, exc)
+
+                with transaction.atomic():
+                    self.write(cleaned)
+                    checkpoint.rows += len(cleaned)
+                    checkpoint.offset = batch[-1][0]
+                    checkpoint.save()
+                imported += len(cleaned)
+
+                now = time.monotonic()
+                if now - last_report >= PROGRESS_INTERVAL:
+                    last_report = now
+                    self.stdout.write('%d %s imported, %.0f %s/sec' % (
+                        checkpoint.rows, self.record_name, imported / (now - started), self.record_name))
+
+        checkpoint.remove()
+        elapsed = max(time.monotonic() - started, 1e-9)
+        self.stdout.write(self.style.SUCCESS('Imported %d %s, %d invalid, %.0f %s/sec.' % (
+            checkpoint.rows, self.record_name, checkpoint.errors, imported / elapsed, self.record_name)))
+
+    def report_error(self, offset, error):
+        if self.reported_errors < self.max_reported_errors:
+            self.stderr.write('Invalid record ending at byte %d: %s' % (offset, error))
+        self.reported_errors += 1
+
+
+class ImportPlacesCommand(BaseImportCommand):
+    help = 'Import places from NDJSON or CSV file with city, country, latitude and longitude.'
+    record_name = 'places'
+
+    def clean(self, record):
+        cleaned, errors = validate_place_data(record)
+        if errors:
+            raise RecordError(errors)
+        return cleaned
+
+    def write(self, cleaned_records):
+        upsert_places(cleaned_records)
+
+
+class ImportGroupsCommand(BaseImportCommand):
+    help = ('Import groups from NDJSON or CSV file with name and places, which are ids of '
+            'existing places, given as list in NDJSON or space separated in CSV.')
+    record_name = 'groups'
+    default_batch_size = 100
+
+    def clean(self, record):
+        if not isinstance(record, dict):
+            raise RecordError('Expected an object.')
+        try:
+            name = GroupSerializer().fields['name'].run_validation(record.get('name'))
+        except ValidationError as exc:
+            raise RecordError({'name': exc.detail})
+
+        places = record.get('places') or []
+        if isinstance(places, str):
+            places = places.split()
+        try:
+            places = [int(place) for place in places]
+        except (TypeError, ValueError):
+            raise RecordError({'places': ['Expected a list of place ids.']})
+        return name, places
+
+    def write(self, cleaned_records):
+        for name, places in cleaned_records:
+            group = Group.objects.create(name=name)
+            add_places(group, places)
@@ -0,0 +1,312 @@
+import json
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from scrapper.models import Group, Job
+
+logger = logging.getLogger(__name__)
+
+# Seconds for which claimed job is reserved, workers extend it while running the job
+JOB_LEASE_SECONDS = getattr(settings, 'SCRAPPER_JOB_LEASE_SECONDS', 60)
+
+# Attempts after which failing job is dead-lettered
+JOB_MAX_ATTEMPTS = getattr(settings, 'SCRAPPER_JOB_MAX_ATTEMPTS', 5)
+
+# Seconds before failed job is retried, doubled with every next attempt
+JOB_RETRY_BACKOFF = getattr(settings, 'SCRAPPER_JOB_RETRY_BACKOFF', 30)
+
+# Seconds idle worker waits before looking for new jobs
+JOB_POLL_INTERVAL = getattr(settings, 'SCRAPPER_JOB_POLL_INTERVAL', 1)
+
+# Times claiming is retried when other workers take the same jobs first
+_CLAIM_ATTEMPTS = 5
+
+# Times write is retried when database is locked by other process, as SQLite can be
+_LOCKED_ATTEMPTS = 10
+
+
+def run_scrape_job(payload):
+    """
+    Scrape sources given in `urls`, other payload items are options of Scraper.
+    Fails when any page could not be fetched, so job is retried. Places of
+    pages fetched before are upserted, so scraping them again is harmless.
+    """
+    from scrapper.scraper import FetchError, Scraper
+
+    options = dict(payload)
+    urls = options.pop('urls')
+    group_pk = options.pop('group', None)
+    group = Group.objects.active().filter(pk=group_pk).first() if group_pk else None
+    stats = Scraper(urls, group=group, **options).run()
+    if stats.failed_pages:
+        raise FetchError('%d of %d pages failed' % (stats.failed_pages, stats.pages + stats.failed_pages))
+
+
+def run_sleep_job(payload):
+    """
+    Only wait, standing in for I/O bound work in benchmarks.
+    """
+    time.sleep(payload.get('seconds', 0))
+
+
+# Functions running jobs of each kind, taking decoded payload
+JOB_HANDLERS = {
+    'scrape': run_scrape_job,
+    'sleep': run_sleep_job,
+}
+
+
+def enqueue(kind, payload=None, priority=0, max_attempts=None, run_after=None):
+    """
+    Add job to queue.
+    """
+    return Job.objects.create(
+        kind=kind,
+        payload=json.dumps(payload or {}),
+        priority=priority,
+        max_attempts=max_attempts or JOB_MAX_ATTEMPTS,
+        run_after=run_after or timezone.now(),
+    )
+
+
+def enqueue_scrape(urls, group=None, priority=0, **options):
+    """
+    Add scrape job for every source URL, so they are spread among workers.
+    """
+    jobs = [
+        Job(kind='scrape', priority=priority, max_attempts=JOB_MAX_ATTEMPTS,
+            payload=json.dumps(dict(options, urls=[url], group=group.pk if group else None)))
+        for url in urls
+    ]
+    return Job.objects.bulk_create(jobs)
+
+
+def _abandoned(now):
+    # Running jobs whose lease expired were abandoned by crashed workers
+    return Q(status=Job.RUNNING, lease_expires__lt=now)
+
+
+def _claimable(now):
+    return (Q(status=Job.QUEUED, run_after__lte=now) |
+            _abandoned(now) & Q(attempts__lt=F('max_attempts')))
+
+
+def dead_letter_abandoned(now=None, kinds=None):
+    """
+    Dead-letter jobs abandoned by crashed workers on their last attempt,
+    as jobs crashing workers would be retried forever otherwise.
+    Returns number of dead-lettered jobs.
+    """
+    jobs = Job.objects.filter(_abandoned(now or timezone.now()), attempts__gte=F('max_attempts'))
+    if kinds:
+        jobs = jobs.filter(kind__in=kinds)
+    return jobs.update(status=Job.DEAD, lease_token='', lease_expires=None,
+                       last_error='Lease expired on the last attempt, worker was lost.')
+
+
+def _with_locked_retries(function, *args):
+    for attempt in range(_LOCKED_ATTEMPTS):
+        try:
+            return function(*args)
+        except OperationalError as exc:
+            if 'locked' not in str(exc) or attempt == _LOCKED_ATTEMPTS - 1:
+                raise
+            time.sleep(0.01 * 2 ** attempt)
+
+
+def claim(worker_id, kinds=None, limit=1, lease=None):
+    """
+    Lease up to `limit` claimable jobs of given kinds, highest priority first.
+
+    Where database supports it, jobs are locked with `SELECT ... FOR UPDATE
+    SKIP LOCKED`, so concurrent workers pass each other without waiting.
+    Elsewhere, like on SQLite, they are taken by single `UPDATE ... WHERE id
+    IN (SELECT ... LIMIT n)` statement, which is atomic there. Databases
+    supporting neither get candidates taken by conditional UPDATE, and jobs
+    won by other workers are replaced by next ones.
+
+    Abandoned jobs which used up their attempts are dead-lettered first.
+    """
+    lease = lease or JOB_LEASE_SECONDS
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    dead_letter_abandoned(now, kinds)
+    jobs = Job.objects.filter(_claimable(now))
+    if kinds:
+        jobs = jobs.filter(kind__in=kinds)
+    jobs = jobs.order_by('-priority', 'pk')
+    changes = dict(
+        status=Job.RUNNING,
+        attempts=F('attempts') + 1,
+        lease_owner=worker_id[:100],
+        lease_token=token,
+        lease_expires=now + timedelta(seconds=lease),
+    )
+
+    features = connection.features
+    if features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            pks = list(jobs.select_for_update(skip_locked=True).values_list('pk', flat=True)[:limit])
+            Job.objects.filter(pk__in=pks).update(**changes)
+    elif features.allow_sliced_subqueries_with_in:
+        Job.objects.filter(pk__in=jobs.values('pk')[:limit]).update(**changes)
+    else:
+        claimed = 0
+        for _ in range(_CLAIM_ATTEMPTS):
+            pks = list(jobs.values_list('pk', flat=True)[:limit - claimed])
+            if not pks:
+                break
+            # Condition is checked again by UPDATE itself, so only one worker takes every job
+            claimed += Job.objects.filter(_claimable(now), pk__in=pks).update(**changes)
+            if claimed >= limit:
+                break
+    return list(Job.objects.filter(lease_token=token).order_by('-priority', 'pk'))
+
+
+def heartbeat(token, lease=None):
+    """
+    Extend lease of running jobs claimed together. Returns number of jobs still held.
+    """
+    lease = lease or JOB_LEASE_SECONDS
+    expires = timezone.now() + timedelta(seconds=lease)
+    return Job.objects.filter(lease_token=token, status=Job.RUNNING).update(lease_expires=expires)
+
+
+def complete(job):
+    """
+    Mark job done, unless its lease was lost. Returns if job was still held.
+    """
+    return bool(Job.objects.filter(pk=job.pk, lease_token=job.lease_token, status=Job.RUNNING).update(
+        status=Job.DONE, lease_expires=None, last_error=''))
+
+
+def fail(job, error):
+    """
+    Schedule failed job for retry with exponential backoff, or dead-letter it
+    after it used up its attempts. Returns if job was still held.
+    """
+    changes = dict(lease_token='', lease_expires=None, last_error=error)
+    if job.attempts >= job.max_attempts:
+        changes['status'] = Job.DEAD
+    else:
+        changes['status'] = Job.QUEUED
+        changes['run_after'] = timezone.now() + timedelta(seconds=JOB_RETRY_BACKOFF * 2 ** (job.attempts - 1))
+    return bool(Job.objects.filter(pk=job.pk, lease_token=job.lease_token, status=Job.RUNNING).update(**changes))
+
+
+def requeue_dead(kinds=None):
+    """
+    Give dead-lettered jobs new set of attempts. Returns number of requeued jobs.
+    """
+    jobs = Job.objects.filter(status=Job.DEAD)
+    if kinds:
+        jobs = jobs.filter(kind__in=kinds)
+    return jobs.update(status=Job.QUEUED, attempts=0, run_after=timezone.now())
+
+
+class _Heartbeat(threading.Thread):
+    def __init__(self, token, lease):
+        super().__init__(daemon=True)
+        self.token = token
+        self.lease = lease
+        self.finished = threading.Event()
+
+    def run(self):
+        try:
+            while not self.finished.wait(self.lease / 3):
+                if not _with_locked_retries(heartbeat, self.token, self.lease):
+                    logger.warning('Lease %s was lost', self.token)
+                    return
+        except Exception:
+            logger.exception('Extending lease %s failed', self.token)
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.finished.set()
+        self.join()
+
+
+class Worker(object):
+    """
+    Claim and run jobs until stopped, keeping their leases alive meanwhile.
+    """
+
+    def __init__(self, kinds=None, batch_size=1, lease=None, poll_interval=None, worker_id=None):
+        self.kinds = kinds
+        self.batch_size = batch_size
+        self.lease = lease or JOB_LEASE_SECONDS
+        self.poll_interval = JOB_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.worker_id = worker_id or '%s:%d' % (socket.gethostname(), os.getpid())
+        self.stopped = False
+        self.processed = 0
+
+    def stop(self, *args):
+        self.stopped = True
+
+    def run(self, max_jobs=None, exit_when_empty=False):
+        """
+        Process jobs, optionally stopping after `max_jobs` or once no job is claimable.
+        Returns number of processed jobs.
+        """
+        while not self.stopped and (max_jobs is None or self.processed < max_jobs):
+            limit = self.batch_size if max_jobs is None else min(self.batch_size, max_jobs - self.processed)
+            try:
+                jobs = _with_locked_retries(claim, self.worker_id, self.kinds, limit, self.lease)
+            except OperationalError:
+                logger.exception('Claiming jobs failed')
+                jobs = []
+            if not jobs:
+                if exit_when_empty:
+                    break
+                time.sleep(self.poll_interval)
+                continue
+            self.process(jobs)
+        return self.processed
+
+    def process(self, jobs):
+        beat = _Heartbeat(jobs[0].lease_token, self.lease)
+        beat.start()
+        try:
+            for job in jobs:
+                handler = JOB_HANDLERS.get(job.kind)
+                try:
+                    if handler is None:
+                        raise LookupError('No handler of %r jobs' % job.kind)
+                    handler(json.loads(job.payload))
+                except Exception:
+                    logger.warning('Job %s failed on attempt %d', job.pk, job.attempts, exc_info=True)
+                    held = _with_locked_retries(fail, job, traceback.format_exc())
+                else:
+                    held = _with_locked_retries(complete, job)
+                if not held:
+                    logger.warning('Job %s finished after its lease was lost', job.pk)
+                self.processed += 1
+        finally:
+            beat.stop()
+
+
+def run_worker_process(options):
+    """
+    Entry point of forked worker process, stopping gracefully on SIGTERM and SIGINT.
+    """
+    worker = Worker(kinds=options.get('kinds'), batch_size=options.get('batch_size') or 1,
+                    lease=options.get('lease'), poll_interval=options.get('poll_interval'))
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    try:
+        worker.run(max_jobs=options.get('max_jobs'), exit_when_empty=options.get('exit_when_empty', False))
+    finally:
+        connections.close_all()
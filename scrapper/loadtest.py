@@ -0,0 +1,395 @@
+import json
+import random
+import threading
+from collections import OrderedDict
+from time import perf_counter
+
+import numpy as np
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.urls import reverse
+
+from scrapper.caching import bump_version
+from scrapper.changes import CHANGES_MAX_PAGE_SIZE, latest_token, sequence_changes
+from scrapper.membership import Membership
+from scrapper.models import Change, Group, Place
+from scrapper.stats import recompute_group_stats
+
+# Rows inserted by single bulk insert while seeding, lowered to fit in backend's limits
+SEED_CHUNK_SIZE = 5000
+
+_SYLLABLES = ('ba', 'ber', 'bor', 'ca', 'dan', 'del', 'fa', 'gar', 'ha', 'ka', 'kra', 'la', 'lin', 'ma',
+              'mon', 'na', 'nor', 'pa', 'po', 'ra', 'ren', 'sa', 'sta', 'ta', 'ter', 'va', 'vel', 'wa', 'zen')
+
+
+def _name(rng, syllables):
+    return ''.join(rng.choice(_SYLLABLES) for _ in range(syllables)).title()
+
+
+def _zipf_weights(count, skew):
+    weights = 1.0 / np.arange(1, count + 1) ** skew
+    return weights / weights.sum()
+
+
+def seed_data(places=1000000, groups=100000, memberships=2000000, cities=5000, countries=60, skew=1.1,
+              seed=0, progress=None):
+    """
+    Fill empty database with reproducible synthetic places and groups.
+
+    Places cluster around cities whose popularity follows Zipf's law with
+    given skew, one in ten has no city. Group sizes follow the same law, so
+    few groups have most of the memberships. Every place gets its change log
+    entry. `progress` is called with description of every finished step.
+    Returns dict of numbers of created objects.
+    """
+    if Place.objects.exists() or Group.objects.exists():
+        raise ValueError('Database already has places or groups, seed a fresh database.')
+    progress = progress or (lambda message: None)
+    rng = np.random.default_rng(seed)
+    names = random.Random(seed)
+
+    country_names = sorted(set(_name(names, 3) for _ in range(countries)))
+    city_names = [_name(names, names.randint(2, 4)) for _ in range(cities)]
+    city_countries = rng.integers(0, len(country_names), cities)
+    city_latitudes = rng.uniform(-55, 70, cities)
+    city_longitudes = rng.uniform(-180, 180, cities)
+    city_weights = _zipf_weights(cities, skew)
+
+    for start in range(0, places, SEED_CHUNK_SIZE):
+        size = min(SEED_CHUNK_SIZE, places - start)
+        picked = rng.choice(cities, size, p=city_weights)
+        latitudes = np.clip(city_latitudes[picked] + rng.normal(0, 0.05, size), -90, 90)
+        longitudes = np.clip(city_longitudes[picked] + rng.normal(0, 0.05, size), -180, 180)
+        blank = rng.random(size) < 0.1
+        chunk = []
+        for city, latitude, longitude, no_city in zip(picked.tolist(), latitudes.tolist(), longitudes.tolist(),
+                                                      blank.tolist()):
+            place = Place(city='' if no_city else city_names[city], country=country_names[city_countries[city]],
+                          latitude=round(latitude, 6), longitude=round(longitude, 6))
+            place.update_derived_fields()
+            chunk.append(place)
+        with transaction.atomic():
+            Place.objects.bulk_create(chunk, batch_size=500)
+        progress('Created %d of %d places' % (start + size, places))
+
+    # Not every backend sets primary keys of bulk created rows
+    place_pks = np.array(Place.objects.order_by('pk').values_list('pk', flat=True), dtype=np.int64)
+    for start in range(0, len(place_pks), SEED_CHUNK_SIZE):
+        with transaction.atomic():
+            Change.objects.bulk_create([
+                Change(kind=Change.PLACE, action=Change.UPSERT, object_id=pk)
+                for pk in place_pks[start:start + SEED_CHUNK_SIZE].tolist()
+            ], batch_size=500)
+    progress('Logged changes of %d places' % len(place_pks))
+
+    for start in range(0, groups, SEED_CHUNK_SIZE):
+        with transaction.atomic():
+            Group.objects.bulk_create([
+                Group(name='Group %d' % number) for number in range(start, min(start + SEED_CHUNK_SIZE, groups))
+            ], batch_size=500)
+    group_pks = list(Group.objects.order_by('pk').values_list('pk', flat=True))
+    progress('Created %d groups' % len(group_pks))
+
+    sizes = np.maximum(1, np.round(memberships * _zipf_weights(len(group_pks), skew))).astype(np.int64)
+    sizes = np.minimum(sizes, len(place_pks))
+    rng.shuffle(sizes)
+    created = 0
+    batch = []
+    for group_pk, size in zip(group_pks, sizes.tolist()):
+        members = np.unique(rng.integers(0, len(place_pks), size))
+        batch.extend(Membership(group_id=group_pk, place_id=pk) for pk in place_pks[members].tolist())
+        if len(batch) >= SEED_CHUNK_SIZE:
+            with transaction.atomic():
+                Membership.objects.bulk_create(batch, batch_size=500)
+            created += len(batch)
+            batch = []
+            progress('Created %d memberships' % created)
+    with transaction.atomic():
+        Membership.objects.bulk_create(batch, batch_size=500)
+    created += len(batch)
+    recompute_group_stats()
+    progress('Computed stats of %d groups' % len(group_pks))
+
+    bump_version('place', 'group')
+    return OrderedDict([('places', len(place_pks)), ('groups', len(group_pks)), ('memberships', created)])
+
+
+class BenchmarkContext(object):
+    """
+    Sample of existing places and groups, which scenarios build requests from.
+    """
+
+    def __init__(self, places, groups, prefixes, last_change):
+        self.places = places
+        self.groups = groups
+        self.prefixes = prefixes
+        self.last_change = last_change
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, seed=0, size=500):
+        rng = random.Random(seed)
+        bounds = Place.objects.order_by('pk').values_list('pk', flat=True)
+        first, last = bounds.first(), bounds.last()
+        if first is None:
+            raise ValueError('There are no places, seed the database first.')
+        # Ids are passed as query variables, so size must fit in SQLite's limit of 999
+        candidates = sorted(set(rng.randint(first, last) for _ in range(size)))
+        places = list(Place.objects.filter(pk__in=candidates).order_by('pk')
+                      .values_list('pk', 'latitude', 'longitude', 'city_key'))
+        groups = list(Group.objects.active().order_by('pk').values_list('pk', flat=True)[:size])
+        prefixes = sorted(set(city[:rng.randint(2, 4)] for _, _, _, city in places if len(city) >= 2)) or ['ab']
+        # Number logged changes upfront, so delta sync is measured without catching up
+        while sequence_changes(CHANGES_MAX_PAGE_SIZE):
+            pass
+        return cls(places, groups, prefixes, latest_token())
+
+    def place(self, rng):
+        return rng.choice(self.places)
+
+    def take_place(self, rng):
+        """
+        Remove random place from sample, so scenario deleting it gets every place once.
+        """
+        return self._take(self.places, rng, 'places')
+
+    def group(self, rng):
+        if not self.groups:
+            raise ValueError('There are no groups, seed the database first.')
+        return rng.choice(self.groups)
+
+    def take_group(self, rng):
+        """
+        Remove random group from sample, so scenario deleting it gets every group once.
+        """
+        return self._take(self.groups, rng, 'groups')
+
+    def _take(self, items, rng, name):
+        with self._lock:
+            if not items:
+                raise ValueError('There are no %s left in sample, load bigger one.' % name)
+            return items.pop(rng.randrange(len(items)))
+
+
+class Scenario(object):
+    """
+    Requests to single route, built by `build(rng, context)` returning method, path and body.
+    """
+
+    def __init__(self, name, build, statuses=(200,), writes=False):
+        self.name = name
+        self.build = build
+        self.statuses = statuses
+        self.writes = writes
+
+
+def _query(path, **params):
+    return '%s?%s' % (path, '&'.join('%s=%s' % item for item in params.items()))
+
+
+def _bbox(rng, context):
+    _, latitude, longitude, _ = context.place(rng)
+    return '%f,%f,%f,%f' % (longitude - 0.5, latitude - 0.5, longitude + 0.5, latitude + 0.5)
+
+
+def _point(path, rng, context, **params):
+    _, latitude, longitude, _ = context.place(rng)
+    return _query(path, lat=latitude, lon=longitude, **params)
+
+
+def _place_pks(rng, context, count=10):
+    return sorted(set(context.place(rng)[0] for _ in range(count)))
+
+
+def _group_places(method, rng, context):
+    return method, reverse('group-places', kwargs={'pk': context.group(rng)}), {'places': _place_pks(rng, context)}
+
+
+def _random_places(rng, count):
+    return [{'city': 'Bench %d' % rng.randint(0, 999), 'country': 'Benchland',
+             'latitude': rng.uniform(-90, 90), 'longitude': rng.uniform(-180, 180)} for _ in range(count)]
+
+
+SCENARIOS = [
+    Scenario('places-list', lambda rng, context: (
+        'GET', _query(reverse('places-list'), page_size=100), None)),
+    Scenario('places-list-compact', lambda rng, context: (
+        'GET', _query(reverse('places-list'), page_size=1000, fields='id,latitude,longitude', format='compact'),
+        None)),
+    Scenario('places-list-bbox', lambda rng, context: (
+        'GET', _query(reverse('places-list'), bbox=_bbox(rng, context)), None)),
+    Scenario('places-bulk', lambda rng, context: (
+        'POST', reverse('places-bulk'), _random_places(rng, 100)), statuses=(201,), writes=True),
+    Scenario('places-nearby', lambda rng, context: (
+        'GET', _point(reverse('places-nearby'), rng, context, k=10), None)),
+    Scenario('places-search', lambda rng, context: (
+        'GET', _query(reverse('places-search'), q=rng.choice(context.prefixes)), None)),
+    Scenario('places-clusters', lambda rng, context: (
+        'GET', _query(reverse('places-clusters'), z=rng.randint(0, 3)), None)),
+    Scenario('places-clusters-bbox', lambda rng, context: (
+        'GET', _query(reverse('places-clusters'), z=10, bbox=_bbox(rng, context)), None)),
+    Scenario('places-geocode', lambda rng, context: (
+        'GET', _point(reverse('places-geocode'), rng, context), None), statuses=(200, 404, 503)),
+    Scenario('place-detail', lambda rng, context: (
+        'GET', reverse('place-detail', kwargs={'pk': context.place(rng)[0]}), None)),
+    Scenario('place-update', lambda rng, context: (
+        'PUT', reverse('place-detail', kwargs={'pk': context.place(rng)[0]}),
+        dict(_random_places(rng, 1)[0], country='Benchmarked')), writes=True),
+    Scenario('groups-list', lambda rng, context: (
+        'GET', _query(reverse('groups-list'), page_size=100), None)),
+    Scenario('groups-create', lambda rng, context: (
+        'POST', reverse('groups-list'), {'name': 'Bench %d' % rng.randint(0, 999), 'places': _place_pks(rng, context)}),
+        statuses=(201,), writes=True),
+    Scenario('group-detail', lambda rng, context: (
+        'GET', reverse('group-detail', kwargs={'pk': context.group(rng)}), None)),
+    Scenario('group-places', lambda rng, context: (
+        'GET', reverse('group-places', kwargs={'pk': context.group(rng)}), None)),
+    Scenario('group-places-add', lambda rng, context: _group_places('POST', rng, context), writes=True),
+    Scenario('group-places-replace', lambda rng, context: _group_places('PUT', rng, context), writes=True),
+    Scenario('group-places-remove', lambda rng, context: _group_places('DELETE', rng, context), writes=True),
+    Scenario('group-clusters', lambda rng, context: (
+        'GET', _query(reverse('group-clusters', kwargs={'pk': context.group(rng)}), z=2), None)),
+    Scenario('changes', lambda rng, context: (
+        'GET', _query(reverse('changes'), since=rng.randint(0, context.last_change), page_size=500), None)),
+    Scenario('batch', lambda rng, context: (
+        'POST', reverse('batch'), {'atomic': False, 'operations': [
+            {'method': 'GET', 'path': reverse('place-detail', kwargs={'pk': context.place(rng)[0]})}
+            for _ in range(10)
+        ]})),
+    Scenario('metrics', lambda rng, context: ('GET', reverse('metrics'), None), statuses=(200, 404)),
+    # Last, as they remove places and groups which other scenarios pick from sample
+    Scenario('place-delete', lambda rng, context: (
+        'DELETE', reverse('place-detail', kwargs={'pk': context.take_place(rng)[0]}), None),
+        statuses=(204,), writes=True),
+    Scenario('group-delete', lambda rng, context: (
+        'DELETE', reverse('group-detail', kwargs={'pk': context.take_group(rng)}), None),
+        statuses=(204,), writes=True),
+]
+
+
+class _QueryCounter(object):
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _call(handler, environ):
+    """
+    Run WSGI request and read its whole response. Returns status code.
+    """
+    statuses = []
+
+    def start_response(status, headers, exc_info=None):
+        statuses.append(status)
+
+    result = handler(environ, start_response)
+    try:
+        for _ in result:
+            pass
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return int(statuses[0].split(' ', 1)[0])
+
+
+def _percentile(values, percent):
+    return float(np.percentile(values, percent)) * 1000 if values else 0.0
+
+
+def run_scenario(scenario, context, requests=200, concurrency=4, warmup=5, seed=0, host='localhost'):
+    """
+    Send requests of scenario through WSGI handler from `concurrency` threads.
+    Returns dict with number of requests and errors, throughput, latency
+    percentiles in milliseconds and average number of SQL queries.
+    """
+    handler = WSGIHandler()
+    factory = RequestFactory(SERVER_NAME=host, HTTP_HOST=host)
+    lock = threading.Lock()
+    latencies, queries, errors = [], [], []
+
+    def send(rng):
+        method, path, body = scenario.build(rng, context)
+        data = json.dumps(body) if body is not None else ''
+        return factory.generic(method, path, data, content_type='application/json').environ
+
+    def worker(index, count):
+        rng = random.Random('%s:%s:%d' % (seed, scenario.name, index))
+        counter = _QueryCounter()
+        own_latencies, own_queries, own_errors = [], [], []
+        try:
+            with connection.execute_wrapper(counter):
+                for number in range(count):
+                    environ = send(rng)
+                    before = counter.count
+                    started = perf_counter()
+                    status = _call(handler, environ)
+                    elapsed = perf_counter() - started
+                    if status not in scenario.statuses:
+                        own_errors.append(status)
+                    own_latencies.append(elapsed)
+                    own_queries.append(counter.count - before)
+        finally:
+            if threading.current_thread() is not threading.main_thread():
+                connection.close()
+        with lock:
+            latencies.extend(own_latencies)
+            queries.extend(own_queries)
+            errors.extend(own_errors)
+
+    warmup_rng = random.Random('%s:%s:warmup' % (seed, scenario.name))
+    for _ in range(warmup):
+        _call(handler, send(warmup_rng))
+
+    shares = [requests // concurrency + (1 if index < requests % concurrency else 0) for index in range(concurrency)]
+    started = perf_counter()
+    if concurrency == 1:
+        worker(0, requests)
+    else:
+        threads = [threading.Thread(target=worker, args=(index, share)) for index, share in enumerate(shares)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    duration = perf_counter() - started
+
+    return OrderedDict([
+        ('requests', len(latencies)),
+        ('errors', len(errors)),
+        ('throughput', len(latencies) / duration if duration else 0.0),
+        ('p50_ms', _percentile(latencies, 50)),
+        ('p95_ms', _percentile(latencies, 95)),
+        ('p99_ms', _percentile(latencies, 99)),
+        ('queries', sum(queries) / len(queries) if queries else 0.0),
+    ])
+
+
+def compare(results, baseline, tolerance=0.2, min_delta_ms=1.0):
+    """
+    Find regressions of results against baseline, both dicts of scenario results.
+
+    Median and 95th percentile latency regress when they grow by more than
+    `tolerance` and `min_delta_ms` together, throughput when it drops by more
+    than `tolerance`. Any additional query or error is a regression.
+    Returns list of descriptions.
+    """
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for key in ('p50_ms', 'p95_ms'):
+            if current[key] > base[key] * (1 + tolerance) and current[key] - base[key] > min_delta_ms:
+                regressions.append('%s: %s %.2f ms, baseline %.2f ms' % (name, key, current[key], base[key]))
+        if current['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append('%s: throughput %.1f req/s, baseline %.1f req/s'
+                               % (name, current['throughput'], base['throughput']))
+        if current['queries'] > base['queries'] + 0.5:
+            regressions.append('%s: %.1f queries per request, baseline %.1f'
+                               % (name, current['queries'], base['queries']))
+        if current['errors'] > base['errors']:
+            regressions.append('%s: %d errors, baseline %d' % (name, current['errors'], base['errors']))
+    return regressions
@@ -0,0 +1,80 @@
+import json
+from collections import OrderedDict
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from scrapper.loadtest import SCENARIOS, BenchmarkContext, compare, run_scenario
+
+
+class Command(BaseCommand):
+    help = ('Benchmark API routes with concurrent requests through WSGI handler in this process, '
+            'reporting latency percentiles, throughput and SQL queries per request. '
+            'Results can be saved as baseline and compared against it later.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', nargs='+', metavar='NAME',
+                            help='Scenarios to run, all which do not write by default: %s.'
+                                 % ', '.join(scenario.name for scenario in SCENARIOS))
+        parser.add_argument('--writes', action='store_true',
+                            help='Also run scenarios which add, change and delete data in the database.')
+        parser.add_argument('--requests', type=int, default=200, help='Number of requests per scenario.')
+        parser.add_argument('--concurrency', type=int, default=4, help='Number of client threads.')
+        parser.add_argument('--warmup', type=int, default=5, help='Unmeasured requests per scenario.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--host', default='localhost', help='Host header, must be allowed.')
+        parser.add_argument('--cache', action='store_true',
+                            help='Keep response cache on, so repeated requests are answered from it. '
+                                 'By default it is off and every request reaches the views.')
+        parser.add_argument('--output', help='Write results as JSON, usable as baseline.')
+        parser.add_argument('--baseline', help='Compare results with baseline JSON, failing on regressions.')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed relative slowdown against baseline.')
+
+    def handle(self, *args, **options):
+        scenarios = [scenario for scenario in SCENARIOS if options['writes'] or not scenario.writes]
+        if options['scenarios']:
+            known = {scenario.name: scenario for scenario in SCENARIOS}
+            unknown = set(options['scenarios']) - set(known)
+            if unknown:
+                raise CommandError('Unknown scenarios: %s.' % ', '.join(sorted(unknown)))
+            scenarios = [known[name] for name in options['scenarios']]
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)['scenarios']
+        if settings.DEBUG:
+            self.stderr.write('DEBUG is on, queries are logged and latencies are higher than in production.')
+
+        try:
+            context = BenchmarkContext.load(options['seed'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        caches = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        results = OrderedDict()
+        self.stdout.write('%-20s %8s %6s %9s %8s %8s %8s %8s' % (
+            'scenario', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'queries'))
+        with nullcontext() if options['cache'] else override_settings(CACHES=caches):
+            for scenario in scenarios:
+                result = run_scenario(scenario, context, options['requests'], options['concurrency'],
+                                      options['warmup'], options['seed'], options['host'])
+                results[scenario.name] = result
+                self.stdout.write('%-20s %8d %6d %9.1f %8.2f %8.2f %8.2f %8.1f' % ((scenario.name,) + tuple(
+                    result.values())))
+
+        if options['output']:
+            config = OrderedDict((name, options[name]) for name in (
+                'requests', 'concurrency', 'warmup', 'seed', 'cache'))
+            with open(options['output'], 'w') as output:
+                json.dump(OrderedDict([('config', config), ('scenarios', results)]), output, indent=2)
+
+        if baseline is not None:
+            regressions = compare(results, baseline, options['tolerance'])
+            for regression in regressions:
+                self.stderr.write(regression)
+            if regressions:
+                raise CommandError('%d regressions against baseline.' % len(regressions))
+            self.stdout.write('No regressions against baseline.')
@@ -0,0 +1,49 @@
+import json
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from scrapper.jobs import run_worker_process
+from scrapper.models import Job
+
+
+class Command(BaseCommand):
+    help = ('Measure job queue throughput with growing number of worker processes. '
+            'Jobs only sleep, standing in for I/O bound scraping, so throughput should '
+            'grow almost linearly until the database cannot take more writes. '
+            'Benchmark jobs are added to the configured database and removed afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=500, help='Jobs run with every number of workers.')
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16],
+                            help='Numbers of worker processes to compare.')
+        parser.add_argument('--job-seconds', type=float, default=0.02, help='Duration of single job.')
+        parser.add_argument('--batch-size', type=int, default=1, help='Jobs claimed by worker at once.')
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context('fork')
+        payload = json.dumps({'seconds': options['job_seconds'], 'benchmark': True})
+        baseline = None
+        for workers in options['workers']:
+            Job.objects.bulk_create([Job(kind='sleep', payload=payload) for _ in range(options['jobs'])])
+            connections.close_all()
+
+            worker_options = {'kinds': ['sleep'], 'batch_size': options['batch_size'], 'exit_when_empty': True}
+            processes = [context.Process(target=run_worker_process, args=(worker_options,))
+                         for _ in range(workers)]
+            started = time.monotonic()
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            elapsed = time.monotonic() - started
+
+            jobs = Job.objects.filter(kind='sleep', payload=payload)
+            done = jobs.filter(status=Job.DONE).count()
+            jobs.delete()
+            rate = done / elapsed
+            baseline = baseline or rate / workers
+            self.stdout.write('%3d workers: %d jobs in %.2fs, %.0f jobs/sec, %.2f of linear scaling' % (
+                workers, done, elapsed, rate, rate / (baseline * workers)))
@@ -0,0 +1,45 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from scrapper.fastjson import PLACE_FIELDS, dumps
+from scrapper.models import Place
+from scrapper.serializers import PlaceSerializer
+
+
+def _timed(function):
+    started = time.perf_counter()
+    result = function()
+    return time.perf_counter() - started, result
+
+
+class Command(BaseCommand):
+    help = ('Compare serializing places with PlaceSerializer and JSONRenderer against '
+            'rendering value rows with the fast encoder. Places are built in memory, '
+            'so only serialization is measured, not the database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000],
+                            help='Numbers of places serialized in each run.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        generator = random.Random(options['seed'])
+        for count in options['rows']:
+            places = [
+                Place(id=pk, city='City %d' % pk, country='Country',
+                      latitude=generator.uniform(-90, 90), longitude=generator.uniform(-180, 180))
+                for pk in range(1, count + 1)
+            ]
+            rows = [{name: getattr(place, name) for name in PLACE_FIELDS} for place in places]
+
+            serializer_time, expected = _timed(
+                lambda: JSONRenderer().render(PlaceSerializer(places, many=True).data))
+            fast_time, content = _timed(lambda: dumps(rows))
+            if content != expected:
+                self.stderr.write('Outputs differ for %d rows.' % count)
+
+            self.stdout.write('%d rows: serializer %.3fs, fast %.3fs, %.1fx faster, %d bytes' % (
+                count, serializer_time, fast_time, serializer_time / max(fast_time, 1e-9), len(content)))
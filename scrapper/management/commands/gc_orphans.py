@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from scrapper.purge import PURGE_CHUNK_SIZE, delete_ungrouped_places, purge_deleted_groups
+
+
+class Command(BaseCommand):
+    help = ('Purge groups marked as deleted together with places left without any group. '
+            'Work is done in small transactions, so it is safe to interrupt and run again.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=PURGE_CHUNK_SIZE,
+                            help='Number of memberships or places removed per transaction.')
+        parser.add_argument('--ungrouped', action='store_true',
+                            help='Also delete every place which does not belong to any group, '
+                                 'including ones never added to a group.')
+
+    def handle(self, *args, **options):
+        groups, places = purge_deleted_groups(options['chunk_size'])
+        self.stdout.write('Purged %d deleted groups and %d orphaned places.' % (groups, places))
+
+        if options['ungrouped']:
+            places = delete_ungrouped_places(options['chunk_size'])
+            self.stdout.write('Deleted %d ungrouped places.' % places)
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from scrapper.geocoding import GEOCODE_CHUNK_SIZE, ReverseGeocoder, geocode_places, reverse_geocoder
+
+
+class Command(BaseCommand):
+    help = ('Fill blank city and country of saved places with the nearest city '
+            'from offline GeoNames gazetteer.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--gazetteer',
+                            help='GeoNames cities file, SCRAPPER_GAZETTEER_PATH by default.')
+        parser.add_argument('--countries',
+                            help='GeoNames countryInfo.txt used to get country names.')
+        parser.add_argument('--chunk-size', type=int, default=GEOCODE_CHUNK_SIZE,
+                            help='Number of places filled in per transaction.')
+
+    def handle(self, *args, **options):
+        if options['gazetteer']:
+            geocoder = ReverseGeocoder(options['gazetteer'], options['countries'])
+        else:
+            geocoder = reverse_geocoder
+        if not geocoder.is_available:
+            raise CommandError('No gazetteer given and SCRAPPER_GAZETTEER_PATH is not set.')
+        try:
+            geocoder.load()
+        except OSError as exc:
+            raise CommandError('Cannot read gazetteer - %s' % exc)
+
+        checked, filled = geocode_places(options['chunk_size'], geocoder)
+        self.stdout.write('Filled in %d of %d places with blank city or country.' % (filled, checked))
+        if filled:
+            self.stdout.write('Filled places may now duplicate others, run merge_duplicates to merge them.')
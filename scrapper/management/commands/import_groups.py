@@ -0,0 +1,5 @@
+from scrapper.importer import ImportGroupsCommand
+
+
+class Command(ImportGroupsCommand):
+    pass
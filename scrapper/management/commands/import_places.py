@@ -0,0 +1,5 @@
+from scrapper.importer import ImportPlacesCommand
+
+
+class Command(ImportPlacesCommand):
+    pass
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from scrapper.purge import PURGE_CHUNK_SIZE, merge_duplicate_places
+
+
+class Command(BaseCommand):
+    help = ('Merge duplicated places, which have equal dedup key, into the oldest one '
+            'and move their group memberships to it.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=PURGE_CHUNK_SIZE,
+                            help='Number of dedup keys merged per transaction.')
+
+    def handle(self, *args, **options):
+        keys, deleted = merge_duplicate_places(options['chunk_size'])
+        self.stdout.write('Merged %d duplicated places into %d.' % (deleted + keys, keys))
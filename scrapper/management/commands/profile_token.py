@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from scrapper.profiling import PROFILE_ROUTES, PROFILE_TOKEN_MAX_AGE, make_profile_token
+
+
+class Command(BaseCommand):
+    help = ('Sign token which enables profiling of requests to given route, '
+            'passed in X-Profile header or ?profile= parameter.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('route', help='Name of the route, like group-places.')
+
+    def handle(self, *args, **options):
+        route = options['route']
+        if route not in PROFILE_ROUTES:
+            raise CommandError('Route %s is not listed in SCRAPPER_PROFILE_ROUTES.' % route)
+        self.stdout.write(make_profile_token(route))
+        self.stderr.write('Token is valid for %d seconds.' % PROFILE_TOKEN_MAX_AGE)
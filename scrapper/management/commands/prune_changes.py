@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from scrapper.changes import CHANGES_RETENTION_DAYS, prune_changes
+
+
+class Command(BaseCommand):
+    help = ('Delete logged changes older than retention period. Clients holding tokens '
+            'of deleted changes get 410 from /changes/ and sync again from scratch.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=CHANGES_RETENTION_DAYS,
+                            help='Number of days for which changes are kept.')
+
+    def handle(self, *args, **options):
+        deleted = prune_changes(options['days'])
+        self.stdout.write('Deleted %d changes.' % deleted)
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from scrapper.stats import STATS_CHUNK_SIZE, recompute_group_stats
+
+
+class Command(BaseCommand):
+    help = ('Compute place count, centroid and bounding box of every group from scratch, '
+            'replacing incrementally kept stats.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=STATS_CHUNK_SIZE,
+                            help='Number of groups computed per transaction.')
+
+    def handle(self, *args, **options):
+        groups = recompute_group_stats(chunk_size=options['chunk_size'])
+        self.stdout.write('Computed stats of %d groups.' % groups)
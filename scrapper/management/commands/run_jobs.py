@@ -0,0 +1,49 @@
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from scrapper.jobs import JOB_HANDLERS, requeue_dead, run_worker_process
+
+
+class Command(BaseCommand):
+    help = ('Run queued jobs in worker processes. Jobs are leased, so any number of '
+            'these commands may run on several machines sharing the database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help='Number of worker processes.')
+        parser.add_argument('--kinds', nargs='+', choices=sorted(JOB_HANDLERS),
+                            help='Kinds of jobs to run, all by default.')
+        parser.add_argument('--batch-size', type=int, default=1, help='Jobs claimed by worker at once.')
+        parser.add_argument('--lease', type=int, help='Seconds of job lease, extended while job runs.')
+        parser.add_argument('--poll-interval', type=float, help='Seconds between looking for new jobs.')
+        parser.add_argument('--max-jobs', type=int, help='Jobs processed by every worker before it exits.')
+        parser.add_argument('--exit-when-empty', action='store_true',
+                            help='Exit when there is no job ready to run.')
+        parser.add_argument('--requeue-dead', action='store_true',
+                            help='Give dead-lettered jobs new attempts before starting.')
+
+    def handle(self, *args, **options):
+        if options['requeue_dead']:
+            self.stdout.write('Requeued %d dead jobs.' % requeue_dead(options['kinds']))
+
+        if options['processes'] == 1:
+            run_worker_process(options)
+            return
+
+        # Forked processes must not share parent's database connection
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=run_worker_process, args=(options,))
+                     for _ in range(options['processes'])]
+        for process in processes:
+            process.start()
+
+        def stop(signum, frame):
+            for process in processes:
+                process.terminate()
+
+        signal.signal(signal.SIGTERM, stop)
+        for process in processes:
+            process.join()
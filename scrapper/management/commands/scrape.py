@@ -0,0 +1,67 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from scrapper.jobs import enqueue_scrape
+from scrapper.models import Group
+from scrapper.scraper import Scraper
+
+
+class Command(BaseCommand):
+    help = ('Scrape places from Graph API style source, following its paging cursors. '
+            'Every URL should return {"data": [places], "paging": {...}}, places having '
+            'city, country, latitude and longitude, possibly nested in "location".')
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='*', help='First pages of sources.')
+        parser.add_argument('--urls-file', help='File with one source URL per line.')
+        parser.add_argument('--group', help='Name of group scraped places are added to, created if missing.')
+        parser.add_argument('--access-token', help='Access token added to source URLs.')
+        parser.add_argument('--page-size', type=int, help='Places requested per page with `limit` parameter.')
+        parser.add_argument('--max-pages', type=int, help='Number of pages followed per source.')
+        parser.add_argument('--concurrency', type=int, help='Number of pages fetched at once.')
+        parser.add_argument('--rate', type=float, help='Requests per second per host, 0 for no limit.')
+        parser.add_argument('--burst', type=int, help='Requests sent at once to host after idle period.')
+        parser.add_argument('--retries', type=int, help='Retries of failed requests.')
+        parser.add_argument('--backoff', type=float, help='Seconds before first retry, doubled with next ones.')
+        parser.add_argument('--max-retry-after', type=float,
+                            help='Longest wait in seconds for retry asked by source with Retry-After header.')
+        parser.add_argument('--timeout', type=float, help='Seconds to wait for response.')
+        parser.add_argument('--batch-size', type=int, help='Places saved in single transaction.')
+        parser.add_argument('--enqueue', action='store_true',
+                            help='Queue job for every source instead, to be run by `run_jobs` workers.')
+        parser.add_argument('--priority', type=int, default=0, help='Priority of queued jobs.')
+
+    def handle(self, *args, **options):
+        urls = list(options['urls'])
+        if options['urls_file']:
+            with open(options['urls_file']) as urls_file:
+                urls.extend(line.strip() for line in urls_file if line.strip())
+        if not urls:
+            raise CommandError('Give at least one source URL.')
+
+        group = None
+        if options['group']:
+            group = Group.objects.active().filter(name=options['group']).order_by('pk').first()
+            if group is None:
+                group = Group.objects.create(name=options['group'])
+
+        scraper_options = {
+            name: options[name] for name in (
+                'access_token', 'page_size', 'max_pages', 'concurrency', 'rate', 'burst',
+                'retries', 'backoff', 'max_retry_after', 'timeout', 'batch_size',
+            ) if options[name] is not None
+        }
+        if options['enqueue']:
+            jobs = enqueue_scrape(urls, group=group, priority=options['priority'], **scraper_options)
+            self.stdout.write(self.style.SUCCESS('Queued %d scrape jobs.' % len(jobs)))
+            return
+
+        scraper = Scraper(urls, group=group, **scraper_options)
+        started = time.monotonic()
+        stats = scraper.run()
+        elapsed = max(time.monotonic() - started, 1e-9)
+        self.stdout.write(self.style.SUCCESS(
+            'Scraped %d places (%d new, %d updated, %d invalid) from %d pages, %d pages failed, %.0f places/sec.' % (
+                stats.places, stats.created, stats.updated, stats.invalid, stats.pages,
+                stats.failed_pages, stats.places / elapsed)))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from scrapper.loadtest import seed_data
+
+
+class Command(BaseCommand):
+    help = ('Fill empty database with reproducible synthetic places, groups and memberships '
+            'for benchmarks, see bench_api.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--places', type=int, default=1000000)
+        parser.add_argument('--groups', type=int, default=100000)
+        parser.add_argument('--memberships', type=int, default=2000000,
+                            help='Approximate number of group memberships.')
+        parser.add_argument('--cities', type=int, default=5000,
+                            help='Number of cities places cluster around.')
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Exponent of Zipf distribution of city popularity and group sizes.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            created = seed_data(
+                places=options['places'], groups=options['groups'], memberships=options['memberships'],
+                cities=options['cities'], skew=options['skew'], seed=options['seed'],
+                progress=lambda message: self.stderr.write(message) if options['verbosity'] > 1 else None,
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write('Created %(places)d places, %(groups)d groups and %(memberships)d memberships.'
+                          % created)
@@ -0,0 +1,121 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.signals import m2m_changed
+
+from scrapper.models import Group, Place
+
+# Number of ids passed to single `IN (...)` lookup, it must fit in SQLite's
+# limit of 999 query variables
+MEMBERSHIP_CHUNK_SIZE = getattr(settings, 'SCRAPPER_MEMBERSHIP_CHUNK_SIZE', 500)
+
+Membership = Group.places.through
+
+
+def _chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def delete_rows(model, field, values, chunk_size=None, **equal):
+    """
+    Delete rows of model with `field` in given values and other fields equal
+    to given ones, using plain `DELETE` statements of bounded size.
+
+    Objects are not collected and signals are not sent, callers notify
+    dependants themselves. Returns number of deleted rows.
+    """
+    chunk_size = chunk_size or MEMBERSHIP_CHUNK_SIZE
+    quote_name = connection.ops.quote_name
+    column = quote_name(model._meta.get_field(field).column)
+    conditions = ['%s = %%s' % quote_name(model._meta.get_field(name).column) for name in equal]
+    deleted = 0
+    with connection.cursor() as cursor:
+        for chunk in _chunks(values, chunk_size):
+            where = conditions + ['%s IN (%s)' % (column, ', '.join(['%s'] * len(chunk)))]
+            cursor.execute('DELETE FROM %s WHERE %s' % (quote_name(model._meta.db_table), ' AND '.join(where)),
+                           list(equal.values()) + chunk)
+            deleted += cursor.rowcount
+    return deleted
+
+
+def existing_place_pks(place_pks, chunk_size=None):
+    """
+    Get set of given ids which belong to existing places.
+    """
+    chunk_size = chunk_size or MEMBERSHIP_CHUNK_SIZE
+    existing = set()
+    for chunk in _chunks(set(place_pks), chunk_size):
+        existing.update(Place.objects.filter(pk__in=chunk).values_list('pk', flat=True))
+    return existing
+
+
+def member_place_pks(group):
+    """
+    Get set of ids of group's places, reading only the through table.
+    """
+    return set(Membership.objects.filter(group_id=group.pk).values_list('place_id', flat=True))
+
+
+def _send_m2m_changed(group, action, pk_set):
+    """
+    Notify receivers of Group.places changes the same way related manager does.
+    """
+    m2m_changed.send(sender=Membership, instance=group, action=action, reverse=False,
+                     model=Place, pk_set=pk_set, using=connection.alias)
+
+
+def _add(group, place_pks):
+    _send_m2m_changed(group, 'pre_add', place_pks)
+    rows = [Membership(group_id=group.pk, place_id=pk) for pk in sorted(place_pks)]
+    # Batch size is left to Django, which fits it in backend's limits
+    Membership.objects.bulk_create(rows, ignore_conflicts=True)
+    _send_m2m_changed(group, 'post_add', place_pks)
+
+
+def _remove(group, place_pks, chunk_size):
+    _send_m2m_changed(group, 'pre_remove', place_pks)
+    delete_rows(Membership, 'place_id', sorted(place_pks), chunk_size, group_id=group.pk)
+    _send_m2m_changed(group, 'post_remove', place_pks)
+
+
+def add_places(group, place_pks, chunk_size=None):
+    """
+    Add existing places with given ids to group, without loading them.
+    Unknown ids and places already in group are skipped. Returns set of added ids.
+    """
+    chunk_size = chunk_size or MEMBERSHIP_CHUNK_SIZE
+    with transaction.atomic():
+        added = existing_place_pks(place_pks, chunk_size) - member_place_pks(group)
+        if added:
+            _add(group, added)
+    return added
+
+
+def remove_places(group, place_pks, chunk_size=None):
+    """
+    Remove places with given ids from group. Returns set of removed ids.
+    """
+    chunk_size = chunk_size or MEMBERSHIP_CHUNK_SIZE
+    with transaction.atomic():
+        removed = member_place_pks(group) & set(place_pks)
+        if removed:
+            _remove(group, removed, chunk_size)
+    return removed
+
+
+def replace_places(group, place_pks, chunk_size=None):
+    """
+    Make group contain exactly existing places with given ids.
+    Returns sets of added and removed ids.
+    """
+    chunk_size = chunk_size or MEMBERSHIP_CHUNK_SIZE
+    with transaction.atomic():
+        current = member_place_pks(group)
+        wanted = existing_place_pks(place_pks, chunk_size)
+        added, removed = wanted - current, current - wanted
+        if removed:
+            _remove(group, removed, chunk_size)
+        if added:
+            _add(group, added)
+    return added, removed
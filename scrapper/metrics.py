@@ -0,0 +1,250 @@
+import threading
+from bisect import bisect_left
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+# If requests are measured, MetricsMiddleware removes itself from the chain otherwise
+METRICS_ENABLED = getattr(settings, 'SCRAPPER_METRICS_ENABLED', False)
+
+# Upper bounds in seconds of request latency histogram buckets
+METRICS_BUCKETS = tuple(getattr(settings, 'SCRAPPER_METRICS_BUCKETS',
+                                (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)))
+
+# Label of requests which did not match any route
+UNMATCHED_ROUTE = 'unmatched'
+
+# Methods labelled by name, others share OTHER_METHOD label, so clients cannot add labels at will
+METRICS_METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS')
+OTHER_METHOD = 'other'
+
+_local = threading.local()
+
+
+class RequestMetrics(object):
+    """
+    Time spent on single request, in seconds, broken down into its phases.
+    """
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.total = 0.0
+        self.sql_queries = 0
+        self.sql = 0.0
+        self.serialize = 0.0
+        self.render = 0.0
+        self.response_bytes = None
+
+    def execute(self, execute, sql, params, many, context):
+        """
+        Database execute wrapper counting queries and their time.
+        """
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_queries += 1
+            self.sql += perf_counter() - started
+
+    def server_timing(self):
+        """
+        Format metrics as value of `Server-Timing` header, durations in milliseconds.
+        """
+        entries = [
+            'sql;dur=%.3f;desc="%d queries"' % (self.sql * 1000, self.sql_queries),
+            'serialize;dur=%.3f' % (self.serialize * 1000),
+            'render;dur=%.3f' % (self.render * 1000),
+            'total;dur=%.3f' % (self.total * 1000),
+        ]
+        if self.response_bytes is not None:
+            entries.append('size;desc="%d bytes"' % self.response_bytes)
+        return ', '.join(entries)
+
+
+class _Timer(object):
+    """
+    Add time spent within `with` block, less its SQL time, to given phase of request.
+    """
+
+    def __init__(self, metrics, phase):
+        self.metrics = metrics
+        self.phase = phase
+
+    def __enter__(self):
+        self.started = perf_counter()
+        self.sql = self.metrics.sql
+
+    def __exit__(self, *exc_info):
+        metrics = self.metrics
+        spent = perf_counter() - self.started - (metrics.sql - self.sql)
+        setattr(metrics, self.phase, getattr(metrics, self.phase) + spent)
+
+
+class _NullTimer(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def current_metrics():
+    """
+    Get metrics of request handled by current thread, None if it is not measured.
+    """
+    return getattr(_local, 'metrics', None)
+
+
+def timed(phase):
+    """
+    Context manager adding time spent within it to `serialize` or `render`
+    phase of measured request. It does nothing for other requests.
+    """
+    metrics = getattr(_local, 'metrics', None)
+    if metrics is None:
+        return _NULL_TIMER
+    return _Timer(metrics, phase)
+
+
+class _RouteStats(object):
+    def __init__(self):
+        self.buckets = [0] * (len(METRICS_BUCKETS) + 1)
+        self.count = 0
+        self.seconds = 0.0
+        self.statuses = {}
+        self.sql_queries = 0
+        self.sql = 0.0
+        self.serialize = 0.0
+        self.render = 0.0
+        self.response_bytes = 0
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRegistry(object):
+    """
+    Per route latency histograms and totals of request phases, kept in process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def observe(self, route, method, status, metrics):
+        with self._lock:
+            stats = self._routes.get((route, method))
+            if stats is None:
+                stats = self._routes[route, method] = _RouteStats()
+            stats.buckets[bisect_left(METRICS_BUCKETS, metrics.total)] += 1
+            stats.count += 1
+            stats.seconds += metrics.total
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            stats.sql_queries += metrics.sql_queries
+            stats.sql += metrics.sql
+            stats.serialize += metrics.serialize
+            stats.render += metrics.render
+            stats.response_bytes += metrics.response_bytes or 0
+
+    def clear(self):
+        with self._lock:
+            self._routes = {}
+
+    def exposition(self):
+        """
+        Format metrics in Prometheus text exposition format.
+        """
+        with self._lock:
+            routes = sorted(self._routes.items(), key=lambda item: (str(item[0][0]), item[0][1]))
+            lines = [
+                '# HELP scrapper_request_duration_seconds Time spent handling requests.',
+                '# TYPE scrapper_request_duration_seconds histogram',
+            ]
+            for (route, method), stats in routes:
+                labels = 'route="%s",method="%s"' % (_escape(route), _escape(method))
+                cumulative = 0
+                for bound, count in zip(METRICS_BUCKETS + ('+Inf',), stats.buckets):
+                    cumulative += count
+                    lines.append('scrapper_request_duration_seconds_bucket{%s,le="%s"} %d'
+                                 % (labels, bound, cumulative))
+                lines.append('scrapper_request_duration_seconds_sum{%s} %r' % (labels, stats.seconds))
+                lines.append('scrapper_request_duration_seconds_count{%s} %d' % (labels, stats.count))
+
+            lines.extend([
+                '# HELP scrapper_requests_total Requests handled, by response status.',
+                '# TYPE scrapper_requests_total counter',
+            ])
+            for (route, method), stats in routes:
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append('scrapper_requests_total{route="%s",method="%s",status="%s"} %d'
+                                 % (_escape(route), _escape(method), status, count))
+
+            for name, attribute, description in (
+                    ('scrapper_sql_queries_total', 'sql_queries', 'SQL queries run by requests.'),
+                    ('scrapper_sql_seconds_total', 'sql', 'Time spent in SQL queries.'),
+                    ('scrapper_serialize_seconds_total', 'serialize', 'Time spent serializing data.'),
+                    ('scrapper_render_seconds_total', 'render', 'Time spent rendering responses.'),
+                    ('scrapper_response_bytes_total', 'response_bytes', 'Size of non-streamed responses.')):
+                lines.extend(['# HELP %s %s' % (name, description), '# TYPE %s counter' % name])
+                for (route, method), stats in routes:
+                    lines.append('%s{route="%s",method="%s"} %r'
+                                 % (name, _escape(route), _escape(method), getattr(stats, attribute)))
+        return '\n'.join(lines) + '\n'
+
+
+# Process wide registry filled by MetricsMiddleware
+registry = MetricsRegistry()
+
+
+class MetricsMiddleware(object):
+    """
+    Measure SQL, serialization and render time and response size of requests.
+
+    Measurements are sent back in `Server-Timing` header and aggregated per
+    route in `registry`, exposed by metrics view. Unless SCRAPPER_METRICS_ENABLED
+    is set, the middleware is not used at all. Streamed responses are measured
+    until they start.
+    """
+
+    def __init__(self, get_response):
+        if not METRICS_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        _local.metrics = metrics
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics.execute))
+                response = self.get_response(request)
+        finally:
+            _local.metrics = None
+        metrics.total = perf_counter() - metrics.started
+        if not response.streaming:
+            metrics.response_bytes = len(response.content)
+
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match is not None else UNMATCHED_ROUTE
+        method = request.method if request.method in METRICS_METHODS else OTHER_METHOD
+        registry.observe(route, method, response.status_code, metrics)
+        response['Server-Timing'] = metrics.server_timing()
+        return response
+
+    def process_template_response(self, request, response):
+        # Called right before response is rendered, after the view returned it.
+        # Responses of scrapper.caching are rendered, and timed, by the view already
+        if response.is_rendered:
+            return response
+        timer = timed('render')
+        timer.__enter__()
+        response.add_post_render_callback(lambda rendered: timer.__exit__(None, None, None))
+        return response
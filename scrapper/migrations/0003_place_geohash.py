@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from scrapper.geo import encode_geohash
+
+
+def fill_geohash(apps, schema_editor):
+    Place = apps.get_model('scrapper', 'Place')
+    places = Place.objects.only('pk', 'latitude', 'longitude')
+    for place in places.iterator():
+        place.geohash = encode_geohash(place.latitude, place.longitude)
+        place.save(update_fields=['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scrapper', '0002_groups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='place',
+            name='geohash',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=9),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_geohash, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='place',
+            index=models.Index(fields=['latitude', 'longitude'], name='place_lat_lon_idx'),
+        ),
+    ]
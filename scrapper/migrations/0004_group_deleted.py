@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scrapper', '0003_place_geohash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='deleted',
+            field=models.BooleanField(db_index=True, default=False, editable=False),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from scrapper.dedup import make_dedup_key
+
+
+def fill_dedup_key(apps, schema_editor):
+    Place = apps.get_model('scrapper', 'Place')
+    places = Place.objects.only('pk', 'city', 'country', 'latitude', 'longitude')
+    for place in places.iterator():
+        place.dedup_key = make_dedup_key(place.city, place.country, place.latitude, place.longitude)
+        place.save(update_fields=['dedup_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scrapper', '0004_group_deleted'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='place',
+            name='dedup_key',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=40),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_dedup_key, migrations.RunPython.noop),
+    ]
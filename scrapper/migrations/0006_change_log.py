@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def seed_change_log(apps, schema_editor):
+    """
+    Record existing data as changes, so syncing from scratch gets all of it.
+    """
+    Change = apps.get_model('scrapper', 'Change')
+    Place = apps.get_model('scrapper', 'Place')
+    Group = apps.get_model('scrapper', 'Group')
+    Membership = Group.places.through
+
+    def changes():
+        for pk in Place.objects.order_by('pk').values_list('pk', flat=True).iterator():
+            yield Change(kind='place', action='upsert', object_id=pk)
+        for pk in Group.objects.filter(deleted=False).order_by('pk').values_list('pk', flat=True).iterator():
+            yield Change(kind='group', action='upsert', object_id=pk)
+        memberships = Membership.objects.filter(group__deleted=False).order_by('group_id', 'place_id')
+        for group_pk, place_pk in memberships.values_list('group_id', 'place_id').iterator():
+            yield Change(kind='membership', action='add', object_id=group_pk, place_id=place_pk)
+
+    batch = []
+    for change in changes():
+        batch.append(change)
+        if len(batch) >= 500:
+            Change.objects.bulk_create(batch)
+            batch = []
+    Change.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scrapper', '0005_place_dedup_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('place', 'Place'), ('group', 'Group'), ('membership', 'Membership')], max_length=10)),
+                ('action', models.CharField(choices=[('upsert', 'Created or updated'), ('delete', 'Deleted'), ('add', 'Place added to group'), ('remove', 'Place removed from group')], max_length=10)),
+                ('object_id', models.IntegerField()),
+                ('place_id', models.IntegerField(null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='place',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(seed_change_log, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from scrapper.dedup import normalize_name
+
+
+def fill_search_keys(apps, schema_editor):
+    Place = apps.get_model('scrapper', 'Place')
+    places = Place.objects.only('pk', 'city', 'country')
+    for place in places.iterator():
+        place.city_key = normalize_name(place.city)[:100]
+        place.country_key = normalize_name(place.country)[:35]
+        place.save(update_fields=['city_key', 'country_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scrapper', '0007_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='place',
+            name='city_key',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=100),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='place',
+            name='country_key',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=35),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_search_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from scrapper.stats import summarize
+
+
+def compute_group_stats(apps, schema_editor):
+    Group = apps.get_model('scrapper', 'Group')
+    GroupStats = apps.get_model('scrapper', 'GroupStats')
+    Membership = Group.places.through
+    group_pks = list(Group.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(group_pks), 500):
+        chunk = group_pks[start:start + 500]
+        rows = list(Membership.objects.filter(group_id__in=chunk)
+                    .values_list('group_id', 'place__latitude', 'place__longitude'))
+        summaries = summarize(*zip(*rows)) if rows else {}
+        GroupStats.objects.bulk_create([
+            GroupStats(group_id=group_pk, **summaries.get(group_pk, {})) for group_pk in chunk
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scrapper', '0008_place_search_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupStats',
+            fields=[
+                ('group', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='scrapper.Group')),
+                ('places', models.IntegerField(default=0)),
+                ('x', models.FloatField(default=0)),
+                ('y', models.FloatField(default=0)),
+                ('z', models.FloatField(default=0)),
+                ('min_latitude', models.FloatField(null=True)),
+                ('max_latitude', models.FloatField(null=True)),
+                ('min_longitude', models.FloatField(null=True)),
+                ('max_longitude', models.FloatField(null=True)),
+            ],
+        ),
+        migrations.RunPython(compute_group_stats, migrations.RunPython.noop),
+    ]
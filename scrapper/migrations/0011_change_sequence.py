@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def number_existing_changes(apps, schema_editor):
+    """
+    Number logged changes by their ids, so tokens handed out before stay valid.
+    """
+    Change = apps.get_model('scrapper', 'Change')
+    Change.objects.update(sequence=models.F('pk'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scrapper', '0010_import_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='change',
+            name='sequence',
+            field=models.BigIntegerField(editable=False, null=True, unique=True),
+        ),
+        migrations.RunPython(number_existing_changes, migrations.RunPython.noop),
+    ]
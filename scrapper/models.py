@@ -1,4 +1,10 @@
+import math
+
 from django.db import models
+from django.utils import timezone
+
+from scrapper.dedup import make_dedup_key, normalize_name
+from scrapper.geo import GEOHASH_PRECISION, encode_geohash
 
 
 class Place(models.Model):
@@ -6,8 +12,175 @@ class Place(models.Model):
     country = models.CharField(max_length=35, blank=True)
     latitude = models.FloatField()
     longitude = models.FloatField()
+    # Derived from coordinates on save, used to prune bounding box queries
+    geohash = models.CharField(max_length=GEOHASH_PRECISION, db_index=True, editable=False)
+    # Equal for duplicates of the same place, see scrapper.dedup
+    dedup_key = models.CharField(max_length=40, db_index=True, editable=False)
+    # Normalized city and country, indexed for prefix search, see scrapper.search
+    city_key = models.CharField(max_length=100, db_index=True, editable=False)
+    country_key = models.CharField(max_length=35, db_index=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['latitude', 'longitude'], name='place_lat_lon_idx'),
+        ]
+
+    def update_derived_fields(self):
+        """
+        Recompute fields derived from place's data, save() does it automatically.
+        """
+        self.geohash = encode_geohash(self.latitude, self.longitude)
+        self.dedup_key = make_dedup_key(self.city, self.country, self.latitude, self.longitude)
+        # Case folding can make names longer
+        self.city_key = normalize_name(self.city)[:100]
+        self.country_key = normalize_name(self.country)[:35]
+
+    def save(self, *args, **kwargs):
+        self.update_derived_fields()
+        super().save(*args, **kwargs)
+
+
+class GroupQuerySet(models.QuerySet):
+    def active(self):
+        """
+        Exclude groups marked as deleted which wait for purge.
+        """
+        return self.filter(deleted=False)
 
 
 class Group(models.Model):
     name = models.CharField(max_length=50)
     places = models.ManyToManyField(Place, related_name='groups', blank=True)
+    # Set when group is deleted in background, see scrapper.purge
+    deleted = models.BooleanField(default=False, db_index=True, editable=False)
+    # Also touched when group's places change
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = GroupQuerySet.as_manager()
+
+
+class GroupStats(models.Model):
+    """
+    Aggregates of group's places kept up to date incrementally, see scrapper.stats.
+    """
+    group = models.OneToOneField(Group, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    places = models.IntegerField(default=0)
+    # Sum of places as unit vectors, pointing to their spherical centroid
+    x = models.FloatField(default=0)
+    y = models.FloatField(default=0)
+    z = models.FloatField(default=0)
+    # Bounding box, empty for group without places
+    min_latitude = models.FloatField(null=True)
+    max_latitude = models.FloatField(null=True)
+    min_longitude = models.FloatField(null=True)
+    max_longitude = models.FloatField(null=True)
+
+    @property
+    def centroid(self):
+        """
+        Get (latitude, longitude) of spherical centroid, None if there are no
+        places or they cancel each other out.
+        """
+        length = math.sqrt(self.x ** 2 + self.y ** 2 + self.z ** 2)
+        if self.places <= 0 or length < 1e-9 * self.places:
+            return None
+        return (math.degrees(math.atan2(self.z, math.hypot(self.x, self.y))),
+                math.degrees(math.atan2(self.y, self.x)))
+
+    @property
+    def bbox(self):
+        """
+        Get (min_lon, min_lat, max_lon, max_lat) as `?bbox=` takes it, None if there are no places.
+        """
+        if self.places <= 0 or self.min_latitude is None:
+            return None
+        return self.min_longitude, self.min_latitude, self.max_longitude, self.max_latitude
+
+
+class Change(models.Model):
+    """
+    Entry of change log read by delta sync, see scrapper.changes.
+    Its sequence is the sync token, changes are replayed in order of sequences.
+    """
+    PLACE = 'place'
+    GROUP = 'group'
+    MEMBERSHIP = 'membership'
+    KINDS = (
+        (PLACE, 'Place'),
+        (GROUP, 'Group'),
+        (MEMBERSHIP, 'Membership'),
+    )
+
+    UPSERT = 'upsert'
+    DELETE = 'delete'
+    ADD = 'add'
+    REMOVE = 'remove'
+    ACTIONS = (
+        (UPSERT, 'Created or updated'),
+        (DELETE, 'Deleted'),
+        (ADD, 'Place added to group'),
+        (REMOVE, 'Place removed from group'),
+    )
+
+    kind = models.CharField(max_length=10, choices=KINDS)
+    action = models.CharField(max_length=10, choices=ACTIONS)
+    # Place or group, for memberships the group
+    object_id = models.IntegerField()
+    # Place of membership
+    place_id = models.IntegerField(null=True)
+    # Numbered in order of commits once the change is read, see scrapper.changes.sequence_changes
+    sequence = models.BigIntegerField(null=True, unique=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class Job(models.Model):
+    """
+    Task run by workers, see scrapper.jobs.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    DEAD = 'dead'
+    STATUSES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (DEAD, 'Failed too many times'),
+    )
+
+    kind = models.CharField(max_length=50)
+    # JSON encoded arguments of job's handler
+    payload = models.TextField(default='{}')
+    # Jobs with higher priority are claimed first
+    priority = models.IntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    # Worker holding the job and until when, unless it keeps extending the lease
+    lease_owner = models.CharField(max_length=100, blank=True)
+    lease_token = models.CharField(max_length=32, blank=True, db_index=True)
+    lease_expires = models.DateTimeField(null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', '-priority', 'run_after'], name='job_claim_idx'),
+        ]
+
+
+class ImportCheckpoint(models.Model):
+    """
+    Progress of file import, saved in the same transaction as imported batch, see scrapper.importer.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    # Absolute path of imported file
+    source = models.CharField(max_length=1024)
+    # Position in file right after the last committed record
+    offset = models.BigIntegerField(default=0)
+    rows = models.PositiveIntegerField(default=0)
+    errors = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
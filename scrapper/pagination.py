@@ -0,0 +1,33 @@
+from rest_framework.pagination import CursorPagination
+
+
+class PkCursorPagination(CursorPagination):
+    """
+    Keyset pagination ordered by primary key.
+
+    Pages are selected with `pk > last_seen_pk` instead of OFFSET, so fetching
+    any page costs the same regardless of its depth. Cursor is opaque to clients.
+    """
+    # Primary key referred to by name, so rows fetched with values() work too
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+# Query parameter which opts in to the old, unpaginated list responses
+UNPAGINATED_QUERY_PARAM = 'all'
+
+
+def query_flag(request, name):
+    """
+    Check if boolean query parameter is set to true value.
+    """
+    value = request.query_params.get(name, '')
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def is_unpaginated(request):
+    """
+    Check if client explicitly asked for whole, unpaginated list.
+    """
+    return query_flag(request, UNPAGINATED_QUERY_PARAM)
@@ -0,0 +1,162 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import re
+import tempfile
+import uuid
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Names of routes which can be profiled, ProfilerMiddleware is not used when empty
+PROFILE_ROUTES = tuple(getattr(settings, 'SCRAPPER_PROFILE_ROUTES', ()))
+
+# Directory where profiling reports are written
+PROFILE_DIR = getattr(settings, 'SCRAPPER_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'scrapper-profiles'))
+
+# Seconds for which profiling token is valid
+PROFILE_TOKEN_MAX_AGE = getattr(settings, 'SCRAPPER_PROFILE_TOKEN_MAX_AGE', 3600)
+
+# Number of functions listed in text summary of the report
+PROFILE_SUMMARY_LIMIT = getattr(settings, 'SCRAPPER_PROFILE_SUMMARY_LIMIT', 50)
+
+# Header or query parameter carrying profiling token
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_QUERY_PARAM = 'profile'
+
+# Response header with name of written report
+REPORT_HEADER = 'X-Profile-Report'
+
+_SALT = 'scrapper.profiling'
+
+
+def make_profile_token(route):
+    """
+    Sign token which enables profiling of given route for PROFILE_TOKEN_MAX_AGE.
+    """
+    return signing.TimestampSigner(salt=_SALT).sign(route)
+
+
+def check_profile_token(token, route):
+    """
+    Check if token was signed for given route and did not expire yet.
+    """
+    try:
+        return signing.TimestampSigner(salt=_SALT).unsign(token, max_age=PROFILE_TOKEN_MAX_AGE) == route
+    except signing.BadSignature:
+        return False
+
+
+class SQLLog(object):
+    """
+    Database execute wrapper recording queries with their parameters and time.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((perf_counter() - started, sql, params, many))
+
+    def format(self):
+        lines = ['%d queries, %.3f ms' % (len(self.queries), sum(query[0] for query in self.queries) * 1000)]
+        for number, (duration, sql, params, many) in enumerate(self.queries, 1):
+            lines.append('')
+            lines.append('#%d %.3f ms%s' % (number, duration * 1000, ' (executemany)' if many else ''))
+            lines.append(sql)
+            if params:
+                lines.append('params: %r' % (params,))
+        return '\n'.join(lines) + '\n'
+
+
+def write_report(directory, route, request, response, duration, profiler, sql_log):
+    """
+    Write pstats dump, SQL log and text summary of profiled request.
+    Returns name shared by report's files.
+    """
+    name = '%s-%s-%s' % (timezone.now().strftime('%Y%m%dT%H%M%S'), re.sub(r'[^\w-]', '_', route),
+                         uuid.uuid4().hex[:8])
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name)
+    profiler.dump_stats(path + '.prof')
+    with open(path + '.sql', 'w', encoding='utf-8') as sql_file:
+        sql_file.write(sql_log.format())
+
+    stream = io.StringIO()
+    stream.write('%s %s -> %s in %.3f ms, %d queries\n\n' % (
+        request.method, request.get_full_path(), response.status_code, duration * 1000, len(sql_log.queries)))
+    pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(PROFILE_SUMMARY_LIMIT)
+    with open(path + '.txt', 'w', encoding='utf-8') as summary_file:
+        summary_file.write(stream.getvalue())
+    return name
+
+
+class ProfilerMiddleware(object):
+    """
+    Run single request under cProfile when it carries valid profiling token.
+
+    Token is given in `X-Profile` header or `?profile=` parameter. It must be
+    signed for the requested route, see `profile_token` command, and the route
+    must be listed in SCRAPPER_PROFILE_ROUTES. Report with pstats dump, log
+    of SQL queries and text summary is written to SCRAPPER_PROFILE_DIR.
+    Requests without token are passed on untouched, invalid tokens are ignored.
+    Profiled requests are not answered from response cache or with 304, so
+    the view itself is measured. Bodies of streamed responses are generated
+    after the report is written.
+    """
+
+    def __init__(self, get_response):
+        if not PROFILE_ROUTES:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = request.META.get(PROFILE_HEADER)
+        if token is None and PROFILE_QUERY_PARAM in request.GET:
+            token = request.GET[PROFILE_QUERY_PARAM]
+        if token is None:
+            return self.get_response(request)
+
+        try:
+            route = resolve(request.path_info).view_name
+        except Resolver404:
+            return self.get_response(request)
+        if route not in PROFILE_ROUTES or not check_profile_token(token, route):
+            logger.warning('Ignoring invalid profiling token for %s', request.path_info)
+            return self.get_response(request)
+        # See scrapper.caching
+        request._skip_response_cache = True
+
+        profiler = cProfile.Profile()
+        sql_log = SQLLog()
+        started = perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(sql_log))
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        duration = perf_counter() - started
+
+        try:
+            response[REPORT_HEADER] = write_report(PROFILE_DIR, route, request, response, duration,
+                                                   profiler, sql_log)
+        except OSError:
+            logger.exception('Writing profiling report of %s failed', request.path_info)
+        return response
@@ -0,0 +1,223 @@
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Exists, OuterRef
+from django.utils import timezone
+
+from scrapper.caching import bump_version_on_commit
+from scrapper.changes import record, record_memberships, touch_groups
+from scrapper.clusters import cluster_index
+from scrapper.membership import delete_rows
+from scrapper.models import Change, Group, Place
+from scrapper.search import INDEXED_FIELDS, search_index
+from scrapper.spatial import place_index
+from scrapper.stats import recompute_group_stats
+
+logger = logging.getLogger(__name__)
+
+# Number of memberships removed in single transaction while purging group.
+# Ids are passed as query variables, so it must fit in SQLite's limit of 999.
+PURGE_CHUNK_SIZE = getattr(settings, 'SCRAPPER_PURGE_CHUNK_SIZE', 500)
+
+Membership = Group.places.through
+
+
+def orphans(place_pks):
+    """
+    Get ids of given places which do not belong to any group, using single anti-join.
+    """
+    has_group = Membership.objects.filter(place_id=OuterRef('pk'))
+    return list(
+        Place.objects.filter(pk__in=place_pks)
+        .annotate(has_group=Exists(has_group))
+        .filter(has_group=False)
+        .values_list('pk', flat=True)
+    )
+
+
+def delete_places(place_pks):
+    """
+    Delete places with plain SQL, without loading them.
+
+    Model signals are not sent, so dependants of places are notified here.
+    Places must not belong to any group.
+    """
+    if not place_pks:
+        return 0
+    places = Place.objects.filter(pk__in=place_pks)
+    if search_index.is_tracking:
+        values = list(places.values_list(*INDEXED_FIELDS))
+        transaction.on_commit(lambda: [search_index.place_changed(old, None) for old in values])
+    deleted = delete_rows(Place, 'id', place_pks)
+    transaction.on_commit(lambda: [place_index.place_deleted(pk) for pk in place_pks])
+    transaction.on_commit(lambda: [cluster_index.place_deleted(pk) for pk in place_pks])
+    bump_version_on_commit('place')
+    record(Change.PLACE, Change.DELETE, place_pks)
+    return deleted
+
+
+def hide_group(group_pk):
+    """
+    Mark group as deleted, hiding it before it is purged, and log its tombstone.
+    """
+    with transaction.atomic():
+        if Group.objects.filter(pk=group_pk, deleted=False).update(deleted=True, updated_at=timezone.now()):
+            record(Change.GROUP, Change.DELETE, [group_pk])
+        bump_version_on_commit('group', 'group:%s' % group_pk)
+
+
+def purge_group_chunk(group_pk, chunk_size=None):
+    """
+    Remove next chunk of group's memberships and places left without group.
+    Returns number of removed memberships and deleted places.
+    """
+    chunk_size = chunk_size or PURGE_CHUNK_SIZE
+    with transaction.atomic():
+        place_pks = list(
+            Membership.objects.filter(group_id=group_pk)
+            .order_by('place_id')
+            .values_list('place_id', flat=True)[:chunk_size]
+        )
+        if not place_pks:
+            return 0, 0
+        # Stats of hidden group are not kept up to date, they go away with the group
+        delete_rows(Membership, 'place_id', place_pks, group_id=group_pk)
+        transaction.on_commit(lambda: cluster_index.groups_changed([group_pk]))
+        bump_version_on_commit('group', 'group:%s' % group_pk)
+        return len(place_pks), delete_places(orphans(place_pks))
+
+
+def purge_group(group_pk, chunk_size=None):
+    """
+    Delete group together with places which belong to no other group.
+
+    Work is split into bounded transactions, so it can be interrupted and
+    resumed at any point. Group is hidden first, so it does not show up
+    partially purged. Returns number of deleted places.
+    """
+    hide_group(group_pk)
+    deleted_places = 0
+    while True:
+        removed, deleted = purge_group_chunk(group_pk, chunk_size)
+        if not removed:
+            break
+        deleted_places += deleted
+    Group.objects.filter(pk=group_pk).delete()
+    return deleted_places
+
+
+def purge_deleted_groups(chunk_size=None):
+    """
+    Purge all groups marked as deleted. Returns number of purged groups and deleted places.
+    """
+    groups = 0
+    places = 0
+    for group_pk in Group.objects.filter(deleted=True).values_list('pk', flat=True):
+        places += purge_group(group_pk, chunk_size)
+        groups += 1
+    return groups, places
+
+
+def delete_ungrouped_places(chunk_size=None):
+    """
+    Delete all places which do not belong to any group. Returns number of deleted places.
+    """
+    chunk_size = chunk_size or PURGE_CHUNK_SIZE
+    has_group = Membership.objects.filter(place_id=OuterRef('pk'))
+    ungrouped = (
+        Place.objects.annotate(has_group=Exists(has_group))
+        .filter(has_group=False)
+        .order_by('pk')
+        .values_list('pk', flat=True)
+    )
+    deleted = 0
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            place_pks = list(ungrouped.filter(pk__gt=last_pk)[:chunk_size])
+            if not place_pks:
+                return deleted
+            deleted += delete_places(place_pks)
+        last_pk = place_pks[-1]
+
+
+def merge_duplicate_places(chunk_size=None):
+    """
+    Merge places sharing dedup key into the oldest one of them.
+
+    Groups of removed duplicates get the kept place instead. Every chunk of
+    dedup keys is merged in its own transaction.
+    Returns number of merged dedup keys and deleted places.
+    """
+    chunk_size = chunk_size or PURGE_CHUNK_SIZE
+    duplicate_keys = list(
+        Place.objects.values('dedup_key')
+        .annotate(count=Count('pk'))
+        .filter(count__gt=1)
+        .values_list('dedup_key', flat=True)
+    )
+    deleted = 0
+    for start in range(0, len(duplicate_keys), chunk_size):
+        with transaction.atomic():
+            deleted += _merge_keys(duplicate_keys[start:start + chunk_size], chunk_size)
+    return len(duplicate_keys), deleted
+
+
+def _merge_keys(keys, chunk_size):
+    kept = {}
+    replaced_by = {}
+    places = Place.objects.filter(dedup_key__in=keys).order_by('dedup_key', 'pk')
+    for key, place_pk in places.values_list('dedup_key', 'pk'):
+        if key in kept:
+            replaced_by[place_pk] = kept[key]
+        else:
+            kept[key] = place_pk
+
+    duplicate_pks = sorted(replaced_by)
+    group_pks = set()
+    for start in range(0, len(duplicate_pks), chunk_size):
+        chunk = duplicate_pks[start:start + chunk_size]
+        memberships = Membership.objects.filter(place_id__in=chunk)
+        rows = list(memberships.values_list('group_id', 'place_id'))
+        moved = sorted(set((group_pk, replaced_by[place_pk]) for group_pk, place_pk in rows))
+        Membership.objects.bulk_create(
+            [Membership(group_id=group_pk, place_id=place_pk) for group_pk, place_pk in moved],
+            ignore_conflicts=True,
+        )
+        delete_rows(Membership, 'place_id', chunk)
+        group_pks.update(group_pk for group_pk, _ in rows)
+        # Memberships of duplicates go away together with their tombstones
+        record_memberships(Change.ADD, moved)
+
+    if group_pks:
+        bump_version_on_commit('group', *('group:%s' % pk for pk in group_pks))
+        touch_groups(group_pks)
+        # Kept places lie a bit off their duplicates and some groups had both
+        recompute_group_stats(group_pks)
+        transaction.on_commit(lambda: cluster_index.groups_changed(group_pks))
+    deleted = 0
+    for start in range(0, len(duplicate_pks), chunk_size):
+        deleted += delete_places(duplicate_pks[start:start + chunk_size])
+    return deleted
+
+
+def _purge_in_background(group_pk):
+    try:
+        purge_group(group_pk)
+    except Exception:
+        # Group stays marked as deleted, `manage.py gc_orphans` finishes it
+        logger.exception('Purging group %s failed', group_pk)
+    finally:
+        connection.close()
+
+
+def delete_group_in_background(group):
+    """
+    Hide group right away and purge it in background thread after commit.
+    """
+    hide_group(group.pk)
+    transaction.on_commit(
+        lambda: threading.Thread(target=_purge_in_background, args=(group.pk,), daemon=True).start()
+    )
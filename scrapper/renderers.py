@@ -0,0 +1,92 @@
+import numpy as np
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from scrapper.fastjson import COMPACT_FORMAT, dumps
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSON renderer giving the same bytes as DRF's one, but faster.
+    Indented output is left to DRF's renderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.ensure_ascii or not self.compact or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+class CompactJSONRenderer(FastJSONRenderer):
+    """
+    Renderer selected with `?format=compact`, views supporting it respond
+    with header row followed by arrays of values instead of objects.
+    """
+    format = COMPACT_FORMAT
+    compact_rows = True
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    MessagePack renderer, floats are written as binary doubles instead of being formatted.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, use_bin_type=True, default=str)
+
+
+class PlaceColumnsRenderer(BaseRenderer):
+    """
+    Binary renderer of place lists as three contiguous little-endian arrays,
+    int64 ids followed by float64 latitudes and float64 longitudes.
+
+    Each array holds `X-Row-Count` items, so NumPy loads them with `frombuffer`
+    without copying. Pages of paginated lists are linked by `Link` header.
+    Data which is not a list of places, like errors, is rendered as JSON.
+    """
+    media_type = 'application/x-place-columns'
+    format = 'columns'
+    charset = None
+    render_style = 'binary'
+    compact_rows = True
+    # Views supporting this renderer select exactly these fields
+    fields = ('id', 'latitude', 'longitude')
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        rows = data
+        links = []
+        if isinstance(data, dict) and 'results' in data:
+            rows = data['results']
+            links = ['<%s>; rel="%s"' % (data[rel], rel) for rel in ('next', 'previous') if data.get(rel)]
+
+        if not isinstance(rows, list) or not rows or list(rows[0]) != list(self.fields):
+            if response is not None:
+                response['Content-Type'] = 'application/json'
+            return b'' if data is None else dumps(data)
+
+        rows = rows[1:]
+        count = len(rows)
+        ids = np.fromiter((row[0] for row in rows), dtype='<i8', count=count)
+        coordinates = np.array(rows, dtype='<f8').reshape(count, len(self.fields))
+        if response is not None:
+            response['X-Row-Count'] = str(count)
+            if links:
+                response['Link'] = ', '.join(links)
+        return ids.tobytes() + coordinates[:, 1].tobytes() + coordinates[:, 2].tobytes()
+
+
+# Binary renderers offered by place lists next to the default ones
+PLACE_EXPORT_RENDERERS = ((MessagePackRenderer,) if msgpack is not None else ()) + (PlaceColumnsRenderer,)
@@ -0,0 +1,462 @@
+import asyncio
+import json
+import logging
+import random
+import ssl
+import time
+import zlib
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils.http import parse_http_date_safe
+
+from scrapper.bulk import BULK_BATCH_SIZE, find_place_pks, upsert_places, validate_place_data
+from scrapper.membership import add_places
+
+logger = logging.getLogger(__name__)
+
+# Number of pages fetched at once, which is also the size of connection pool
+SCRAPE_CONCURRENCY = getattr(settings, 'SCRAPPER_SCRAPE_CONCURRENCY', 16)
+
+# Requests per second allowed to single host and number of requests which
+# may be sent at once after idle period
+SCRAPE_RATE = getattr(settings, 'SCRAPPER_SCRAPE_RATE', 10)
+SCRAPE_BURST = getattr(settings, 'SCRAPPER_SCRAPE_BURST', 20)
+
+# Retries of failed request and delay before the first of them, doubled with every next one
+SCRAPE_RETRIES = getattr(settings, 'SCRAPPER_SCRAPE_RETRIES', 5)
+SCRAPE_BACKOFF = getattr(settings, 'SCRAPPER_SCRAPE_BACKOFF', 0.5)
+
+# Longest wait for retry asked by source with Retry-After header
+SCRAPE_MAX_RETRY_AFTER = getattr(settings, 'SCRAPPER_SCRAPE_MAX_RETRY_AFTER', 60)
+
+# Seconds to wait for single response
+SCRAPE_TIMEOUT = getattr(settings, 'SCRAPPER_SCRAPE_TIMEOUT', 30)
+
+# Redirects followed per request
+SCRAPE_MAX_REDIRECTS = getattr(settings, 'SCRAPPER_SCRAPE_MAX_REDIRECTS', 5)
+
+# Access token added to source URLs of Graph API
+GRAPH_ACCESS_TOKEN = getattr(settings, 'SCRAPPER_GRAPH_ACCESS_TOKEN', None)
+
+# Statuses of responses worth retrying
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+Response = namedtuple('Response', 'status headers body')
+
+PLACE_DATA_FIELDS = ('city', 'country', 'latitude', 'longitude')
+
+
+class HTTPProtocolError(Exception):
+    pass
+
+
+class FetchError(Exception):
+    """
+    Page could not be fetched, not even after retries.
+    """
+
+
+class TokenBucket(object):
+    """
+    Allow `rate` acquisitions per second on average and `burst` at once.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        # Waiters are served in order, each sleeping until its token refills
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ConnectionPool(object):
+    """
+    Minimal HTTP/1.1 client keeping connections alive between requests.
+
+    At most `size` requests are in flight and at most `size` connections
+    are open at once, idle connections of other hosts are closed to make room.
+    """
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(size)
+        self._idle = defaultdict(list)
+        self._open = 0
+        self._ssl = None
+
+    async def _connect(self, key):
+        scheme, host, port = key
+        if self._open >= self.size:
+            for connections_of_host in self._idle.values():
+                if connections_of_host:
+                    self._close(connections_of_host.pop())
+                    break
+        if scheme == 'https' and self._ssl is None:
+            self._ssl = ssl.create_default_context()
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=self._ssl if scheme == 'https' else None),
+            self.timeout,
+        )
+        self._open += 1
+        return reader, writer
+
+    def _close(self, connection):
+        connection[1].close()
+        self._open -= 1
+
+    async def request(self, url, headers=()):
+        """
+        Send GET request and read whole response.
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise HTTPProtocolError('Unsupported URL scheme: %s' % url)
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+
+        async with self._semaphore:
+            while True:
+                reused = bool(self._idle[key])
+                connection = self._idle[key].pop() if reused else await self._connect(key)
+                try:
+                    response, keep_alive = await asyncio.wait_for(
+                        self._exchange(connection, parts, headers), self.timeout)
+                except (ConnectionError, asyncio.IncompleteReadError, HTTPProtocolError):
+                    self._close(connection)
+                    # Server might have closed idle connection in the meantime
+                    if reused:
+                        continue
+                    raise
+                except BaseException:
+                    self._close(connection)
+                    raise
+                if keep_alive:
+                    self._idle[key].append(connection)
+                else:
+                    self._close(connection)
+                return response
+
+    async def _exchange(self, connection, parts, headers):
+        reader, writer = connection
+        target = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        lines = [
+            'GET %s HTTP/1.1' % target,
+            'Host: %s' % parts.netloc,
+            'Connection: keep-alive',
+            'Accept: application/json',
+            'Accept-Encoding: gzip',
+            'User-Agent: FbScrapper',
+        ]
+        lines.extend('%s: %s' % header for header in headers)
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError('Connection closed by server')
+        try:
+            version, status = status_line.decode('latin-1').split(None, 2)[:2]
+            status = int(status)
+        except ValueError:
+            raise HTTPProtocolError('Invalid status line: %r' % status_line)
+
+        response_headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        keep_alive = version == 'HTTP/1.1' and response_headers.get('connection', '').lower() != 'close'
+        if 'chunked' in response_headers.get('transfer-encoding', '').lower():
+            body = await self._read_chunked(reader)
+        elif 'content-length' in response_headers:
+            body = await reader.readexactly(int(response_headers['content-length']))
+        else:
+            body = await reader.read()
+            keep_alive = False
+        if response_headers.get('content-encoding', '').lower() == 'gzip':
+            try:
+                body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+            except zlib.error as exc:
+                raise HTTPProtocolError('Invalid gzip body - %s' % exc)
+        return Response(status, response_headers, body), keep_alive
+
+    async def _read_chunked(self, reader):
+        chunks = []
+        while True:
+            size_line = await reader.readline()
+            try:
+                size = int(size_line.split(b';')[0], 16)
+            except ValueError:
+                raise HTTPProtocolError('Invalid chunk size: %r' % size_line)
+            if not size:
+                # Skip trailers
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return b''.join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+
+    def close(self):
+        for connections_of_host in self._idle.values():
+            while connections_of_host:
+                self._close(connections_of_host.pop())
+
+
+def with_query(url, **params):
+    """
+    Set query parameters of URL which it does not have yet.
+    """
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    present = set(name for name, _ in query)
+    query.extend((name, value) for name, value in params.items() if value is not None and name not in present)
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def retry_after_delay(value, now=None):
+    """
+    Get seconds to wait from Retry-After header, given as number of seconds
+    or HTTP date. Returns None for invalid value.
+    """
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    timestamp = parse_http_date_safe(value)
+    if timestamp is None:
+        return None
+    return max(0, timestamp - (time.time() if now is None else now))
+
+
+def redact_url(url):
+    """
+    Hide access token of URL written to logs and errors.
+    """
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if not any(name == 'access_token' for name, _ in query):
+        return url
+    query = [(name, 'REDACTED' if name == 'access_token' else value) for name, value in query]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def next_page_url(url, payload):
+    """
+    Get URL of page following Graph API response, from `paging.next` or `paging.cursors.after`.
+    """
+    paging = payload.get('paging') or {}
+    if paging.get('next'):
+        return paging['next']
+    after = (paging.get('cursors') or {}).get('after')
+    if after and payload.get('data'):
+        parts = urlsplit(url)
+        query = [(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True) if name != 'after']
+        query.append(('after', after))
+        return urlunsplit(parts._replace(query=urlencode(query)))
+    return None
+
+
+def place_data(record):
+    """
+    Get place fields of Graph API place, having them nested in `location`, or of flat record.
+    """
+    if not isinstance(record, dict):
+        return record
+    location = record.get('location')
+    if isinstance(location, dict):
+        return {name: location[name] for name in PLACE_DATA_FIELDS if name in location}
+    return record
+
+
+class ScrapeStats(object):
+    def __init__(self):
+        self.pages = 0
+        self.failed_pages = 0
+        self.places = 0
+        self.invalid = 0
+        self.created = 0
+        self.updated = 0
+
+
+class Scraper(object):
+    """
+    Fetch pages of places from Graph API style source and save them.
+
+    Every source URL is followed page by page through its cursors, pages of
+    all sources are fetched concurrently. Places are saved in batches by
+    single writer thread, so fetching does not wait for the database.
+    """
+
+    def __init__(self, urls, group=None, access_token=None, page_size=None, max_pages=None,
+                 concurrency=None, rate=None, burst=None, retries=None, backoff=None,
+                 max_retry_after=None, timeout=None, batch_size=None):
+        self.urls = [with_query(url, limit=page_size) for url in urls]
+        # Added to URL when request is sent, so it does not end up in logs
+        self.access_token = access_token or GRAPH_ACCESS_TOKEN
+        self.group = group
+        self.max_pages = max_pages
+        self.concurrency = concurrency or SCRAPE_CONCURRENCY
+        self.rate = SCRAPE_RATE if rate is None else rate
+        self.burst = burst or SCRAPE_BURST
+        self.retries = SCRAPE_RETRIES if retries is None else retries
+        self.backoff = SCRAPE_BACKOFF if backoff is None else backoff
+        self.max_retry_after = SCRAPE_MAX_RETRY_AFTER if max_retry_after is None else max_retry_after
+        self.timeout = timeout or SCRAPE_TIMEOUT
+        self.batch_size = batch_size or BULK_BATCH_SIZE
+        self.stats = ScrapeStats()
+
+    def run(self):
+        """
+        Scrape all sources, returns ScrapeStats.
+        """
+        return asyncio.run(self.scrape())
+
+    async def scrape(self):
+        self.pool = ConnectionPool(self.concurrency, self.timeout)
+        self.buckets = defaultdict(lambda: TokenBucket(self.rate, self.burst))
+        pages = asyncio.Queue()
+        for url in self.urls:
+            pages.put_nowait((url, 1))
+        # Bounded, so fetching slows down when database cannot keep up
+        places = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        executor = ThreadPoolExecutor(max_workers=1)
+        writer = asyncio.ensure_future(self._write(places, executor))
+        fetchers = [asyncio.ensure_future(self._fetch(pages, places)) for _ in range(self.concurrency)]
+        try:
+            joined = asyncio.ensure_future(pages.join())
+            await asyncio.wait([joined, writer], return_when=asyncio.FIRST_COMPLETED)
+            if writer.done():
+                # Writer failed, fetchers would wait for it forever
+                joined.cancel()
+                writer.result()
+            await places.put(None)
+            await writer
+        finally:
+            for fetcher in fetchers:
+                fetcher.cancel()
+            writer.cancel()
+            self.pool.close()
+            await asyncio.get_event_loop().run_in_executor(executor, connections.close_all)
+            executor.shutdown()
+        return self.stats
+
+    async def fetch_json(self, url):
+        """
+        Fetch JSON document, retrying with exponential backoff on network
+        errors and on responses with statuses from RETRY_STATUSES.
+        """
+        bucket = self.buckets[urlsplit(url).netloc]
+        for attempt in range(self.retries + 1):
+            await bucket.acquire()
+            delay = None
+            try:
+                response = await self._request(url)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, HTTPProtocolError) as exc:
+                error = exc
+            else:
+                if response.status == 200:
+                    try:
+                        return json.loads(response.body.decode('utf-8'))
+                    except ValueError as exc:
+                        raise FetchError('Invalid JSON from %s - %s' % (redact_url(url), exc))
+                error = 'HTTP %d' % response.status
+                if response.status not in RETRY_STATUSES:
+                    raise FetchError('%s from %s' % (error, redact_url(url)))
+                delay = retry_after_delay(response.headers.get('retry-after', ''))
+            if attempt < self.retries:
+                if delay is None:
+                    delay = self.backoff * 2 ** attempt * (0.5 + random.random())
+                # Source must not park the worker for long
+                delay = min(delay, self.max_retry_after)
+                logger.info('Retrying %s in %.1fs after %s', redact_url(url), delay, error)
+                await asyncio.sleep(delay)
+        raise FetchError('%s from %s after %d retries' % (error, redact_url(url), self.retries))
+
+    async def _request(self, url):
+        """
+        Send request with access token, following redirects. Token is sent
+        to the host of given URL only, not to hosts it redirects to.
+        """
+        host = urlsplit(url).netloc
+        for _ in range(SCRAPE_MAX_REDIRECTS + 1):
+            same_host = urlsplit(url).netloc == host
+            response = await self.pool.request(with_query(url, access_token=self.access_token) if same_host else url)
+            location = response.headers.get('location')
+            if response.status not in REDIRECT_STATUSES or not location:
+                return response
+            url = urljoin(url, location)
+        raise HTTPProtocolError('More than %d redirects' % SCRAPE_MAX_REDIRECTS)
+
+    async def _fetch(self, pages, places):
+        while True:
+            url, number = await pages.get()
+            try:
+                payload = await self.fetch_json(url)
+                if not isinstance(payload, dict):
+                    raise FetchError('Expected an object from %s' % redact_url(url))
+                cleaned = []
+                for record in payload.get('data') or []:
+                    data, errors = validate_place_data(place_data(record))
+                    if errors:
+                        self.stats.invalid += 1
+                    else:
+                        cleaned.append(data)
+                self.stats.pages += 1
+                await places.put(cleaned)
+
+                next_url = next_page_url(url, payload)
+                if next_url and (self.max_pages is None or number < self.max_pages):
+                    pages.put_nowait((next_url, number + 1))
+            except FetchError as exc:
+                self.stats.failed_pages += 1
+                logger.warning('Skipping source page: %s', exc)
+            except Exception:
+                self.stats.failed_pages += 1
+                logger.exception('Processing %s failed', redact_url(url))
+            finally:
+                pages.task_done()
+
+    async def _write(self, places, executor):
+        loop = asyncio.get_event_loop()
+        batch = []
+        while True:
+            cleaned = await places.get()
+            if cleaned is not None:
+                batch.extend(cleaned)
+            while len(batch) >= self.batch_size or (cleaned is None and batch):
+                rows, batch = batch[:self.batch_size], batch[self.batch_size:]
+                await loop.run_in_executor(executor, self._save, rows)
+            if cleaned is None:
+                return
+
+    def _save(self, rows):
+        with transaction.atomic():
+            created, updated = upsert_places(rows, self.batch_size)
+            if self.group is not None:
+                add_places(self.group, find_place_pks(rows))
+        self.stats.places += len(rows)
+        self.stats.created += created
+        self.stats.updated += updated
@@ -0,0 +1,245 @@
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Min
+
+from scrapper.changes import ChangeLogWatch
+from scrapper.dedup import normalize_name
+from scrapper.models import Place
+
+# If prefix search is served from in-memory index instead of database
+SEARCH_IN_MEMORY = getattr(settings, 'SCRAPPER_SEARCH_IN_MEMORY', False)
+
+# Shortest prefix searched in database, shorter ones match too many places
+# to be counted quickly. In-memory index takes prefixes of any length.
+SEARCH_MIN_DATABASE_PREFIX = getattr(settings, 'SCRAPPER_SEARCH_MIN_DATABASE_PREFIX', 2)
+
+# Number of suggestions returned by default and at most
+SEARCH_LIMIT = getattr(settings, 'SCRAPPER_SEARCH_LIMIT', 10)
+SEARCH_MAX_LIMIT = getattr(settings, 'SCRAPPER_SEARCH_MAX_LIMIT', 100)
+
+# Number of keys added since build which are kept aside before arrays are rebuilt
+SEARCH_PENDING_THRESHOLD = getattr(settings, 'SCRAPPER_SEARCH_PENDING_THRESHOLD', 1000)
+
+# Seconds after which index is rebuilt in background if changes were logged meanwhile
+SEARCH_REBUILD_INTERVAL = getattr(settings, 'SCRAPPER_SEARCH_REBUILD_INTERVAL', 300)
+
+# Fields which can be searched
+SEARCH_FIELDS = ('city', 'country')
+
+# Values of place registered with in-memory index
+INDEXED_FIELDS = ('city_key', 'country_key', 'city', 'country')
+
+# Sorts after every string starting with the same prefix
+_MAX_CHAR = '\U0010ffff'
+
+
+def normalize_prefix(value):
+    """
+    Normalize searched prefix the same way as `city_key` and `country_key` of places.
+    """
+    return normalize_name(value)
+
+
+def _prefix_filter(field, prefix):
+    lookups = {field + '_key__startswith': prefix}
+    if connection.vendor == 'sqlite':
+        # SQLite does not use indexes for LIKE on case sensitive columns, but it does for ranges
+        lookups[field + '_key__gte'] = prefix
+        lookups[field + '_key__lt'] = prefix + _MAX_CHAR
+    return lookups
+
+
+def search_database(field, prefix, limit):
+    """
+    Find cities or countries starting with normalized prefix, most common first.
+    """
+    places = Place.objects.filter(**_prefix_filter(field, prefix))
+    if field == 'city':
+        rows = (places.values('city_key', 'country_key')
+                .annotate(places=Count('pk'), city_name=Min('city'), country_name=Min('country'))
+                .order_by('-places', 'city_key', 'country_key')[:limit])
+        return [OrderedDict([('city', row['city_name']), ('country', row['country_name']),
+                             ('places', row['places'])]) for row in rows]
+    rows = (places.values('country_key')
+            .annotate(places=Count('pk'), country_name=Min('country'))
+            .order_by('-places', 'country_key')[:limit])
+    return [OrderedDict([('country', row['country_name']), ('places', row['places'])]) for row in rows]
+
+
+class PrefixIndex(object):
+    """
+    Place counts of keys sorted for prefix search by their first item.
+
+    Keys and labels are kept in sorted list with counts in NumPy array, keys
+    added later are kept aside until there are enough of them to rebuild.
+    """
+
+    def __init__(self, entries):
+        # key -> [count, label] of keys added since build
+        self._pending = {}
+        self._build(entries)
+
+    def _build(self, entries):
+        keys = sorted(key for key in entries if key[0])
+        self.keys = keys
+        self.labels = [entries[key][1] for key in keys]
+        self.counts = np.array([entries[key][0] for key in keys], dtype=np.int64)
+        self.positions = {key: position for position, key in enumerate(keys)}
+        self._pending = {}
+
+    def add(self, key, label, delta):
+        if not key[0]:
+            return
+        position = self.positions.get(key)
+        if position is not None:
+            self.counts[position] += delta
+            return
+        entry = self._pending.setdefault(key, [0, label])
+        entry[0] += delta
+        if len(self._pending) >= SEARCH_PENDING_THRESHOLD:
+            entries = {key: [int(count), label] for key, count, label in zip(self.keys, self.counts, self.labels)}
+            entries.update(self._pending)
+            self._build(entries)
+
+    def search(self, prefix, limit):
+        """
+        Get (key, label, count) of keys starting with prefix, most common first.
+        """
+        start = bisect_left(self.keys, (prefix,))
+        end = bisect_left(self.keys, (prefix + _MAX_CHAR,))
+        counts = self.counts[start:end]
+        if len(counts) > limit:
+            # Keep every key tied with the last one, ties are ordered by key below
+            threshold = np.partition(counts, len(counts) - limit)[len(counts) - limit]
+            positions = np.flatnonzero(counts >= max(threshold, 1))
+        else:
+            positions = np.flatnonzero(counts > 0)
+        found = [(self.keys[start + position], self.labels[start + position], int(counts[position]))
+                 for position in positions.tolist()]
+        found.extend((key, label, count) for key, (count, label) in self._pending.items()
+                     if count > 0 and key[0].startswith(prefix))
+        found.sort(key=lambda item: (-item[2], item[0]))
+        return found[:limit]
+
+
+class PlaceSearchIndex(object):
+    """
+    In-memory prefix search over cities and countries of places.
+
+    Place counts are built from database and then kept up to date by signals
+    from scrapper.signals. Changes which were not registered one by one, like
+    bulk inserts, or which were made by other processes and are known from
+    the change log only, make the index rebuild in background.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._indexes = None
+        self._stale = False
+        self._rebuilding = False
+        # Changes registered during rebuild, replayed on the new index
+        self._replay = None
+        self._log = ChangeLogWatch(SEARCH_REBUILD_INTERVAL)
+
+    @property
+    def is_tracking(self):
+        """
+        Check if changes of places have to be registered, which is once index is being built.
+        """
+        return self._indexes is not None or self._replay is not None
+
+    def rebuild(self):
+        """
+        Count places of every city and country in database and swap in new index.
+        """
+        with self._lock:
+            self._stale = False
+            self._replay = []
+            self._log.reset()
+        cities, countries = {}, {}
+        rows = (Place.objects.values('city_key', 'country_key')
+                .annotate(places=Count('pk'), city_name=Min('city'), country_name=Min('country'))
+                .order_by())
+        for row in rows:
+            cities[row['city_key'], row['country_key']] = [row['places'], (row['city_name'], row['country_name'])]
+            entry = countries.setdefault((row['country_key'],), [0, (row['country_name'],)])
+            entry[0] += row['places']
+        indexes = {'city': PrefixIndex(cities), 'country': PrefixIndex(countries)}
+        with self._lock:
+            for args in self._replay:
+                self._apply(indexes, *args)
+            self._replay = None
+            self._indexes = indexes
+
+    def mark_stale(self):
+        """
+        Schedule rebuild, until then queries are served from current index.
+        """
+        self._stale = True
+
+    def place_changed(self, old, new):
+        """
+        Move place from old to new `(city_key, country_key, city, country)`,
+        either can be None for created or deleted place.
+        """
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append((old, new))
+            if self._indexes is not None:
+                self._apply(self._indexes, old, new)
+
+    def _apply(self, indexes, old, new):
+        for values, delta in ((old, -1), (new, 1)):
+            if values is None:
+                continue
+            city_key, country_key, city, country = values
+            indexes['city'].add((city_key, country_key), (city, country), delta)
+            indexes['country'].add((country_key,), (country,), delta)
+
+    def search(self, field, prefix, limit):
+        """
+        Find cities or countries starting with normalized prefix, most common first.
+        """
+        if self._indexes is None:
+            self.rebuild()
+        with self._lock:
+            if self._log.changed():
+                self._stale = True
+            if self._stale and not self._rebuilding:
+                self._rebuilding = True
+                threading.Thread(target=self._background_rebuild, daemon=True).start()
+            found = self._indexes[field].search(prefix, limit)
+        if field == 'city':
+            return [OrderedDict([('city', city), ('country', country), ('places', count)])
+                    for _, (city, country), count in found]
+        return [OrderedDict([('country', country), ('places', count)]) for _, (country,), count in found]
+
+    def _background_rebuild(self):
+        try:
+            self.rebuild()
+        finally:
+            self._rebuilding = False
+            connection.close()
+
+
+def search_places(field, prefix, limit=None):
+    """
+    Find cities or countries starting with prefix, most common first.
+    Raises ValueError if prefix is too short to be searched in database.
+    """
+    limit = limit or SEARCH_LIMIT
+    prefix = normalize_prefix(prefix)
+    if SEARCH_IN_MEMORY:
+        return search_index.search(field, prefix, limit)
+    if len(prefix) < SEARCH_MIN_DATABASE_PREFIX:
+        raise ValueError('Ensure this field has at least %d characters.' % SEARCH_MIN_DATABASE_PREFIX)
+    return search_database(field, prefix, limit)
+
+
+# Process wide index kept in sync by signals from scrapper.signals
+search_index = PlaceSearchIndex()
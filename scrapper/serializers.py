@@ -1,15 +1,64 @@
+import math
+from collections import OrderedDict
+
 from rest_framework import serializers
 
-from scrapper.models import Place, Group
+from scrapper.metrics import timed
+from scrapper.models import Place, Group, GroupStats
+
+
+class TimedSerializerMixin(object):
+    """
+    Count building of serializer's data as serialization time of measured request.
+    """
+
+    @property
+    def data(self):
+        with timed('serialize'):
+            return super().data
 
 
-class PlaceSerializer(serializers.ModelSerializer):
+def validate_finite(value):
+    """
+    Reject NaN and infinities, which cannot be placed on map.
+    """
+    if not math.isfinite(value):
+        raise serializers.ValidationError(serializers.FloatField.default_error_messages['invalid'])
+    return value
+
+
+class PlaceSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Place
         fields = ('id', 'city', 'country', 'latitude', 'longitude')
 
+    def validate_latitude(self, value):
+        return validate_finite(value)
+
+    def validate_longitude(self, value):
+        return validate_finite(value)
 
-class GroupSerializer(serializers.ModelSerializer):
+
+class GroupSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Group
         fields = ('id', 'name', 'places')
+
+
+class GroupStatsSerializer(serializers.ModelSerializer):
+    centroid = serializers.SerializerMethodField()
+    bbox = serializers.SerializerMethodField()
+
+    class Meta:
+        model = GroupStats
+        fields = ('places', 'centroid', 'bbox')
+
+    def get_centroid(self, stats):
+        centroid = stats.centroid
+        if centroid is None:
+            return None
+        return OrderedDict([('latitude', centroid[0]), ('longitude', centroid[1])])
+
+    def get_bbox(self, stats):
+        bbox = stats.bbox
+        return list(bbox) if bbox is not None else None
@@ -0,0 +1,147 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from scrapper.caching import bump_version_on_commit
+from scrapper.changes import record, record_memberships, touch_groups
+from scrapper.clusters import cluster_index
+from scrapper.geocoding import GEOCODE_ON_SAVE, fill_place
+from scrapper.models import Change, Group, GroupStats, Place
+from scrapper.search import INDEXED_FIELDS, search_index
+from scrapper.spatial import place_index
+from scrapper.stats import (
+    Membership, existing_memberships, place_points, places_moved, points_added, points_removed,
+)
+
+# Values of saved place read before it is updated
+_OLD_FIELDS = ('latitude', 'longitude') + INDEXED_FIELDS
+
+_MEMBERSHIP_ACTIONS = {
+    'post_add': Change.ADD,
+    'post_remove': Change.REMOVE,
+    'post_clear': Change.REMOVE,
+}
+
+
+@receiver(pre_save, sender=Place)
+def place_saving(sender, instance, raw=False, **kwargs):
+    # Fixtures are loaded as they are
+    if GEOCODE_ON_SAVE and not raw:
+        fill_place(instance)
+    old = None
+    if instance.pk is not None:
+        old = Place.objects.filter(pk=instance.pk).values_list(*_OLD_FIELDS).first()
+    # Stats of place's groups are moved to its new coordinates after save
+    instance._old_point = old[:2] if old is not None else None
+    if search_index.is_tracking:
+        # Count of place's previous city and country is decremented after save
+        instance._search_old = old[2:] if old is not None else None
+
+
+@receiver(post_save, sender=Place)
+def place_saved(sender, instance, **kwargs):
+    pk, latitude, longitude = instance.pk, instance.latitude, instance.longitude
+    transaction.on_commit(lambda: place_index.place_changed(pk, latitude, longitude))
+    transaction.on_commit(lambda: cluster_index.place_changed(pk, latitude, longitude))
+    if hasattr(instance, '_search_old'):
+        old, new = instance._search_old, tuple(getattr(instance, name) for name in INDEXED_FIELDS)
+        del instance._search_old
+        transaction.on_commit(lambda: search_index.place_changed(old, new))
+    old_point = getattr(instance, '_old_point', None)
+    if old_point is not None and old_point != (latitude, longitude):
+        places_moved({pk: (old_point, (latitude, longitude))})
+    instance._old_point = None
+    bump_version_on_commit('place')
+    record(Change.PLACE, Change.UPSERT, [pk])
+
+
+@receiver(pre_delete, sender=Place)
+def place_deleting(sender, instance, **kwargs):
+    # Memberships are gone by post_delete
+    instance._group_pks = list(Membership.objects.filter(place_id=instance.pk).values_list('group_id', flat=True))
+
+
+@receiver(post_delete, sender=Place)
+def place_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    points_removed(getattr(instance, '_group_pks', ()), [(instance.latitude, instance.longitude)])
+    transaction.on_commit(lambda: place_index.place_deleted(pk))
+    transaction.on_commit(lambda: cluster_index.place_deleted(pk))
+    if search_index.is_tracking:
+        old = tuple(getattr(instance, name) for name in INDEXED_FIELDS)
+        transaction.on_commit(lambda: search_index.place_changed(old, None))
+    bump_version_on_commit('place')
+    record(Change.PLACE, Change.DELETE, [pk])
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created=False, raw=False, **kwargs):
+    # Stats of groups loaded from fixtures are computed when first read
+    if created and not raw:
+        GroupStats.objects.create(group=instance)
+    bump_version_on_commit('group', 'group:%s' % instance.pk)
+    record(Change.GROUP, Change.UPSERT, [instance.pk])
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: cluster_index.groups_changed([pk]))
+    bump_version_on_commit('group', 'group:%s' % instance.pk)
+    # Groups marked as deleted got their tombstone already, see scrapper.purge
+    if not instance.deleted:
+        record(Change.GROUP, Change.DELETE, [instance.pk])
+
+
+@receiver(m2m_changed, sender=Group.places.through)
+def group_places_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action == 'pre_clear':
+            instance._cleared_place_pks = list(instance.places.values_list('pk', flat=True))
+        elif action == 'pre_remove':
+            # Places which are not in group are removed too
+            instance._removed_place_pks = [
+                place_pk for _, place_pk in existing_memberships([instance.pk], pk_set)]
+        elif action in _MEMBERSHIP_ACTIONS:
+            if action == 'post_clear':
+                pk_set = getattr(instance, '_cleared_place_pks', [])
+            group_pk = instance.pk
+            if action == 'post_add':
+                changed = pk_set
+                points = place_points(changed)
+                points_added([group_pk], list(points.values()))
+            else:
+                changed = pk_set if action == 'post_clear' else getattr(instance, '_removed_place_pks', pk_set)
+                points_removed([group_pk], list(place_points(changed).values()))
+                points = dict.fromkeys(changed)
+            if not changed:
+                return
+            transaction.on_commit(lambda: cluster_index.memberships_changed(group_pk, points))
+            bump_version_on_commit('group', 'group:%s' % group_pk)
+            record_memberships(_MEMBERSHIP_ACTIONS[action], ((group_pk, pk) for pk in sorted(changed)))
+            touch_groups([group_pk])
+        return
+
+    # Groups changed from place's side
+    if action == 'pre_clear':
+        instance._cleared_group_pks = list(instance.groups.values_list('pk', flat=True))
+    elif action == 'pre_remove':
+        instance._removed_group_pks = [group_pk for group_pk, _ in existing_memberships(pk_set, [instance.pk])]
+    elif action in _MEMBERSHIP_ACTIONS:
+        if action == 'post_clear':
+            pk_set = getattr(instance, '_cleared_group_pks', [])
+        place_pk, point = instance.pk, (instance.latitude, instance.longitude)
+        if action == 'post_add':
+            changed = pk_set
+            points_added(changed, [point])
+        else:
+            changed = pk_set if action == 'post_clear' else getattr(instance, '_removed_group_pks', pk_set)
+            points_removed(changed, [point])
+            point = None
+        if not changed:
+            return
+        transaction.on_commit(lambda: [cluster_index.memberships_changed(group_pk, {place_pk: point})
+                                       for group_pk in changed])
+        bump_version_on_commit('group', *('group:%s' % pk for pk in changed))
+        record_memberships(_MEMBERSHIP_ACTIONS[action], ((pk, place_pk) for pk in sorted(changed)))
+        touch_groups(changed)
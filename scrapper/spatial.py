@@ -0,0 +1,318 @@
+import heapq
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from scrapper.changes import ChangeLogWatch
+from scrapper.models import Place
+from scrapper.streaming import iterate_in_chunks
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Number of points in single leaf of the KD-tree
+LEAF_SIZE = getattr(settings, 'SCRAPPER_SPATIAL_LEAF_SIZE', 64)
+
+# Number of changes kept aside of the tree before it is rebuilt
+REBUILD_THRESHOLD = getattr(settings, 'SCRAPPER_SPATIAL_REBUILD_THRESHOLD', 10000)
+
+# Seconds after which tree is rebuilt in background if changes were logged meanwhile
+REBUILD_INTERVAL = getattr(settings, 'SCRAPPER_SPATIAL_REBUILD_INTERVAL', 300)
+
+
+def to_unit_vectors(latitudes, longitudes):
+    """
+    Convert coordinates in degrees into points on unit sphere.
+    """
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon = np.radians(np.asarray(longitudes, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def chord_to_km(squared_chord):
+    """
+    Convert squared chord length between unit vectors into great-circle distance.
+    """
+    chord = np.sqrt(np.asarray(squared_chord))
+    return 2 * np.arcsin(np.minimum(chord / 2, 1.0)) * EARTH_RADIUS_KM
+
+
+def km_to_squared_chord(distance_km):
+    """
+    Convert great-circle distance into squared chord length between unit vectors.
+    """
+    angle = min(distance_km / EARTH_RADIUS_KM, np.pi)
+    return (2 * np.sin(angle / 2)) ** 2
+
+
+class KDTree(object):
+    """
+    Static KD-tree over points on unit sphere.
+
+    Points are reordered so every node covers contiguous slice of arrays.
+    Points can be masked out with `remove`, but not added.
+    """
+
+    def __init__(self, ids, points, leaf_size=LEAF_SIZE):
+        ids = np.asarray(ids, dtype=np.int64)
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        order = np.arange(len(ids))
+        lows, highs, starts, ends, lefts, rights = [], [], [], [], [], []
+
+        def add_node(start, end):
+            node_points = points[order[start:end]]
+            if end > start:
+                lows.append(node_points.min(axis=0))
+                highs.append(node_points.max(axis=0))
+            else:
+                lows.append(np.full(3, np.inf))
+                highs.append(np.full(3, -np.inf))
+            starts.append(start)
+            ends.append(end)
+            lefts.append(-1)
+            rights.append(-1)
+            return len(starts) - 1
+
+        stack = [add_node(0, len(ids))]
+        while stack:
+            node = stack.pop()
+            start, end = starts[node], ends[node]
+            if end - start <= leaf_size:
+                continue
+            axis = int(np.argmax(highs[node] - lows[node]))
+            mid = (start + end) // 2
+            segment = order[start:end]
+            order[start:end] = segment[np.argpartition(points[segment, axis], mid - start)]
+            lefts[node] = add_node(start, mid)
+            rights[node] = add_node(mid, end)
+            stack.extend((lefts[node], rights[node]))
+
+        self.ids = ids[order]
+        self.points = points[order]
+        self.alive = np.ones(len(ids), dtype=bool)
+        self.positions = dict(zip(self.ids.tolist(), range(len(ids))))
+        self.lows = np.array(lows)
+        self.highs = np.array(highs)
+        self.starts = starts
+        self.ends = ends
+        self.lefts = lefts
+        self.rights = rights
+
+    def __len__(self):
+        return int(self.alive.sum())
+
+    def remove(self, place_id):
+        position = self.positions.get(place_id)
+        if position is not None:
+            self.alive[position] = False
+
+    def _box_distances(self, nodes, point):
+        """
+        Get squared distances from point to bounding boxes of given nodes.
+        """
+        gap = np.maximum(np.maximum(self.lows[nodes] - point, point - self.highs[nodes]), 0)
+        return (gap * gap).sum(axis=1)
+
+    def _leaf_distances(self, node, point):
+        start, end = self.starts[node], self.ends[node]
+        diff = self.points[start:end] - point
+        distances = (diff * diff).sum(axis=1)
+        distances[~self.alive[start:end]] = np.inf
+        return distances, start
+
+    def nearest(self, point, k):
+        """
+        Get squared chord distances and ids of k points nearest to given one.
+        """
+        best_distances = np.empty(0)
+        best_ids = np.empty(0, dtype=np.int64)
+        worst = np.inf
+        heap = [(0.0, 0)]
+        while heap:
+            distance, node = heapq.heappop(heap)
+            if distance > worst:
+                break
+            if self.lefts[node] < 0:
+                distances, start = self._leaf_distances(node, point)
+                found = np.isfinite(distances)
+                best_distances = np.concatenate([best_distances, distances[found]])
+                best_ids = np.concatenate([best_ids, self.ids[start:start + len(distances)][found]])
+                if len(best_distances) > k:
+                    keep = np.argpartition(best_distances, k - 1)[:k]
+                    best_distances, best_ids = best_distances[keep], best_ids[keep]
+                if len(best_distances) == k:
+                    worst = best_distances.max()
+                continue
+            children = [self.lefts[node], self.rights[node]]
+            for child, child_distance in zip(children, self._box_distances(children, point)):
+                if child_distance <= worst:
+                    heapq.heappush(heap, (float(child_distance), child))
+        return best_distances, best_ids
+
+    def within(self, point, squared_chord):
+        """
+        Get squared chord distances and ids of points not further than given one.
+        """
+        found_distances, found_ids = [], []
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if self.lefts[node] < 0:
+                distances, start = self._leaf_distances(node, point)
+                found = distances <= squared_chord
+                found_distances.append(distances[found])
+                found_ids.append(self.ids[start:start + len(distances)][found])
+                continue
+            children = [self.lefts[node], self.rights[node]]
+            for child, child_distance in zip(children, self._box_distances(children, point)):
+                if child_distance <= squared_chord:
+                    stack.append(child)
+        if not found_ids:
+            return np.empty(0), np.empty(0, dtype=np.int64)
+        return np.concatenate(found_distances), np.concatenate(found_ids)
+
+
+class PlaceSpatialIndex(object):
+    """
+    Nearest neighbour and radius search over places' coordinates.
+
+    Places are kept in KD-tree which is rebuilt from database from time to time.
+    Changes made in the meantime are kept aside as small overlay searched by
+    brute force, places changed or deleted since build are masked out of the tree.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._tree = None
+        self._building = False
+        self._rebuilding = False
+        self._stale = False
+        self._log = ChangeLogWatch(REBUILD_INTERVAL)
+        # place id -> (sequence number, unit vector or None if deleted)
+        self._changes = {}
+        self._sequence = 0
+        self._overlay = None
+
+    @property
+    def is_built(self):
+        return self._tree is not None
+
+    def rebuild(self):
+        """
+        Build new tree from database and swap it in.
+        Changes registered during build are carried over to the new tree.
+        """
+        with self._lock:
+            sequence = self._sequence
+            self._stale = False
+            self._building = True
+            self._log.reset()
+        ids, latitudes, longitudes = [], [], []
+        for rows in iterate_in_chunks(Place.objects.all(), ('pk', 'latitude', 'longitude')):
+            for pk, latitude, longitude in rows:
+                ids.append(pk)
+                latitudes.append(latitude)
+                longitudes.append(longitude)
+        tree = KDTree(ids, to_unit_vectors(latitudes, longitudes))
+        with self._lock:
+            self._changes = {pk: change for pk, change in self._changes.items() if change[0] > sequence}
+            for pk in self._changes:
+                tree.remove(pk)
+            self._tree = tree
+            self._overlay = None
+            self._building = False
+
+    def mark_stale(self):
+        """
+        Schedule rebuild after changes which were not registered one by one,
+        like bulk inserts. Until then queries are served from current tree.
+        """
+        self._stale = True
+
+    def place_changed(self, place_id, latitude, longitude):
+        self._register(place_id, to_unit_vectors(latitude, longitude))
+
+    def place_deleted(self, place_id):
+        self._register(place_id, None)
+
+    def _register(self, place_id, point):
+        with self._lock:
+            if self._tree is None and not self._building:
+                # Nothing to keep in sync, tree is built from database anyway
+                return
+            self._sequence += 1
+            self._changes[place_id] = (self._sequence, point)
+            self._overlay = None
+            if self._tree is not None:
+                self._tree.remove(place_id)
+
+    def _snapshot(self):
+        """
+        Get the tree and overlay arrays consistent with each other.
+        Builds the tree on first use and schedules rebuild when it is due.
+        """
+        if self._tree is None:
+            self.rebuild()
+        with self._lock:
+            if self._overlay is None:
+                live = [(pk, point) for pk, (_, point) in self._changes.items() if point is not None]
+                self._overlay = (
+                    np.array([pk for pk, _ in live], dtype=np.int64),
+                    np.array([point for _, point in live], dtype=np.float64).reshape(-1, 3),
+                )
+            if self._rebuild_due():
+                self._rebuilding = True
+                threading.Thread(target=self._background_rebuild, daemon=True).start()
+            return self._tree, self._overlay
+
+    def _rebuild_due(self):
+        if self._rebuilding:
+            return False
+        # Places changed by other processes are known from the change log only
+        return self._stale or len(self._changes) >= REBUILD_THRESHOLD or self._log.changed()
+
+    def _background_rebuild(self):
+        from django.db import connection
+        try:
+            self.rebuild()
+        finally:
+            self._rebuilding = False
+            connection.close()
+
+    def nearest(self, latitude, longitude, k):
+        """
+        Find k places nearest to given point.
+        Returns list of (place id, distance in km) tuples, nearest first.
+        """
+        point = to_unit_vectors(latitude, longitude)
+        tree, (overlay_ids, overlay_points) = self._snapshot()
+        distances, ids = tree.nearest(point, k)
+        if len(overlay_ids):
+            diff = overlay_points - point
+            distances = np.concatenate([distances, (diff * diff).sum(axis=1)])
+            ids = np.concatenate([ids, overlay_ids])
+        order = np.argsort(distances, kind='stable')[:k]
+        return list(zip(ids[order].tolist(), chord_to_km(distances[order]).tolist()))
+
+    def within(self, latitude, longitude, radius_km, limit=None):
+        """
+        Find places not further than radius from given point.
+        Returns list of (place id, distance in km) tuples, nearest first.
+        """
+        point = to_unit_vectors(latitude, longitude)
+        squared_chord = km_to_squared_chord(radius_km)
+        tree, (overlay_ids, overlay_points) = self._snapshot()
+        distances, ids = tree.within(point, squared_chord)
+        if len(overlay_ids):
+            diff = overlay_points - point
+            overlay_distances = (diff * diff).sum(axis=1)
+            found = overlay_distances <= squared_chord
+            distances = np.concatenate([distances, overlay_distances[found]])
+            ids = np.concatenate([ids, overlay_ids[found]])
+        order = np.argsort(distances, kind='stable')[:limit]
+        return list(zip(ids[order].tolist(), chord_to_km(distances[order]).tolist()))
+
+
+# Process wide index kept in sync by signals from scrapper.signals
+place_index = PlaceSpatialIndex()
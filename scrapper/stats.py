@@ -0,0 +1,183 @@
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, Min, Q, Value
+from django.db.models.functions import Coalesce, Greatest, Least
+
+from scrapper.models import Group, GroupStats, Place
+from scrapper.spatial import to_unit_vectors
+
+# Number of groups recomputed together and of ids passed to single `IN (...)`
+# lookup, it must fit in SQLite's limit of 999 query variables
+STATS_CHUNK_SIZE = getattr(settings, 'SCRAPPER_STATS_CHUNK_SIZE', 500)
+
+Membership = Group.places.through
+
+_BBOX_FIELDS = ('min_latitude', 'max_latitude', 'min_longitude', 'max_longitude')
+
+
+def _chunks(items, size=None):
+    items = list(items)
+    size = size or STATS_CHUNK_SIZE
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def summarize(group_pks, latitudes, longitudes):
+    """
+    Compute stats of groups from coordinates of their places, given as parallel
+    sequences with one item per membership. Returns dict of group id -> dict
+    of GroupStats field values, groups without places are left out.
+    """
+    group_pks = np.asarray(group_pks, dtype=np.int64)
+    if not len(group_pks):
+        return {}
+    order = np.argsort(group_pks, kind='stable')
+    group_pks = group_pks[order]
+    latitudes = np.asarray(latitudes, dtype=np.float64)[order]
+    longitudes = np.asarray(longitudes, dtype=np.float64)[order]
+    groups, starts, counts = np.unique(group_pks, return_index=True, return_counts=True)
+    sums = np.add.reduceat(to_unit_vectors(latitudes, longitudes), starts, axis=0)
+    columns = zip(
+        groups.tolist(), counts.tolist(), sums.tolist(),
+        np.minimum.reduceat(latitudes, starts).tolist(), np.maximum.reduceat(latitudes, starts).tolist(),
+        np.minimum.reduceat(longitudes, starts).tolist(), np.maximum.reduceat(longitudes, starts).tolist(),
+    )
+    return {
+        group_pk: {'places': count, 'x': x, 'y': y, 'z': z, 'min_latitude': min_lat, 'max_latitude': max_lat,
+                   'min_longitude': min_lon, 'max_longitude': max_lon}
+        for group_pk, count, (x, y, z), min_lat, max_lat, min_lon, max_lon in columns
+    }
+
+
+def place_points(place_pks):
+    """
+    Get dict of place id -> (latitude, longitude) of places with given ids.
+    """
+    points = {}
+    for chunk in _chunks(sorted(place_pks)):
+        rows = Place.objects.filter(pk__in=chunk).values_list('pk', 'latitude', 'longitude')
+        points.update((pk, (latitude, longitude)) for pk, latitude, longitude in rows)
+    return points
+
+
+def existing_memberships(group_pks, place_pks):
+    """
+    Get set of (group id, place id) pairs of given groups and places which exist.
+    """
+    group_pks, place_pks = sorted(set(group_pks)), sorted(set(place_pks))
+    if len(group_pks) > len(place_pks):
+        chunks = (Membership.objects.filter(place_id__in=place_pks, group_id__in=chunk)
+                  for chunk in _chunks(group_pks))
+    else:
+        chunks = (Membership.objects.filter(group_id__in=group_pks, place_id__in=chunk)
+                  for chunk in _chunks(place_pks))
+    pairs = set()
+    for memberships in chunks:
+        pairs.update(memberships.values_list('group_id', 'place_id'))
+    return pairs
+
+
+def _summary(points):
+    if not points:
+        return None
+    latitudes, longitudes = zip(*points)
+    return summarize([0] * len(points), latitudes, longitudes)[0]
+
+
+def points_added(group_pks, points):
+    """
+    Add places at given (latitude, longitude) points to stats of every given group.
+    Groups without kept stats are skipped, they are computed when first read.
+    """
+    summary = _summary(points)
+    if summary is None:
+        return
+    changes = {name: F(name) + summary[name] for name in ('places', 'x', 'y', 'z')}
+    for name, function in (('min_latitude', Least), ('max_latitude', Greatest),
+                           ('min_longitude', Least), ('max_longitude', Greatest)):
+        # Bounding box of group without places is empty
+        changes[name] = function(Coalesce(F(name), Value(summary[name])), Value(summary[name]))
+    for chunk in _chunks(set(group_pks)):
+        GroupStats.objects.filter(group_id__in=chunk).update(**changes)
+
+
+def points_removed(group_pks, points):
+    """
+    Remove places at given (latitude, longitude) points from stats of every given group.
+
+    Bounding box is recomputed from remaining places only for groups which
+    could have lost a place lying on its edge.
+    """
+    summary = _summary(points)
+    if summary is None:
+        return
+    changes = {name: F(name) - summary[name] for name in ('places', 'x', 'y', 'z')}
+    on_edge = (Q(min_latitude__gte=summary['min_latitude']) | Q(max_latitude__lte=summary['max_latitude'])
+               | Q(min_longitude__gte=summary['min_longitude']) | Q(max_longitude__lte=summary['max_longitude']))
+    for chunk in _chunks(set(group_pks)):
+        stats = GroupStats.objects.filter(group_id__in=chunk)
+        stats.update(**changes)
+        # Sums of empty groups are reset, so rounding errors do not pile up
+        stats.filter(places__lte=0).update(places=0, x=0, y=0, z=0, **dict.fromkeys(_BBOX_FIELDS))
+        _recompute_bbox(stats.filter(on_edge, places__gt=0).values_list('group_id', flat=True))
+
+
+def _recompute_bbox(group_pks):
+    bboxes = (
+        Membership.objects.filter(group_id__in=list(group_pks))
+        .values('group_id')
+        .annotate(min_latitude=Min('place__latitude'), max_latitude=Max('place__latitude'),
+                  min_longitude=Min('place__longitude'), max_longitude=Max('place__longitude'))
+        .order_by()
+    )
+    for bbox in bboxes:
+        GroupStats.objects.filter(group_id=bbox.pop('group_id')).update(**bbox)
+
+
+def places_moved(moves):
+    """
+    Update stats of groups of places whose coordinates changed, given as dict
+    of place id -> (old point, new point).
+    """
+    groups_of = {}
+    for chunk in _chunks(sorted(moves)):
+        for group_pk, place_pk in Membership.objects.filter(place_id__in=chunk).values_list('group_id', 'place_id'):
+            groups_of.setdefault(place_pk, []).append(group_pk)
+    for place_pk, group_pks in sorted(groups_of.items()):
+        old, new = moves[place_pk]
+        points_removed(group_pks, [old])
+        points_added(group_pks, [new])
+
+
+def recompute_group_stats(group_pks=None, chunk_size=None):
+    """
+    Compute stats of given groups, or all of them, from scratch, replacing kept ones.
+    Every chunk of groups is computed in its own transaction. Returns number of groups.
+    """
+    if group_pks is None:
+        group_pks = Group.objects.order_by('pk').values_list('pk', flat=True)
+    group_pks = sorted(group_pks)
+    for chunk in _chunks(group_pks, chunk_size):
+        with transaction.atomic():
+            rows = list(Membership.objects.filter(group_id__in=chunk)
+                        .values_list('group_id', 'place__latitude', 'place__longitude'))
+            summaries = summarize(*zip(*rows)) if rows else {}
+            GroupStats.objects.filter(group_id__in=chunk).delete()
+            # Groups could be deleted meanwhile
+            existing = Group.objects.filter(pk__in=chunk).values_list('pk', flat=True)
+            GroupStats.objects.bulk_create([
+                GroupStats(group_id=group_pk, **summaries.get(group_pk, {})) for group_pk in existing
+            ])
+    return len(group_pks)
+
+
+def group_stats(group):
+    """
+    Get stats of group, computing them if they are not kept yet.
+    """
+    try:
+        return GroupStats.objects.get(group_id=group.pk)
+    except GroupStats.DoesNotExist:
+        recompute_group_stats([group.pk])
+        return GroupStats.objects.get(group_id=group.pk)
@@ -0,0 +1,79 @@
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+from scrapper.fastjson import dumps
+from scrapper.pagination import query_flag
+
+# Number of rows fetched from database per single query while streaming
+STREAM_CHUNK_SIZE = getattr(settings, 'SCRAPPER_STREAM_CHUNK_SIZE', 2000)
+
+# Query parameter which opts in to streamed full dump
+STREAM_QUERY_PARAM = 'stream'
+
+
+def is_streamed(request):
+    """
+    Check if client asked for whole list streamed row by row.
+    """
+    return query_flag(request, STREAM_QUERY_PARAM)
+
+
+def iterate_in_chunks(queryset, fields, chunk_size=None):
+    """
+    Yield lists of value tuples for whole queryset, chunk by chunk.
+
+    Chunks are selected by primary key ranges (`pk > last_pk`), so memory
+    usage stays bounded and every query costs the same no matter how deep
+    into the table it reaches. First item of `fields` must be the primary key.
+    """
+    chunk_size = chunk_size or STREAM_CHUNK_SIZE
+    queryset = queryset.order_by('pk').values_list(*fields)
+    last_pk = None
+    while True:
+        chunk_qs = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = list(chunk_qs[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        if len(rows) < chunk_size:
+            return
+        last_pk = rows[-1][0]
+
+
+def stream_json_array(queryset, fields, chunk_size=None, compact=False):
+    """
+    Generate JSON array of objects with given fields, one chunk at a time.
+    When compact, array starts with header row and holds arrays of values.
+    """
+    # Primary key drives chunking, so it is selected even if not requested
+    selected = fields if fields[0] == 'id' else ('id',) + tuple(fields)
+    skip = len(selected) - len(fields)
+    yield b'['
+    first = True
+    if compact:
+        first = False
+        yield dumps(list(fields))
+    for rows in iterate_in_chunks(queryset, selected, chunk_size):
+        if skip:
+            rows = [row[skip:] for row in rows]
+        # Encode whole chunk at once and strip its brackets
+        if compact:
+            body = dumps(rows)[1:-1]
+        else:
+            body = dumps([dict(zip(fields, row)) for row in rows])[1:-1]
+        if first:
+            first = False
+            yield body
+        else:
+            yield b',' + body
+    yield b']'
+
+
+def streaming_json_response(queryset, fields, chunk_size=None, compact=False):
+    """
+    Build response streaming whole queryset as JSON array.
+    """
+    return StreamingHttpResponse(
+        stream_json_array(queryset, fields, chunk_size, compact),
+        content_type='application/json',
+    )
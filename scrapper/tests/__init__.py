@@ -0,0 +1,24 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from rest_framework.test import APITestCase
+
+from scrapper.caching import change_log
+
+
+class ScrapperAPITestCase(APITestCase):
+    """
+    API test case starting with empty cache.
+
+    Database is rolled back after every test, but cached responses and
+    their versions are not, so they are dropped too. The latest logged change
+    is read once at the start, so numbers of queries do not depend on timing.
+    """
+
+    def _pre_setup(self):
+        super()._pre_setup()
+        cache.clear()
+        patcher = patch.object(change_log, 'interval', 3600)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        change_log.reset()
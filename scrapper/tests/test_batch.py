@@ -0,0 +1,141 @@
+from unittest.mock import patch
+
+from django.urls import reverse
+from rest_framework import status
+
+from scrapper.models import Group, Place
+from scrapper.tests import ScrapperAPITestCase
+
+
+class BatchTest(ScrapperAPITestCase):
+    def setUp(self):
+        self.warsaw = Place.objects.create(city='Warsaw', country='Poland', latitude=52.25, longitude=21)
+        self.berlin = Place.objects.create(city='Berlin', country='Germany', latitude=52.516, longitude=13.4059)
+        self.url = reverse('batch')
+
+    def test_run_operations(self):
+        """
+        Test if operations on different routes run and report their results.
+        """
+        operations = [
+            {'method': 'PUT', 'path': '/places/%d' % self.warsaw.pk,
+             'body': {'city': 'Warszawa', 'country': 'Poland', 'latitude': 52.25, 'longitude': 21}},
+            {'method': 'DELETE', 'path': '/places/%d' % self.berlin.pk},
+            {'method': 'POST', 'path': '/groups/', 'body': {'name': 'grp1', 'places': [self.warsaw.pk]}},
+            {'method': 'GET', 'path': '/places/?all=true&fields=city'},
+        ]
+
+        response = self.client.post(self.url, {'operations': operations})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['committed'])
+        self.assertEqual([result['status'] for result in response.data['results']], [200, 204, 201, 200])
+        self.assertEqual(response.data['results'][0]['data']['city'], 'Warszawa')
+        self.assertEqual(response.data['results'][3]['data'], [{'city': 'Warszawa'}])
+        self.assertEqual(Place.objects.get().city, 'Warszawa')
+        self.assertEqual(list(Group.objects.get().places.all()), [self.warsaw])
+
+    def test_all_or_nothing(self):
+        """
+        Test if failed operation rolls back whole batch and skips the rest.
+        """
+        operations = [
+            {'method': 'DELETE', 'path': '/places/%d' % self.warsaw.pk},
+            {'method': 'PUT', 'path': '/places/%d' % self.berlin.pk, 'body': {'latitude': 'x'}},
+            {'method': 'DELETE', 'path': '/places/%d' % self.berlin.pk},
+        ]
+
+        response = self.client.post(self.url, {'operations': operations})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(response.data['committed'])
+        self.assertEqual([result['status'] for result in response.data['results']], [204, 400, 424])
+        self.assertEqual(Place.objects.count(), 2)
+
+    def test_best_effort(self):
+        """
+        Test if failed operations are rolled back alone in best-effort mode.
+        """
+        operations = [
+            {'method': 'DELETE', 'path': '/places/%d' % self.warsaw.pk},
+            {'method': 'DELETE', 'path': '/places/999'},
+            {'method': 'GET', 'path': '/unknown/'},
+            {'method': 'POST', 'path': '/batch/', 'body': {'operations': []}},
+            {'method': 'DELETE', 'path': '/places/%d' % self.berlin.pk},
+        ]
+
+        response = self.client.post(self.url, {'operations': operations, 'atomic': False})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['committed'])
+        self.assertEqual([result['status'] for result in response.data['results']], [204, 404, 404, 404, 204])
+        self.assertEqual(Place.objects.count(), 0)
+
+    def test_failing_operation(self):
+        """
+        Test if unexpected error of operation is reported and rolled back.
+        """
+        operations = [
+            {'method': 'DELETE', 'path': '/places/%d' % self.warsaw.pk},
+            {'method': 'DELETE', 'path': '/groups/1'},
+        ]
+        Group.objects.create(name='grp1')
+
+        with patch('scrapper.views.purge_group', side_effect=RuntimeError), \
+                self.assertLogs('scrapper.batch', 'ERROR'):
+            response = self.client.post(self.url, {'operations': operations, 'atomic': False})
+
+        self.assertEqual([result['status'] for result in response.data['results']], [204, 500])
+        self.assertEqual(Group.objects.count(), 1)
+
+    def test_cached_get(self):
+        """
+        Test if data of cached responses is not returned in place of data changed by batch.
+        """
+        url = reverse('place-detail', kwargs={'pk': self.warsaw.pk})
+        self.client.get(url, HTTP_ACCEPT='application/json')
+        operations = [
+            {'method': 'GET', 'path': '/places/%d' % self.warsaw.pk},
+            {'method': 'PUT', 'path': '/places/%d' % self.warsaw.pk,
+             'body': {'city': 'Warszawa', 'country': 'Poland', 'latitude': 52.25, 'longitude': 21}},
+            {'method': 'GET', 'path': '/places/%d' % self.warsaw.pk},
+        ]
+
+        response = self.client.post(self.url, {'operations': operations})
+
+        self.assertEqual(response.data['results'][0]['data']['city'], 'Warsaw')
+        self.assertEqual(response.data['results'][2]['data']['city'], 'Warszawa')
+
+    def test_rolled_back_get_not_cached(self):
+        """
+        Test if data read inside batch which was rolled back is not served from cache later.
+        """
+        path = '/places/%d' % self.warsaw.pk
+        operations = [
+            {'method': 'PUT', 'path': path,
+             'body': {'city': 'Phantom', 'country': 'Poland', 'latitude': 52.25, 'longitude': 21}},
+            {'method': 'GET', 'path': path},
+            {'method': 'PUT', 'path': path, 'body': {'latitude': 'x'}},
+        ]
+
+        response = self.client.post(self.url, {'operations': operations})
+
+        self.assertFalse(response.data['committed'])
+        self.assertEqual(response.data['results'][1]['data']['city'], 'Phantom')
+        response = self.client.get(reverse('place-detail', kwargs={'pk': self.warsaw.pk}),
+                                   HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['city'], 'Warsaw')
+
+    def test_bad_operations(self):
+        """
+        Test if malformed batch is rejected before running anything.
+        """
+        for data in [{}, {'operations': {}}, {'operations': [{'method': 'PATCH', 'path': '/places/1'}]},
+                     {'operations': [{'method': 'DELETE'}]}, {'operations': [], 'atomic': 'yes'}]:
+            response = self.client.post(self.url, data)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        with patch('scrapper.batch.BATCH_MAX_OPERATIONS', 1):
+            response = self.client.post(self.url, {'operations': [{'method': 'GET', 'path': '/places/'}] * 2})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
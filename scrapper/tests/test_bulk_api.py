@@ -0,0 +1,147 @@
+import json
+
+from django.urls import reverse
+from rest_framework import status
+
+from scrapper.bulk import bulk_create_places, get_batch_size, validate_place_data
+from scrapper.models import Place
+from scrapper.serializers import PlaceSerializer
+from scrapper.tests import ScrapperAPITestCase
+
+
+class BulkCreatePlacesTest(ScrapperAPITestCase):
+    def test_bulk_create_from_json_array(self):
+        """
+        Test if can add many places with single request
+        """
+        url = reverse('places-bulk')
+        places_data = [
+            {'city': 'Warsaw', 'country': 'Poland', 'latitude': 52.25, 'longitude': 21},
+            {'city': 'Berlin', 'country': 'Germany', 'latitude': 52.516, 'longitude': 13.4059},
+        ]
+
+        response = self.client.post(url, places_data)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, {'created': 2, 'updated': 0, 'errors': []})
+        self.assertEqual(Place.objects.count(), 2)
+        self.assertEqual(Place.objects.get(city='Berlin').longitude, 13.4059)
+
+    def test_bulk_create_from_ndjson(self):
+        """
+        Test if can add many places sent as newline delimited JSON
+        """
+        url = reverse('places-bulk')
+        body = '\n'.join([
+            json.dumps({'city': 'Warsaw', 'latitude': 52.25, 'longitude': 21}),
+            '',
+            json.dumps({'city': 'Berlin', 'latitude': 52.516, 'longitude': 13.4059}),
+        ])
+
+        response = self.client.generic('POST', url, body, content_type='application/x-ndjson')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Place.objects.count(), 2)
+
+    def test_bulk_create_reports_invalid_items(self):
+        """
+        Test if invalid places are reported and valid ones are still created
+        """
+        url = reverse('places-bulk')
+        places_data = [
+            {'city': 'Warsaw', 'latitude': 52.25, 'longitude': 21},
+            {'city': 'Berlin', 'latitude': 'not_a_number', 'longitude': 13.4059},
+            {'city': 'Paris'},
+        ]
+
+        response = self.client.post(url, places_data)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual([e['index'] for e in response.data['errors']], [1, 2])
+        self.assertIn('latitude', response.data['errors'][1]['errors'])
+        self.assertIn('longitude', response.data['errors'][1]['errors'])
+        self.assertEqual(Place.objects.get().city, 'Warsaw')
+
+    def test_bulk_create_rejects_non_finite_numbers(self):
+        """
+        Test if NaN and infinite coordinates are reported per item instead of failing whole request
+        """
+        url = reverse('places-bulk')
+        places_data = [
+            {'city': 'Warsaw', 'latitude': 52.25, 'longitude': 21},
+            {'city': 'Nowhere', 'latitude': 'NaN', 'longitude': '-Infinity'},
+            {'city': 'Far away', 'latitude': 1, 'longitude': '1e400'},
+        ]
+
+        response = self.client.post(url, places_data)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual([e['index'] for e in response.data['errors']], [1, 2])
+        self.assertEqual(set(response.data['errors'][0]['errors']), {'latitude', 'longitude'})
+        self.assertEqual(set(response.data['errors'][1]['errors']), {'longitude'})
+        self.assertEqual(Place.objects.get().city, 'Warsaw')
+
+    def test_bulk_create_all_invalid(self):
+        """
+        Test for error status if none of places is valid
+        """
+        url = reverse('places-bulk')
+
+        response = self.client.post(url, [{'city': 'Paris'}])
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Place.objects.count(), 0)
+
+    def test_bulk_create_requires_list(self):
+        """
+        Test for error if body is not a list of places
+        """
+        url = reverse('places-bulk')
+
+        response = self.client.post(url, {'latitude': 1, 'longitude': 2})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_create_in_many_batches(self):
+        """
+        Test if places are split into batches fitting into database limits
+        """
+        places_data = [{'latitude': i, 'longitude': i} for i in range(25)]
+
+        result = bulk_create_places(places_data, batch_size=10)
+
+        self.assertEqual(result, (25, 0, []))
+        self.assertEqual(Place.objects.count(), 25)
+        self.assertLessEqual(get_batch_size(10 ** 6) * 4, 10 ** 6)
+
+
+class ValidatePlaceDataTest(ScrapperAPITestCase):
+    def test_same_result_as_serializer(self):
+        """
+        Test if fast validation accepts and rejects the same data as PlaceSerializer
+        """
+        samples = [
+            {'city': ' Berlin ', 'country': 'Germany', 'latitude': '52.5', 'longitude': 13},
+            {'latitude': 1, 'longitude': 2},
+            {'city': 'x' * 101, 'latitude': 1, 'longitude': 2},
+            {'country': True, 'latitude': 1, 'longitude': 2},
+            {'city': None, 'latitude': 1, 'longitude': 2},
+            {'city': 'a\x00b', 'latitude': 1, 'longitude': 2},
+            {'latitude': None, 'longitude': []},
+            {'latitude': 'x' * 1001, 'longitude': 2},
+            {'latitude': 'nan', 'longitude': 'inf'},
+            {'latitude': float('-inf'), 'longitude': 2},
+            {},
+        ]
+
+        for data in samples:
+            serializer = PlaceSerializer(data=data)
+            cleaned, errors = validate_place_data(data)
+            if serializer.is_valid():
+                self.assertIsNone(errors)
+                self.assertEqual(cleaned, dict(serializer.validated_data))
+            else:
+                self.assertIsNone(cleaned)
+                self.assertEqual(errors, {k: [str(m) for m in v] for k, v in serializer.errors.items()})
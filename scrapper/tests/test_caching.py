@@ -0,0 +1,131 @@
+import json
+from unittest.mock import patch
+
+from django.urls import reverse
+from rest_framework import status
+
+from scrapper.bulk import bulk_create_places
+from scrapper.caching import change_log
+from scrapper.models import Change, Group, Place
+from scrapper.tests import ScrapperAPITestCase
+
+
+class ConditionalGetTest(ScrapperAPITestCase):
+    def setUp(self):
+        self.place = Place.objects.create(city='Warsaw', country='Poland', latitude=52.25, longitude=21)
+        self.group = Group.objects.create(name='grp1')
+        self.group.places.add(self.place)
+
+    def test_not_modified_without_queries(self):
+        """
+        Test if request with matching ETag gets 304 without touching database
+        """
+        url = reverse('place-detail', kwargs={'pk': self.place.id})
+        response = self.client.get(url)
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_if_modified_since(self):
+        """
+        Test if request with up to date Last-Modified gets 304
+        """
+        url = reverse('places-list')
+        response = self.client.get(url)
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_repeated_get_served_from_cache(self):
+        """
+        Test if repeated request is answered with cached bytes
+        """
+        url = reverse('groups-list')
+        first = self.client.get(url)
+
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Content-Type'], first['Content-Type'])
+
+    def test_place_update_invalidates(self):
+        """
+        Test if updating place changes ETag of places and group places
+        """
+        place_url = reverse('place-detail', kwargs={'pk': self.place.id})
+        group_places_url = reverse('group-places', kwargs={'pk': self.group.id})
+        place_etag = self.client.get(place_url)['ETag']
+        group_places_etag = self.client.get(group_places_url)['ETag']
+
+        self.client.put(place_url, {'city': 'Berlin', 'latitude': 52.516, 'longitude': 13.4059})
+
+        response = self.client.get(place_url, HTTP_IF_NONE_MATCH=place_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content.decode())['city'], 'Berlin')
+        response = self.client.get(group_places_url, HTTP_IF_NONE_MATCH=group_places_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_group_membership_change_invalidates_only_that_group(self):
+        """
+        Test if changing group's places changes ETag of that group only
+        """
+        other_group = Group.objects.create(name='grp2')
+        url = reverse('group-detail', kwargs={'pk': self.group.id})
+        other_url = reverse('group-detail', kwargs={'pk': other_group.id})
+        etag = self.client.get(url)['ETag']
+        other_etag = self.client.get(other_url)['ETag']
+
+        place = Place.objects.create(latitude=1, longitude=1)
+        self.client.post(reverse('group-places', kwargs={'pk': self.group.id}), {'places': [place.id]})
+        # Creating place changed places version, so compare with fresh ETag
+        other_etag = self.client.get(other_url)['ETag']
+        place.groups.add(other_group)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content.decode())['places'], [self.place.id, place.id])
+        response = self.client.get(other_url, HTTP_IF_NONE_MATCH=other_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+
+    def test_change_of_other_process_invalidates(self):
+        """
+        Test if change logged by other process, which bumped versions in its own cache, invalidates responses
+        """
+        url = reverse('place-detail', kwargs={'pk': self.place.id})
+        response = self.client.get(url)
+        etag = response['ETag']
+
+        Place.objects.filter(pk=self.place.pk).update(city='Berlin')
+        Change.objects.create(kind=Change.PLACE, action=Change.UPSERT, object_id=self.place.pk)
+
+        # Not seen until change log is read again
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with patch.object(change_log, 'interval', 0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content.decode())['city'], 'Berlin')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_bulk_create_invalidates(self):
+        """
+        Test if bulk created places show up in cached list
+        """
+        url = reverse('places-list')
+        self.client.get(url, {'all': 'true'})
+
+        self.assertEqual(bulk_create_places([{'latitude': 1, 'longitude': 2}]), (1, 0, []))
+
+        response = self.client.get(url, {'all': 'true'})
+        self.assertEqual(len(response.data), 2)
@@ -0,0 +1,217 @@
+import datetime
+import json
+from io import StringIO
+
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+
+from scrapper.bulk import upsert_places
+from scrapper.changes import latest_token, prune_changes
+from scrapper.models import Change, Group, Place
+from scrapper.purge import merge_duplicate_places
+from scrapper.tests import ScrapperAPITestCase
+
+
+class ChangesTest(ScrapperAPITestCase):
+    def get_changes(self, **params):
+        response = self.client.get(reverse('changes'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return json.loads(response.content.decode())
+
+    def sync(self, since=0, page_size=None):
+        changes = []
+        while True:
+            params = {'since': since}
+            if page_size:
+                params['page_size'] = page_size
+            page = self.get_changes(**params)
+            changes.extend(page['changes'])
+            since = page['next']
+            if not page['more']:
+                return changes, since
+
+    def test_place_changes(self):
+        """
+        Test if place upserts carry current data and deletes leave tombstones.
+        """
+        warsaw = Place.objects.create(city='Warsaw', latitude=52.25, longitude=21)
+        berlin = Place.objects.create(city='Berlin', latitude=52.516, longitude=13.4059)
+        berlin_pk = berlin.pk
+        warsaw.country = 'Poland'
+        warsaw.save()
+        berlin.delete()
+
+        changes, _ = self.sync()
+
+        self.assertEqual(changes, [
+            {'type': 'place', 'action': 'upsert', 'id': warsaw.pk, 'data': {
+                'id': warsaw.pk, 'city': 'Warsaw', 'country': 'Poland', 'latitude': 52.25, 'longitude': 21.0,
+            }},
+            {'type': 'place', 'action': 'delete', 'id': berlin_pk},
+        ])
+
+    def test_sync_from_token(self):
+        """
+        Test if only changes after token are returned, in bounded pages.
+        """
+        for i in range(5):
+            Place.objects.create(city='City%d' % i, latitude=i, longitude=i)
+        _, token = self.sync()
+        group = Group.objects.create(name='grp1')
+        for i in range(5, 10):
+            Place.objects.create(city='City%d' % i, latitude=i, longitude=i)
+
+        page = self.get_changes(since=token, page_size=2)
+        self.assertEqual(len(page['changes']), 2)
+        self.assertTrue(page['more'])
+
+        changes, last_token = self.sync(token, page_size=2)
+        self.assertEqual([(c['type'], c['id']) for c in changes],
+                         [('group', group.pk)] + [('place', pk) for pk in range(6, 11)])
+
+        page = self.get_changes(since=last_token)
+        self.assertEqual(page, {'changes': [], 'next': last_token, 'more': False})
+
+    def test_membership_changes(self):
+        """
+        Test if places added to and removed from group are logged and touch the group.
+        """
+        group = Group.objects.create(name='grp1')
+        place1 = Place.objects.create(latitude=1, longitude=1)
+        place2 = Place.objects.create(latitude=2, longitude=2)
+        _, token = self.sync()
+        updated_at = Group.objects.get().updated_at
+        url = reverse('group-places', kwargs={'pk': group.pk})
+
+        self.client.post(url, {'places': [place1.pk, place2.pk]})
+        self.client.delete(url, {'places': [place1.pk]})
+        place2.groups.clear()
+
+        changes, _ = self.sync(token)
+        self.assertEqual([(c['action'], c['group'], c['place']) for c in changes], [
+            ('add', group.pk, place1.pk),
+            ('add', group.pk, place2.pk),
+            ('remove', group.pk, place1.pk),
+            ('remove', group.pk, place2.pk),
+        ])
+        self.assertGreater(Group.objects.get().updated_at, updated_at)
+
+    def test_removing_non_members_not_logged(self):
+        """
+        Test if removing places or groups which were not related logs no removals of them.
+        """
+        group1 = Group.objects.create(name='grp1')
+        group2 = Group.objects.create(name='grp2')
+        member = Place.objects.create(latitude=1, longitude=1)
+        stranger = Place.objects.create(latitude=2, longitude=2)
+        group1.places.add(member)
+        _, token = self.sync()
+        updated_at = Group.objects.get(pk=group2.pk).updated_at
+
+        group1.places.remove(member, stranger)
+        stranger.groups.remove(group1, group2)
+        self.assertEqual(Group.objects.get(pk=group2.pk).updated_at, updated_at)
+        member.groups.add(group2)
+        member.groups.remove(group1, group2)
+
+        changes, _ = self.sync(token)
+        self.assertEqual([(c['action'], c['group'], c['place']) for c in changes], [
+            ('remove', group1.pk, member.pk),
+            ('add', group2.pk, member.pk),
+            ('remove', group2.pk, member.pk),
+        ])
+
+    def test_group_deletion_tombstone(self):
+        """
+        Test if deleted group and its orphaned places leave single tombstones.
+        """
+        group = Group.objects.create(name='grp1')
+        place = Place.objects.create(latitude=1, longitude=1)
+        group.places.add(place)
+        _, token = self.sync()
+
+        response = self.client.delete(reverse('group-detail', kwargs={'pk': group.pk}))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        changes, _ = self.sync(token)
+        self.assertEqual(changes, [
+            {'type': 'group', 'action': 'delete', 'id': group.pk},
+            {'type': 'place', 'action': 'delete', 'id': place.pk},
+        ])
+
+    def test_bulk_changes(self):
+        """
+        Test if bulk upserts and merged duplicates are logged.
+        """
+        upsert_places([{'city': 'Warsaw', 'latitude': 52.25, 'longitude': 21}])
+        place = Place.objects.get()
+        updated_at = place.updated_at
+        upsert_places([{'city': 'Warsaw', 'latitude': 52.250001, 'longitude': 21}])
+        self.assertGreater(Place.objects.get().updated_at, updated_at)
+
+        changes, token = self.sync()
+        self.assertEqual(changes, [{'type': 'place', 'action': 'upsert', 'id': place.pk, 'data': {
+            'id': place.pk, 'city': 'Warsaw', 'country': '', 'latitude': 52.250001, 'longitude': 21.0,
+        }}])
+
+        group = Group.objects.create(name='grp1')
+        duplicate = Place.objects.create(city='Warsaw', latitude=52.25, longitude=21)
+        group.places.add(duplicate)
+        merge_duplicate_places()
+
+        changes, _ = self.sync(token)
+        self.assertEqual([(c['type'], c['action']) for c in changes[-2:]],
+                         [('membership', 'add'), ('place', 'delete')])
+        self.assertEqual(changes[-2]['place'], place.pk)
+        self.assertEqual(changes[-1]['id'], duplicate.pk)
+
+    def test_late_commit_delivered(self):
+        """
+        Test if change committed after a later one, so with lower id, is not skipped by synced client.
+        """
+        warsaw = Place.objects.create(city='Warsaw', latitude=52.25, longitude=21)
+        berlin = Place.objects.create(city='Berlin', latitude=52.516, longitude=13.4059)
+        late = Change.objects.get(kind=Change.PLACE, object_id=warsaw.pk)
+        self.assertLess(late.pk, Change.objects.get(kind=Change.PLACE, object_id=berlin.pk).pk)
+        late.delete()
+
+        changes, token = self.sync()
+        self.assertEqual([change['id'] for change in changes], [berlin.pk])
+
+        Change.objects.create(pk=late.pk, kind=Change.PLACE, action=Change.UPSERT, object_id=warsaw.pk)
+        changes, _ = self.sync(token)
+        self.assertEqual([change['id'] for change in changes], [warsaw.pk])
+
+    def test_prune_changes(self):
+        """
+        Test if old changes are pruned but the latest one, and client holding older token gets 410.
+        """
+        for i in range(3):
+            Place.objects.create(city='City%d' % i, latitude=i, longitude=i)
+        _, token = self.sync()
+        self.assertEqual(prune_changes(), 0)
+        Change.objects.update(created_at=timezone.now() - datetime.timedelta(days=31))
+        recent = Place.objects.create(city='Recent', latitude=5, longitude=5)
+
+        stdout = StringIO()
+        call_command('prune_changes', days=30, stdout=stdout)
+        self.assertIn('Deleted 2 changes.', stdout.getvalue())
+        self.assertEqual(Change.objects.count(), 2)
+
+        response = self.client.get(reverse('changes'), {'since': 0})
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+        self.assertEqual(json.loads(response.content.decode())['next'], latest_token())
+        # Client synced before pruning continues from its token
+        changes, _ = self.sync(token)
+        self.assertEqual([change['id'] for change in changes], [recent.pk])
+
+    def test_bad_parameters(self):
+        """
+        Test if invalid token and page size are rejected.
+        """
+        for params in [{'since': 'x'}, {'since': -1}, {'page_size': 0}, {'page_size': 10 ** 6}]:
+            response = self.client.get(reverse('changes'), params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Change.objects.count(), 0)
@@ -0,0 +1,221 @@
+from unittest.mock import patch
+
+import numpy as np
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.urls import reverse
+from rest_framework import status
+
+from scrapper.bulk import bulk_create_places
+from scrapper.clusters import (
+    CLUSTER_CELLS_PER_TILE, CLUSTER_MAX_CELLS, ClusterGrid, PlaceClusterIndex, bbox_cells, cluster_index,
+    morton_codes,
+)
+from scrapper.membership import Membership, add_places, remove_places
+from scrapper.models import Change, Group, Place
+from scrapper.purge import purge_group
+from scrapper.tests import ScrapperAPITestCase
+
+
+def brute_force_clusters(points, zoom, bbox=None):
+    """
+    Cluster (latitude, longitude) points one by one, as list of (count, latitude, longitude).
+    """
+    size = CLUSTER_CELLS_PER_TILE << zoom
+    xs, ys = bbox_cells(zoom, bbox)
+    wanted = set(zip(xs.tolist(), ys.tolist()))
+    cells = {}
+    for latitude, longitude in points:
+        x = min(int((longitude + 180) / 360 * size), size - 1)
+        sin = np.sin(np.radians(min(max(latitude, -85.0511287798), 85.0511287798)))
+        y = min(int((0.5 - np.log((1 + sin) / (1 - sin)) / (4 * np.pi)) * size), size - 1)
+        if (x, y) in wanted:
+            cells.setdefault(morton_codes(x, y).item(), []).append((latitude, longitude))
+    clusters = []
+    for _, members in sorted(cells.items()):
+        lat, lon = np.radians(np.array(members)).T
+        x, y, z = (np.cos(lat) * np.cos(lon)).sum(), (np.cos(lat) * np.sin(lon)).sum(), np.sin(lat).sum()
+        clusters.append((len(members), np.degrees(np.arctan2(z, np.hypot(x, y))),
+                         np.degrees(np.arctan2(y, x))))
+    return clusters
+
+
+class ClustersAssertionsMixin(object):
+    def assertClusters(self, found, expected):
+        self.assertEqual([count for count, _, _ in found], [count for count, _, _ in expected])
+        for (_, latitude, longitude), (_, expected_latitude, expected_longitude) in zip(found, expected):
+            self.assertAlmostEqual(latitude, expected_latitude, places=6)
+            self.assertAlmostEqual(longitude, expected_longitude, places=6)
+
+
+class ClusterGridTest(ClustersAssertionsMixin, SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.latitudes = np.concatenate([rng.uniform(-89, 89, 500), rng.normal(52.2, 0.05, 500)])
+        self.longitudes = np.concatenate([rng.uniform(-180, 180, 500), rng.normal(21, 0.05, 500)])
+        self.grid = ClusterGrid(np.arange(1000), self.latitudes, self.longitudes)
+
+    def test_clusters(self):
+        """
+        Test if clusters of every zoom are the same as clustered one by one.
+        """
+        points = list(zip(self.latitudes.tolist(), self.longitudes.tolist()))
+        for zoom, bbox in ((0, None), (2, None), (4, (-30, -20, 40, 60)), (8, (20, 51.5, 22, 53)),
+                           (14, (20.99, 52.19, 21.01, 52.21)), (5, (170, -50, -170, 50))):
+            with self.subTest(zoom=zoom, bbox=bbox):
+                found = self.grid.clusters(zoom, bbox)
+                self.assertClusters(found, brute_force_clusters(points, zoom, bbox))
+        self.assertEqual(sum(count for count, _, _ in self.grid.clusters(0)), 1000)
+
+    def test_changes(self):
+        """
+        Test if places changed since build are counted where they are now.
+        """
+        self.grid.register(0, (52.2, 21))
+        self.grid.register(1, None)
+        self.grid.register(1000, (-33.9, 151.2))
+        self.grid.register(1001, (10, 10))
+        self.grid.register(1001, None)
+        self.assertTrue(self.grid.contains(0))
+        self.assertFalse(self.grid.contains(1))
+        self.assertTrue(self.grid.contains(1000))
+        self.assertFalse(self.grid.contains(1001))
+
+        latitudes = np.append(self.latitudes, -33.9)
+        longitudes = np.append(self.longitudes, 151.2)
+        latitudes[0], longitudes[0] = 52.2, 21
+        fresh = ClusterGrid(np.arange(1001), np.delete(latitudes, 1), np.delete(longitudes, 1))
+        for zoom, bbox in ((0, None), (3, None), (9, (20, 51.5, 22, 53))):
+            with self.subTest(zoom=zoom):
+                self.assertClusters(self.grid.clusters(zoom, bbox), fresh.clusters(zoom, bbox))
+
+    def test_too_many_cells(self):
+        """
+        Test if box covering too many cells at given zoom is refused.
+        """
+        self.assertEqual(len(ClusterGrid([], [], []).clusters(3)), 0)
+        with self.assertRaisesRegex(ValueError, str(CLUSTER_MAX_CELLS)):
+            self.grid.clusters(10)
+
+
+class ClusterIndexSignalsTest(ClustersAssertionsMixin, TransactionTestCase):
+    def setUp(self):
+        self.places = [Place.objects.create(latitude=i, longitude=i * 2) for i in range(10)]
+        self.group = Group.objects.create(name='grp')
+        add_places(self.group, [place.pk for place in self.places[:5]])
+        cluster_index.rebuild()
+
+    def assertFresh(self, group=None):
+        if group is None:
+            rows = Place.objects.values_list('pk', 'latitude', 'longitude')
+        else:
+            rows = group.places.values_list('pk', 'latitude', 'longitude')
+        fresh = ClusterGrid.from_rows(rows)
+        group_pk = group.pk if group is not None else None
+        for zoom in (0, 3, 6):
+            self.assertClusters(cluster_index.clusters(zoom, (-10, -10, 30, 30), group_pk),
+                                fresh.clusters(zoom, (-10, -10, 30, 30)))
+
+    def test_index_follows_places(self):
+        """
+        Test if clusters of all places and of group follow saved, deleted and grouped places.
+        """
+        self.assertFresh()
+        self.assertFresh(self.group)
+
+        place = Place.objects.create(latitude=1, longitude=1)
+        self.places[0].latitude = 5
+        self.places[0].save()
+        self.places[6].delete()
+        self.group.places.add(place, self.places[7])
+        remove_places(self.group, [self.places[1].pk])
+        self.places[2].groups.clear()
+        self.assertFresh()
+        self.assertFresh(self.group)
+
+        bulk_create_places([{'latitude': 3, 'longitude': 3}])
+        cluster_index.rebuild()
+        self.assertFresh()
+
+    def test_group_purged(self):
+        """
+        Test if clusters of purged group are forgotten.
+        """
+        self.assertFresh(self.group)
+        other = Group.objects.create(name='other')
+        other.places.add(self.places[0])
+        purge_group(self.group.pk)
+        self.assertEqual(cluster_index.clusters(0, None, self.group.pk), [])
+        self.assertFresh()
+        self.assertFresh(other)
+
+
+class ClusterIndexChangeLogTest(TestCase):
+    def setUp(self):
+        self.places = [Place.objects.create(latitude=10 + i, longitude=10 + i) for i in range(3)]
+        self.group = Group.objects.create(name='grp')
+        self.group.places.add(self.places[0])
+        self.index = PlaceClusterIndex()
+        self.index.rebuild()
+
+    def test_changes_of_other_processes(self):
+        """
+        Test if grids are built again once interval passed and other process logged changes
+        """
+        self.assertEqual(self.index.clusters(0, None, self.group.pk)[0][0], 1)
+        # Written without signals, like by other process
+        Membership.objects.create(group=self.group, place=self.places[1])
+
+        with patch('scrapper.clusters.threading.Thread') as thread, patch.object(self.index._log, 'interval', 0):
+            self.assertEqual(self.index.clusters(0, None, self.group.pk)[0][0], 1)
+            Change.objects.create(kind=Change.MEMBERSHIP, action=Change.ADD, object_id=self.group.pk,
+                                  place_id=self.places[1].pk)
+            self.assertEqual(self.index.clusters(0, None, self.group.pk)[0][0], 2)
+            thread.assert_not_called()
+            self.index.clusters(0)
+
+        thread.assert_called_once_with(target=self.index._background_rebuild, daemon=True)
+
+
+class ClustersApiTest(ScrapperAPITestCase):
+    def setUp(self):
+        warsaw = [Place.objects.create(latitude=52.2 + i / 1000, longitude=21 + i / 1000) for i in range(3)]
+        Place.objects.create(latitude=-33.9, longitude=151.2)
+        self.group = Group.objects.create(name='grp')
+        self.group.places.add(*warsaw[:2])
+        cluster_index.rebuild()
+
+    def test_clusters(self):
+        """
+        Test retrieving clusters of all places and of group's places
+        """
+        response = self.client.get(reverse('places-clusters'), {'z': 2})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(cluster['count'] for cluster in response.data), [1, 3])
+        warsaw = next(cluster for cluster in response.data if cluster['count'] == 3)
+        self.assertAlmostEqual(warsaw['latitude'], 52.201, places=3)
+        self.assertAlmostEqual(warsaw['longitude'], 21.001, places=3)
+
+        response = self.client.get(reverse('places-clusters'), {'z': 10, 'bbox': '20,52,22,53'})
+        self.assertEqual([cluster['count'] for cluster in response.data], [3])
+
+        url = reverse('group-clusters', kwargs={'pk': self.group.pk})
+        response = self.client.get(url, {'z': 2})
+        self.assertEqual([cluster['count'] for cluster in response.data], [2])
+
+    def test_bad_parameters(self):
+        """
+        Test for errors on missing zoom, malformed box and box too big for zoom
+        """
+        url = reverse('places-clusters')
+
+        response = self.client.get(url, {'bbox': '1,2,3'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.data), {'z', 'bbox'})
+
+        response = self.client.get(url, {'z': 12})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.data), {'bbox'})
+
+        response = self.client.get(reverse('group-clusters', kwargs={'pk': 999}), {'z': 1})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
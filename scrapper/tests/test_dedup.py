@@ -0,0 +1,89 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+
+from scrapper.bulk import bulk_create_places
+from scrapper.dedup import make_dedup_key
+from scrapper.models import Group, Place
+from scrapper.tests import ScrapperAPITestCase
+
+
+class DedupKeyTest(TestCase):
+    def test_key_normalization(self):
+        """
+        Test if key ignores case, surrounding whitespace and tiny coordinate differences
+        """
+        key = make_dedup_key('Berlin', 'Germany', 52.516, 13.4059)
+
+        self.assertEqual(make_dedup_key(' berlin', 'GERMANY ', 52.5160001, 13.405899999), key)
+        self.assertNotEqual(make_dedup_key('Berlin', 'Germany', 52.517, 13.4059), key)
+        self.assertNotEqual(make_dedup_key('Berlin', '', 52.516, 13.4059), key)
+        self.assertEqual(make_dedup_key('', '', -0.0000001, 0), make_dedup_key('', '', 0, 0))
+
+    def test_key_maintained_on_save(self):
+        """
+        Test if place's dedup key follows its data
+        """
+        place = Place.objects.create(city='Berlin', latitude=52.516, longitude=13.4059)
+        place.city = 'Warsaw'
+        place.save()
+
+        self.assertEqual(Place.objects.get().dedup_key, make_dedup_key('Warsaw', '', 52.516, 13.4059))
+
+
+class UpsertPlacesTest(ScrapperAPITestCase):
+    def test_post_duplicate_updates_existing(self):
+        """
+        Test if posting place which already exists updates it instead of adding new one
+        """
+        url = reverse('places-list')
+        place = Place.objects.create(city='berlin', country='germany', latitude=52.516, longitude=13.4059)
+
+        response = self.client.post(url, {'city': 'Berlin', 'country': 'Germany',
+                                          'latitude': 52.516, 'longitude': 13.4059})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], place.id)
+        self.assertEqual(Place.objects.count(), 1)
+        self.assertEqual(Place.objects.get().city, 'Berlin')
+
+    def test_bulk_upsert(self):
+        """
+        Test if bulk path updates duplicates, also ones within the same request
+        """
+        Place.objects.create(city='Warsaw', latitude=52.25, longitude=21)
+
+        created, updated, errors = bulk_create_places([
+            {'city': 'WARSAW', 'latitude': 52.25, 'longitude': 21},
+            {'city': 'Berlin', 'latitude': 52.516, 'longitude': 13.4059},
+            {'city': 'berlin', 'latitude': 52.516, 'longitude': 13.4059},
+        ], batch_size=2)
+
+        self.assertEqual((created, updated, errors), (1, 2, []))
+        self.assertEqual(sorted(Place.objects.values_list('city', flat=True)), ['WARSAW', 'berlin'])
+
+
+class MergeDuplicatesTest(TestCase):
+    def test_merge_duplicates(self):
+        """
+        Test if duplicates are merged into the oldest place together with their groups
+        """
+        kept = Place.objects.create(city='Berlin', latitude=52.516, longitude=13.4059)
+        duplicate1 = Place.objects.create(city='BERLIN', latitude=52.516, longitude=13.4059)
+        duplicate2 = Place.objects.create(city='berlin ', latitude=52.516, longitude=13.4059)
+        other = Place.objects.create(city='Warsaw', latitude=52.25, longitude=21)
+        group1 = Group.objects.create(name='grp1')
+        group2 = Group.objects.create(name='grp2')
+        group1.places.add(kept, duplicate1)
+        group2.places.add(duplicate2, other)
+
+        stdout = StringIO()
+        call_command('merge_duplicates', stdout=stdout)
+
+        self.assertIn('Merged 3 duplicated places into 1', stdout.getvalue())
+        self.assertEqual(set(Place.objects.all()), {kept, other})
+        self.assertEqual(list(group1.places.all()), [kept])
+        self.assertEqual(set(group2.places.all()), {kept, other})
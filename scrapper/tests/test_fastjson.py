@@ -0,0 +1,112 @@
+import datetime
+import uuid
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+
+from scrapper import fastjson
+from scrapper.fastjson import dumps
+from scrapper.models import Group, Place
+from scrapper.serializers import GroupSerializer, PlaceSerializer
+from scrapper.tests import ScrapperAPITestCase
+
+TRICKY_DATA = [
+    {'id': 1, 'city': 'Kraków', 'country': 'Polska', 'latitude': 52.25, 'longitude': 21.0},
+    {'id': 2, 'city': 'line\u2028sep\u2029"quoted"\\', 'country': '', 'latitude': 1e-05, 'longitude': -0.0},
+    {'id': 3, 'city': '東京', 'country': 'Japan', 'latitude': 1e16, 'longitude': -1.5e-07},
+    {'id': 4, 'city': 'x', 'country': 'y', 'latitude': 0.1 + 0.2, 'longitude': -179.99999999},
+]
+
+OTHER_TYPES_DATA = {
+    'decimal': Decimal('12.50'),
+    'lazy': gettext_lazy('Not found.'),
+    'set': {3},
+    'keys': {1: 'a', None: 'b', False: 'c', 2.5: 'd'},
+    'wide': 2 ** 70,
+    'utc': datetime.datetime(2020, 1, 2, 3, 4, 5, 678901, tzinfo=timezone.utc),
+    'naive': datetime.datetime(2020, 1, 2, 3, 4, 5),
+    'date': datetime.date(2020, 1, 2),
+    'time': datetime.time(3, 4, 5, 6),
+    'uuid': uuid.UUID(int=1),
+    'tiny': [1e-05, Decimal('1')],
+}
+
+
+class DumpsTest(TestCase):
+    def test_same_bytes_as_drf_renderer(self):
+        """
+        Test if fast encoding gives exactly the same bytes as DRF's JSONRenderer
+        """
+        expected = JSONRenderer().render(TRICKY_DATA)
+
+        self.assertEqual(dumps(TRICKY_DATA), expected)
+        for item in TRICKY_DATA:
+            self.assertEqual(dumps([item]), JSONRenderer().render([item]))
+        self.assertEqual(dumps({'next': None, 'results': TRICKY_DATA}),
+                         JSONRenderer().render({'next': None, 'results': TRICKY_DATA}))
+
+    def test_same_bytes_for_other_types(self):
+        """
+        Test if types which orjson does not serialize alike give the same bytes as DRF's JSONRenderer
+        """
+        self.assertEqual(dumps(OTHER_TYPES_DATA), JSONRenderer().render(OTHER_TYPES_DATA))
+        for key, value in OTHER_TYPES_DATA.items():
+            self.assertEqual(dumps([{key: value}]), JSONRenderer().render([{key: value}]))
+        with patch.object(fastjson, 'orjson', None):
+            self.assertEqual(dumps(OTHER_TYPES_DATA), JSONRenderer().render(OTHER_TYPES_DATA))
+
+    def test_same_bytes_without_orjson(self):
+        """
+        Test if fallback encoder gives the same bytes
+        """
+        with patch.object(fastjson, 'orjson', None):
+            self.assertEqual(dumps(TRICKY_DATA), JSONRenderer().render(TRICKY_DATA))
+
+
+class FastListsTest(ScrapperAPITestCase):
+    def setUp(self):
+        self.places = [
+            Place.objects.create(city=item['city'], country=item['country'],
+                                 latitude=item['latitude'], longitude=i)
+            for i, item in enumerate(TRICKY_DATA[:2])
+        ]
+        self.places.append(Place.objects.create(latitude=-33.87, longitude=151.21))
+        group = Group.objects.create(name='grp1')
+        group.places.add(*self.places[1:])
+        Group.objects.create(name='empty')
+
+    def test_places_list_compatible_with_serializer(self):
+        """
+        Test if places list is byte for byte the same as PlaceSerializer output
+        """
+        expected = JSONRenderer().render(PlaceSerializer(Place.objects.order_by('pk'), many=True).data)
+
+        response = self.client.get(reverse('places-list'), {'all': 'true'})
+
+        self.assertEqual(response.content, expected)
+
+    def test_groups_list_compatible_with_serializer(self):
+        """
+        Test if groups list is byte for byte the same as GroupSerializer output
+        """
+        expected = JSONRenderer().render(GroupSerializer(Group.objects.order_by('pk'), many=True).data)
+
+        response = self.client.get(reverse('groups-list'), {'all': 'true'})
+
+        self.assertEqual(response.content, expected)
+
+    def test_group_places_compatible_with_serializer(self):
+        """
+        Test if group's places are byte for byte the same as PlaceSerializer output
+        """
+        group = Group.objects.get(name='grp1')
+        expected = JSONRenderer().render(PlaceSerializer(group.places.order_by('pk'), many=True).data)
+
+        response = self.client.get(reverse('group-places', kwargs={'pk': group.id}))
+
+        self.assertEqual(response.content, expected)
@@ -0,0 +1,112 @@
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+
+from scrapper.geo import encode_geohash, geohash_cover, parse_bbox
+from scrapper.models import Group, Place
+from scrapper.tests import ScrapperAPITestCase
+
+
+class GeohashTest(TestCase):
+    def test_encode_geohash(self):
+        """
+        Test encoding against well known geohash values
+        """
+        self.assertEqual(encode_geohash(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(encode_geohash(42.605, -5.603, 5), 'ezs42')
+        self.assertEqual(encode_geohash(-90, -180, 3), '000')
+        self.assertEqual(encode_geohash(90, 180, 3), 'zzz')
+
+    def test_cover_contains_points(self):
+        """
+        Test if geohashes of points inside box fall into covering ranges
+        """
+        bbox = (13.0, 52.0, 22.0, 53.0)
+        ranges = geohash_cover(bbox)
+        for lat, lon in [(52.25, 21), (52.516, 13.4059), (52.0, 13.0), (53.0, 22.0)]:
+            geohash = encode_geohash(lat, lon)
+            self.assertTrue(any(low <= geohash and (high is None or geohash < high)
+                                for low, high in ranges), (lat, lon))
+
+    def test_place_geohash_is_maintained_on_save(self):
+        """
+        Test if place's geohash follows its coordinates
+        """
+        place = Place.objects.create(latitude=52.25, longitude=21)
+        self.assertEqual(place.geohash, encode_geohash(52.25, 21))
+
+        place.latitude = 57.64911
+        place.longitude = 10.40744
+        place.save()
+        self.assertEqual(Place.objects.get().geohash, 'u4pruydqq')
+
+    def test_parse_bbox(self):
+        """
+        Test bounding box validation
+        """
+        self.assertEqual(parse_bbox('170,-10,-170,10'), (170, -10, -170, 10))
+        for value in ['1,2,3', 'a,b,c,d', '0,10,1,5', '0,-91,1,5', '-181,0,1,1']:
+            with self.assertRaises(ValueError):
+                parse_bbox(value)
+
+
+class BboxFilterTest(ScrapperAPITestCase):
+    def setUp(self):
+        self.warsaw = Place.objects.create(city='Warsaw', latitude=52.25, longitude=21)
+        self.berlin = Place.objects.create(city='Berlin', latitude=52.516, longitude=13.4059)
+        self.fiji = Place.objects.create(city='Suva', latitude=-18.14, longitude=178.44)
+        self.samoa = Place.objects.create(city='Apia', latitude=-13.83, longitude=-171.76)
+
+    def get_cities(self, url, bbox):
+        response = self.client.get(url, {'bbox': bbox, 'all': 'true'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sorted(p['city'] for p in response.data)
+
+    def test_places_in_bbox(self):
+        """
+        Test if only places inside box are returned
+        """
+        url = reverse('places-list')
+        self.assertEqual(self.get_cities(url, '20,50,22,53'), ['Warsaw'])
+        self.assertEqual(self.get_cities(url, '13,52,22,53'), ['Berlin', 'Warsaw'])
+        self.assertEqual(self.get_cities(url, '-180,-90,180,90'), ['Apia', 'Berlin', 'Suva', 'Warsaw'])
+        self.assertEqual(self.get_cities(url, '0,0,1,1'), [])
+
+    def test_bbox_crossing_antimeridian(self):
+        """
+        Test if box with minLon greater than maxLon wraps around the antimeridian
+        """
+        url = reverse('places-list')
+        self.assertEqual(self.get_cities(url, '170,-20,-170,0'), ['Apia', 'Suva'])
+        self.assertEqual(self.get_cities(url, '175,-20,-175,0'), ['Suva'])
+
+    def test_bbox_is_paginated(self):
+        """
+        Test if bounding box works together with pagination
+        """
+        url = reverse('places-list')
+
+        response = self.client.get(url, {'bbox': '13,52,22,53', 'page_size': 1})
+
+        self.assertEqual([p['city'] for p in response.data['results']], ['Warsaw'])
+
+    def test_group_places_in_bbox(self):
+        """
+        Test if group's places can be limited to box
+        """
+        group = Group.objects.create(name='grp1')
+        group.places.add(self.warsaw, self.fiji)
+        url = reverse('group-places', kwargs={'pk': group.id})
+
+        response = self.client.get(url, {'bbox': '0,0,30,60'})
+
+        self.assertEqual([p['city'] for p in response.data], ['Warsaw'])
+
+    def test_bad_bbox(self):
+        """
+        Test for error on malformed bounding box
+        """
+        response = self.client.get(reverse('places-list'), {'bbox': '1,2,3'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('bbox', response.data)
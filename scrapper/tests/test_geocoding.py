@@ -0,0 +1,201 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+
+from scrapper.bulk import bulk_create_places
+from scrapper.dedup import make_dedup_key
+from scrapper.geocoding import ReverseGeocoder, fill_place_data, read_gazetteer
+from scrapper.models import Change, Place
+from scrapper.tests import ScrapperAPITestCase
+
+CITIES = [
+    # geonameid, name, asciiname, alternatenames, latitude, longitude, class, code, country
+    ('756135', 'Warsaw', 'Warsaw', 'Warszawa', '52.22977', '21.01178', 'P', 'PPLC', 'PL'),
+    ('3094802', 'Kraków', 'Krakow', '', '50.06143', '19.93658', 'P', 'PPLA', 'PL'),
+    ('2950159', 'Berlin', 'Berlin', '', '52.52437', '13.41053', 'P', 'PPLC', 'DE'),
+    ('2147714', 'Sydney', 'Sydney', '', '-33.86785', '151.20732', 'P', 'PPLA', 'AU'),
+]
+
+COUNTRIES = [
+    ('PL', 'POL', '616', 'PL', 'Poland'),
+    ('DE', 'DEU', '276', 'GM', 'Germany'),
+]
+
+
+class GeocodingTestMixin(object):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.gazetteer_path = os.path.join(directory, 'cities.txt')
+        with open(self.gazetteer_path, 'w', encoding='utf-8') as gazetteer:
+            gazetteer.write('# comment\n')
+            for city in CITIES:
+                gazetteer.write('\t'.join(city + ('', '', '', '', '', '100000')) + '\n')
+            gazetteer.write('broken\tline\n')
+        self.countries_path = os.path.join(directory, 'countryInfo.txt')
+        with open(self.countries_path, 'w', encoding='utf-8') as countries:
+            countries.write('#ISO\tISO3\tISO-Numeric\tfips\tCountry\n')
+            for country in COUNTRIES:
+                countries.write('\t'.join(country) + '\n')
+        self.geocoder = ReverseGeocoder(self.gazetteer_path, self.countries_path, max_distance_km=50)
+        for target in ('scrapper.geocoding.reverse_geocoder', 'scrapper.views.reverse_geocoder'):
+            patcher = patch(target, self.geocoder)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class ReverseGeocoderTest(GeocodingTestMixin, TestCase):
+    def test_read_gazetteer(self):
+        """
+        Test if cities are read from GeoNames file skipping malformed lines
+        """
+        names, latitudes, longitudes, country_codes = read_gazetteer(self.gazetteer_path)
+
+        self.assertEqual(names, ['Warsaw', 'Kraków', 'Berlin', 'Sydney'])
+        self.assertEqual(latitudes[0], 52.22977)
+        self.assertEqual(longitudes[2], 13.41053)
+        self.assertEqual(country_codes, ['PL', 'PL', 'DE', 'AU'])
+
+    def test_lookup(self):
+        """
+        Test if the nearest city is found, with country name when it is known
+        """
+        city, country, distance = self.geocoder.lookup(52.25, 21.0)
+        self.assertEqual((city, country), ('Warsaw', 'Poland'))
+        self.assertLess(distance, 5)
+
+        self.assertEqual(self.geocoder.lookup(50.1, 19.9)[:2], ('Kraków', 'Poland'))
+        self.assertEqual(self.geocoder.lookup(-33.9, 151.2)[:2], ('Sydney', 'AU'))
+        # Too far from every city
+        self.assertIsNone(self.geocoder.lookup(0, 0))
+
+    def test_lookup_is_memoized(self):
+        """
+        Test if points in the same cell are looked up only once
+        """
+        self.geocoder.lookup(52.25, 21.0)
+        with patch.object(self.geocoder, '_lookup', wraps=self.geocoder._lookup) as lookup:
+            self.geocoder.lookup(52.251, 21.001)
+            self.geocoder.lookup(0.001, 0.001)
+            self.geocoder.lookup(0.002, 0.002)
+
+        self.assertEqual(lookup.call_count, 1)
+
+    def test_memoized_distance_from_given_point(self):
+        """
+        Test if distance is measured from given point, not from centre of its memoized cell
+        """
+        geocoder = ReverseGeocoder(self.gazetteer_path, max_distance_km=50, cell_precision=0)
+        self.assertLess(geocoder.lookup(52.0, 21.0)[2], 30)
+
+        city, _, distance = geocoder.lookup(52.22977, 21.01178)
+
+        self.assertEqual(city, 'Warsaw')
+        self.assertLess(distance, 0.001)
+
+    def test_only_blank_fields_are_filled(self):
+        """
+        Test if given city and country are kept
+        """
+        data = {'city': 'Wawa', 'latitude': 52.25, 'longitude': 21.0}
+
+        self.assertTrue(fill_place_data(data, self.geocoder))
+        self.assertEqual((data['city'], data['country']), ('Wawa', 'Poland'))
+        self.assertFalse(fill_place_data(data, self.geocoder))
+
+    def test_unavailable_geocoder(self):
+        """
+        Test if nothing is filled without gazetteer
+        """
+        data = {'latitude': 52.25, 'longitude': 21.0}
+
+        self.assertFalse(fill_place_data(data, ReverseGeocoder()))
+        self.assertNotIn('city', data)
+
+
+class GeocodeOnSaveTest(GeocodingTestMixin, ScrapperAPITestCase):
+    def test_save_fills_blank_fields(self):
+        """
+        Test if place saved with coordinates only gets city and country
+        """
+        place = Place.objects.create(latitude=52.52, longitude=13.4)
+        far = Place.objects.create(latitude=0, longitude=0)
+
+        place.refresh_from_db()
+        self.assertEqual((place.city, place.country), ('Berlin', 'Germany'))
+        self.assertEqual(Place.objects.get(pk=far.pk).city, '')
+        self.assertEqual(place.dedup_key, make_dedup_key('Berlin', 'Germany', 52.52, 13.4))
+
+    def test_bulk_fills_blank_fields(self):
+        """
+        Test if bulk created places are geocoded and deduplicated after that
+        """
+        Place.objects.create(city='Berlin', country='Germany', latitude=52.52, longitude=13.4)
+
+        created, updated, errors = bulk_create_places([
+            {'latitude': 52.52, 'longitude': 13.4},
+            {'latitude': 52.23, 'longitude': 21.01},
+        ])
+
+        self.assertEqual((created, updated, errors), (1, 1, []))
+        self.assertEqual(sorted(Place.objects.values_list('city', 'country')),
+                         [('Berlin', 'Germany'), ('Warsaw', 'Poland')])
+
+    def test_post_finds_geocoded_duplicate(self):
+        """
+        Test if posting coordinates of existing place updates it
+        """
+        Place.objects.create(city='Berlin', country='Germany', latitude=52.52, longitude=13.4)
+
+        response = self.client.post(reverse('places-list'), {'latitude': 52.52, 'longitude': 13.4}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Place.objects.count(), 1)
+
+    def test_geocode_endpoint(self):
+        """
+        Test if API looks up city of given point
+        """
+        response = self.client.get(reverse('places-geocode'), {'lat': 52.25, 'lon': 21})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['city'], response.data['country']), ('Warsaw', 'Poland'))
+        self.assertLess(response.data['distance_km'], 5)
+
+        response = self.client.get(reverse('places-geocode'), {'lat': 0, 'lon': 0})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.client.get(reverse('places-geocode'), {'lat': 100})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.data), {'lat', 'lon'})
+
+        with patch('scrapper.views.reverse_geocoder', ReverseGeocoder()):
+            response = self.client.get(reverse('places-geocode'), {'lat': 52.25, 'lon': 21})
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def test_geocode_places_command(self):
+        """
+        Test if command fills blank fields of saved places
+        """
+        with patch('scrapper.signals.GEOCODE_ON_SAVE', False):
+            warsaw = Place.objects.create(latitude=52.23, longitude=21.01)
+            Place.objects.create(city='Somewhere', latitude=0, longitude=0)
+            Place.objects.create(city='Berlin', country='Germany', latitude=52.52, longitude=13.4)
+        token = Change.objects.latest('pk').pk
+        out = StringIO()
+
+        call_command('geocode_places', gazetteer=self.gazetteer_path, countries=self.countries_path,
+                     chunk_size=1, stdout=out)
+
+        self.assertIn('Filled in 1 of 2 places', out.getvalue())
+        warsaw.refresh_from_db()
+        self.assertEqual((warsaw.city, warsaw.country), ('Warsaw', 'Poland'))
+        self.assertEqual(list(Change.objects.filter(pk__gt=token).values_list('object_id', flat=True)),
+                         [warsaw.pk])
@@ -1,11 +1,15 @@
+import json
+from io import StringIO
+
+from django.core.management import call_command
 from django.urls import reverse
 from rest_framework import status
-from rest_framework.test import APITestCase
 
 from scrapper.models import Group, Place
+from scrapper.tests import ScrapperAPITestCase
 
 
-class AddNewGroupTest(APITestCase):
+class AddNewGroupTest(ScrapperAPITestCase):
     def test_can_add_new_empty_group(self):
         """
         Test if can add new empty group do database 
@@ -67,7 +71,7 @@ class AddNewGroupTest(APITestCase):
         self.assertEqual(Group.objects.count(), 0)
 
 
-class GetGroupsTest(APITestCase):
+class GetGroupsTest(ScrapperAPITestCase):
     def test_get_all_groups(self):
         """
         Test if can retrieve all groups
@@ -94,12 +98,26 @@ class GetGroupsTest(APITestCase):
             'id': 1,
             'name': 'grp1',
             'places': [1]
-        }, response.data)
+        }, response.data['results'])
         self.assertIn({
             'id': 2,
             'name': 'grp2',
             'places': [1, 2]
-        }, response.data)
+        }, response.data['results'])
+
+    def test_get_all_groups_unpaginated(self):
+        """
+        Test if whole groups list can be retrieved when explicitly requested
+        """
+        Group.objects.create(name='grp1')
+        Group.objects.create(name='grp2')
+
+        url = reverse('groups-list')
+
+        response = self.client.get(url, {'all': 'true'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([g['name'] for g in response.data], ['grp1', 'grp2'])
 
     def test_get_group(self):
         """
@@ -116,11 +134,16 @@ class GetGroupsTest(APITestCase):
         response = self.client.get(url)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+        stats = response.data.pop('stats')
         self.assertEqual({
             'id': 1,
             'name': 'grp1',
             'places': [1]
         }, response.data)
+        self.assertEqual(stats['places'], 1)
+        self.assertAlmostEqual(stats['centroid']['latitude'], 52.25)
+        self.assertAlmostEqual(stats['centroid']['longitude'], 21)
+        self.assertEqual(stats['bbox'], [21, 52.25, 21, 52.25])
 
     def test_group_not_found(self):
         """
@@ -133,7 +156,7 @@ class GetGroupsTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
 
-class UpdateGroupTest(APITestCase):
+class UpdateGroupTest(ScrapperAPITestCase):
     def test_update_group_name(self):
         """
         Test if can update group name 
@@ -237,6 +260,53 @@ class UpdateGroupTest(APITestCase):
         self.assertIn(place2, Group.objects.get().places.all())
         self.assertNotIn(place1, Group.objects.get().places.all())
 
+    def test_replace_group_places(self):
+        """
+        Test replacing whole list of group's places
+        """
+        group = Group.objects.create(name='grp1')
+        place1 = Place.objects.create(city='Warsaw', country='Poland', latitude=52.25, longitude=21)
+        place2 = Place.objects.create(city='Berlin', country='Germany', latitude=52.516, longitude=13.4059)
+        place3 = Place.objects.create(city='Paris', country='France', latitude=48.8566, longitude=2.3522)
+        group.places.add(place1, place2)
+
+        url = reverse('group-places', kwargs={'pk': group.id})
+
+        response = self.client.put(url, {'places': [place2.id, place3.id, 999]})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'id': group.id, 'name': 'grp1', 'places': [place2.id, place3.id]})
+        self.assertEqual(set(Group.objects.get().places.all()), {place2, place3})
+
+    def test_change_group_places_many_ids(self):
+        """
+        Test adding and removing more places than fit in single SQL query
+        """
+        group = Group.objects.create(name='grp1')
+        Place.objects.bulk_create([Place(latitude=0, longitude=0) for _ in range(2500)])
+        place_ids = list(Place.objects.values_list('pk', flat=True))
+
+        url = reverse('group-places', kwargs={'pk': group.id})
+
+        response = self.client.post(url, {'places': place_ids})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(group.places.count(), 2500)
+
+        response = self.client.delete(url, {'places': place_ids[:2000]})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['places'], place_ids[2000:])
+
+    def test_bad_group_places_data(self):
+        """
+        Test for error if places are not given as list of ids
+        """
+        group = Group.objects.create(name='grp1')
+        url = reverse('group-places', kwargs={'pk': group.id})
+
+        for data in [{}, {'places': 1}, {'places': ['x']}, {'places': '12'}, {'places': [True]}, {'places': True}]:
+            response = self.client.post(url, data)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_get_group_places(self):
         """
         Test retrieving places' details from single group 
@@ -266,6 +336,24 @@ class UpdateGroupTest(APITestCase):
             'longitude': 13.4059
         }, response.data)
 
+    def test_get_group_places_sparse_compact(self):
+        """
+        Test if group's places can be listed with selected fields in compact format.
+        """
+        group = Group.objects.create(name='grp1')
+        group.places.add(Place.objects.create(city='Warsaw', country='Poland', latitude=52.25, longitude=21))
+
+        url = reverse('group-places', kwargs={'pk': group.id})
+
+        response = self.client.get(url, {'fields': 'id,city'})
+        self.assertEqual(response.data, [{'id': 1, 'city': 'Warsaw'}])
+
+        response = self.client.get(url, {'fields': 'id,latitude', 'format': 'compact'})
+        self.assertEqual(json.loads(response.content.decode()), [['id', 'latitude'], [1, 52.25]])
+
+        response = self.client.get(url, {'fields': 'name'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_get_nonexistent_group_places(self):
         """
         Test for appropriate error message if requested group does not exist 
@@ -277,7 +365,7 @@ class UpdateGroupTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
 
-class DeleteGroupTest(APITestCase):
+class DeleteGroupTest(ScrapperAPITestCase):
     def test_delete_empty_group(self):
         """
         Test deleting empty group 
@@ -331,3 +419,61 @@ class DeleteGroupTest(APITestCase):
         self.assertEqual(Place.objects.count(), 1)
         self.assertEqual(Place.objects.get(), place2)
         self.assertEqual(Place.objects.get(), group2.places.get())
+
+    def test_delete_group_in_background(self):
+        """
+        Test if group deleted asynchronously disappears right away
+        and is purged later
+        """
+        group1 = Group.objects.create(name='grp1')
+        group2 = Group.objects.create(name='grp2')
+        place1 = Place.objects.create(city='Warsaw', country='Poland', latitude=52.25, longitude=21)
+        place2 = Place.objects.create(city='Berlin', country='Germany', latitude=52.516, longitude=13.4059)
+        group1.places.add(place1, place2)
+        group2.places.add(place2)
+
+        url = reverse('group-detail', kwargs={'pk': group1.id})
+
+        response = self.client.delete(url + '?async=true')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(reverse('groups-list'), {'all': 'true'}).data,
+                         [{'id': group2.id, 'name': 'grp2', 'places': [place2.id]}])
+
+        call_command('gc_orphans', stdout=StringIO())
+
+        self.assertEqual(list(Group.objects.all()), [group2])
+        self.assertEqual(list(Place.objects.all()), [place2])
+
+
+class GroupsQueryCountTest(ScrapperAPITestCase):
+    def setUp(self):
+        places = [Place.objects.create(latitude=i, longitude=i) for i in range(5)]
+        for i in range(10):
+            group = Group.objects.create(name='grp%d' % i)
+            group.places.add(*places[:i % 5])
+
+    def test_list_groups_query_count(self):
+        """
+        Test if listing groups costs constant number of queries
+        """
+        url = reverse('groups-list')
+
+        # Groups and their places
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'all': 'true'})
+
+        self.assertEqual(len(response.data), 10)
+        self.assertEqual(response.data[4]['places'], [1, 2, 3, 4])
+
+    def test_list_groups_page_query_count(self):
+        """
+        Test if listing single page of groups costs constant number of queries
+        """
+        url = reverse('groups-list')
+
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'page_size': 5})
+
+        self.assertEqual(len(response.data['results']), 5)
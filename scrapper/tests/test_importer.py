@@ -0,0 +1,136 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from scrapper import importer
+from scrapper.models import Group, ImportCheckpoint, Place
+
+
+class ImportCommandsTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write_file(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as data_file:
+            data_file.write(content)
+        return path
+
+    def call(self, *args):
+        stdout, stderr = StringIO(), StringIO()
+        call_command(*args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_import_places_ndjson(self):
+        """
+        Test importing places from NDJSON, invalid rows are reported and skipped
+        """
+        path = self.write_file('places.ndjson', '\n'.join([
+            json.dumps({'city': 'Warsaw', 'country': 'Poland', 'latitude': 52.25, 'longitude': 21}),
+            json.dumps({'city': 'Berlin', 'latitude': 'not_a_number', 'longitude': 13.4059}),
+            '{broken',
+            '',
+            json.dumps({'city': 'Paris', 'latitude': 48.8566, 'longitude': 2.3522}),
+        ]))
+
+        stdout, stderr = self.call('import_places', path, '--batch-size', '2')
+
+        self.assertEqual(sorted(Place.objects.values_list('city', flat=True)), ['Paris', 'Warsaw'])
+        self.assertIn('Imported 2 places, 2 invalid', stdout)
+        self.assertEqual(stderr.count('Invalid record'), 2)
+        self.assertFalse(ImportCheckpoint.objects.exists())
+
+    def test_import_places_csv(self):
+        """
+        Test importing places from CSV with header row
+        """
+        path = self.write_file('places.csv', 'city,country,latitude,longitude\n'
+                                             'Warsaw,Poland,52.25,21\n'
+                                             '"Frankfurt, Main",Germany,50.11,8.68\n')
+
+        self.call('import_places', path)
+
+        place = Place.objects.get(country='Germany')
+        self.assertEqual((place.city, place.latitude), ('Frankfurt, Main', 50.11))
+        self.assertEqual(Place.objects.count(), 2)
+
+    def test_import_resumes_from_checkpoint(self):
+        """
+        Test if import interrupted by crash continues after last committed batch
+        """
+        path = self.write_file('places.ndjson', '\n'.join(
+            json.dumps({'city': 'City%d' % i, 'latitude': i, 'longitude': i}) for i in range(10)
+        ))
+        calls = []
+
+        def crash_on_third_batch(rows, batch_size=None):
+            calls.append(len(rows))
+            if len(calls) == 3:
+                raise RuntimeError('crash')
+            return original_insert(rows, batch_size)
+
+        original_insert = importer.upsert_places
+        with patch('scrapper.importer.upsert_places', crash_on_third_batch):
+            with self.assertRaises(RuntimeError):
+                self.call('import_places', path, '--batch-size', '3')
+
+        self.assertEqual(Place.objects.count(), 6)
+        self.assertEqual(ImportCheckpoint.objects.get(source=path).rows, 6)
+
+        stdout, _ = self.call('import_places', path, '--batch-size', '3')
+
+        self.assertIn('Resuming', stdout)
+        self.assertEqual(sorted(Place.objects.values_list('latitude', flat=True)), list(range(10)))
+
+    def test_crash_after_batch_write_not_checkpointed(self):
+        """
+        Test if batch is rolled back together with its checkpoint, so resumed
+        import does not create its groups again
+        """
+        path = self.write_file('groups.ndjson', '\n'.join(
+            json.dumps({'name': 'grp%d' % i}) for i in range(4)
+        ))
+
+        original_save = importer.Checkpoint.save
+
+        def crash_on_second_save(checkpoint):
+            original_save(checkpoint)
+            if checkpoint.rows > 2:
+                raise RuntimeError('crash')
+
+        with patch.object(importer.Checkpoint, 'save', crash_on_second_save):
+            with self.assertRaises(RuntimeError):
+                self.call('import_groups', path, '--batch-size', '2')
+
+        self.assertEqual(Group.objects.count(), 2)
+        self.assertEqual(ImportCheckpoint.objects.get(source=path).rows, 2)
+
+        self.call('import_groups', path, '--batch-size', '2')
+
+        self.assertEqual(sorted(Group.objects.values_list('name', flat=True)),
+                         ['grp0', 'grp1', 'grp2', 'grp3'])
+
+    def test_import_groups(self):
+        """
+        Test importing groups with their places
+        """
+        warsaw = Place.objects.create(city='Warsaw', latitude=52.25, longitude=21)
+        berlin = Place.objects.create(city='Berlin', latitude=52.516, longitude=13.4059)
+        path = self.write_file('groups.csv', 'name,places\n'
+                                             'grp1,%d %d\n'
+                                             ',%d\n'
+                                             'grp2,\n' % (warsaw.id, berlin.id, warsaw.id))
+
+        stdout, stderr = self.call('import_groups', path)
+
+        self.assertEqual(set(Group.objects.get(name='grp1').places.all()), {warsaw, berlin})
+        self.assertEqual(Group.objects.get(name='grp2').places.count(), 0)
+        self.assertEqual(Group.objects.count(), 2)
+        self.assertIn('name', stderr)
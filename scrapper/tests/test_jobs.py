@@ -0,0 +1,183 @@
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from scrapper import jobs
+from scrapper.jobs import Worker, claim, complete, enqueue, fail, heartbeat, requeue_dead
+from scrapper.models import Job
+from scrapper.scraper import ScrapeStats
+
+
+class ClaimTest(TestCase):
+    def test_claim_by_priority(self):
+        """
+        Test if jobs are claimed highest priority first and only once.
+        """
+        low = enqueue('sleep', priority=0)
+        high = enqueue('sleep', priority=10)
+        enqueue('scrape', priority=20)
+
+        self.assertEqual(claim('worker1', kinds=['sleep']), [high])
+        claimed = claim('worker2', kinds=['sleep'], limit=5)
+        self.assertEqual(claimed, [low])
+        self.assertEqual(claimed[0].status, Job.RUNNING)
+        self.assertEqual(claimed[0].attempts, 1)
+        self.assertEqual(claimed[0].lease_owner, 'worker2')
+        self.assertEqual(claim('worker3', kinds=['sleep']), [])
+
+    def test_claim_fallbacks(self):
+        """
+        Test if jobs are claimed the same way by every claiming strategy.
+        """
+        strategies = [
+            {'has_select_for_update_skip_locked': True},
+            {'has_select_for_update_skip_locked': False, 'allow_sliced_subqueries_with_in': True},
+            {'has_select_for_update_skip_locked': False, 'allow_sliced_subqueries_with_in': False},
+        ]
+        for features in strategies:
+            Job.objects.all().delete()
+            created = [enqueue('sleep', priority=i % 3) for i in range(5)]
+            expected = sorted(created, key=lambda job: (-job.priority, job.pk))
+            with patch.multiple(connection.features, **features):
+                claimed = claim('worker', limit=3) + claim('worker', limit=3)
+            self.assertEqual(claimed, expected)
+
+    def test_not_ready_and_expired_jobs(self):
+        """
+        Test if delayed jobs wait and jobs with expired lease are claimed again.
+        """
+        enqueue('sleep', run_after=timezone.now() + timedelta(hours=1))
+        job = enqueue('sleep')
+        claim('crashed', lease=60)
+        self.assertEqual(claim('worker'), [])
+
+        Job.objects.filter(pk=job.pk).update(lease_expires=timezone.now() - timedelta(seconds=1))
+        claimed = claim('worker')
+
+        self.assertEqual(claimed, [job])
+        self.assertEqual(claimed[0].attempts, 2)
+        # Crashed worker cannot finish job taken over by other one
+        stale = Job.objects.get(pk=job.pk)
+        stale.lease_token = 'old'
+        self.assertFalse(complete(stale))
+        self.assertTrue(complete(claimed[0]))
+
+    def test_abandoned_job_dead_lettered(self):
+        """
+        Test if job abandoned on its last attempt, like by worker it crashed, is dead-lettered instead of claimed.
+        """
+        job = enqueue('sleep', max_attempts=2)
+        for _ in range(2):
+            claim('crashed', lease=60)
+            Job.objects.filter(pk=job.pk).update(lease_expires=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(claim('worker'), [])
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts, job.lease_token), (Job.DEAD, 2, ''))
+        self.assertIn('Lease expired', job.last_error)
+
+    def test_heartbeat(self):
+        """
+        Test if heartbeat extends lease of held jobs.
+        """
+        enqueue('sleep')
+        job, = claim('worker', lease=10)
+
+        self.assertEqual(heartbeat(job.lease_token, lease=3600), 1)
+        self.assertGreater(Job.objects.get().lease_expires, job.lease_expires)
+        complete(job)
+        self.assertEqual(heartbeat(job.lease_token), 0)
+
+    def test_retry_and_dead_letter(self):
+        """
+        Test if failed job is retried with backoff and dead-lettered after last attempt.
+        """
+        enqueue('sleep', max_attempts=2)
+        job, = claim('worker')
+
+        self.assertTrue(fail(job, 'boom'))
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=jobs.JOB_RETRY_BACKOFF - 5))
+
+        Job.objects.update(run_after=timezone.now())
+        job, = claim('worker')
+        fail(job, 'boom again')
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.last_error), (Job.DEAD, 'boom again'))
+        self.assertEqual(claim('worker'), [])
+
+        self.assertEqual(requeue_dead(), 1)
+        self.assertEqual(len(claim('worker')), 1)
+
+
+class WorkerTest(TestCase):
+    def test_worker_runs_jobs(self):
+        """
+        Test if worker runs handlers of jobs and records their results.
+        """
+        calls = []
+        handlers = {
+            'ok': calls.append,
+            'broken': lambda payload: 1 / 0,
+        }
+        enqueue('ok', {'n': 1})
+        enqueue('broken', max_attempts=1)
+        enqueue('unknown', max_attempts=1)
+        enqueue('ok', {'n': 2})
+
+        with patch.dict(jobs.JOB_HANDLERS, handlers), self.assertLogs('scrapper.jobs', 'WARNING'):
+            processed = Worker(batch_size=2).run(exit_when_empty=True)
+
+        self.assertEqual(processed, 4)
+        self.assertEqual(calls, [{'n': 1}, {'n': 2}])
+        self.assertEqual(sorted(Job.objects.values_list('kind', 'status')), [
+            ('broken', Job.DEAD), ('ok', Job.DONE), ('ok', Job.DONE), ('unknown', Job.DEAD),
+        ])
+        self.assertIn('ZeroDivisionError', Job.objects.get(kind='broken').last_error)
+
+    def test_max_jobs(self):
+        """
+        Test if worker stops after given number of jobs.
+        """
+        for _ in range(3):
+            enqueue('sleep')
+
+        self.assertEqual(Worker(batch_size=5).run(max_jobs=2), 2)
+        self.assertEqual(Job.objects.filter(status=Job.QUEUED).count(), 1)
+
+    def test_scrape_job_with_failed_pages_retried(self):
+        """
+        Test if scrape job fails, so it is retried, when some of its pages could not be fetched.
+        """
+        stats = ScrapeStats()
+        stats.pages, stats.failed_pages = 2, 1
+        enqueue('scrape', {'urls': ['http://graph/a']})
+
+        with patch('scrapper.scraper.Scraper.run', return_value=stats), self.assertLogs('scrapper.jobs', 'WARNING'):
+            Worker().run(max_jobs=1)
+
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertIn('FetchError: 1 of 3 pages failed', job.last_error)
+
+    def test_enqueue_scrape_command(self):
+        """
+        Test if scrape command queues job for every source.
+        """
+        out = StringIO()
+
+        call_command('scrape', 'http://graph/a', 'http://graph/b', enqueue=True, page_size=50, stdout=out)
+
+        self.assertIn('Queued 2 scrape jobs', out.getvalue())
+        payloads = [json.loads(payload) for payload in Job.objects.order_by('pk').values_list('payload', flat=True)]
+        self.assertEqual(payloads, [
+            {'page_size': 50, 'urls': ['http://graph/a'], 'group': None},
+            {'page_size': 50, 'urls': ['http://graph/b'], 'group': None},
+        ])
@@ -0,0 +1,144 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import CommandError, call_command
+from django.db.models import Count
+from django.test import TransactionTestCase, override_settings
+
+from scrapper.caching import change_log
+from scrapper.loadtest import SCENARIOS, BenchmarkContext, compare, run_scenario, seed_data
+from scrapper.membership import Membership
+from scrapper.models import Change, Group, Place
+
+
+class SeedDataTest(TransactionTestCase):
+    def test_seed_data(self):
+        """
+        Test if seeded data have requested size and skewed distribution.
+        """
+        created = seed_data(places=2000, groups=50, memberships=1000, cities=100, seed=1)
+
+        self.assertEqual(created['places'], 2000)
+        self.assertEqual(created['groups'], 50)
+        self.assertEqual(Place.objects.count(), 2000)
+        self.assertEqual(Group.objects.count(), 50)
+        self.assertEqual(Change.objects.filter(kind=Change.PLACE).count(), 2000)
+        self.assertEqual(Membership.objects.count(), created['memberships'])
+        self.assertGreater(created['memberships'], 500)
+        self.assertTrue(Place.objects.filter(city='').exists())
+        self.assertFalse(Place.objects.exclude(city='').filter(city_key='').exists())
+
+        cities = list(Place.objects.exclude(city='').values('city').annotate(places=Count('pk'))
+                      .order_by('-places').values_list('places', flat=True))
+        self.assertGreater(cities[0], 10 * cities[-1])
+        sizes = list(Membership.objects.values('group_id').annotate(places=Count('pk'))
+                     .order_by('-places').values_list('places', flat=True))
+        self.assertGreater(sizes[0], 10 * sizes[-1])
+
+    def test_seed_data_reproducible(self):
+        """
+        Test if the same seed gives the same data.
+        """
+        seed_data(places=300, groups=10, memberships=100, cities=20, seed=5)
+        first = list(Place.objects.order_by('pk').values_list('city', 'country', 'latitude', 'longitude'))
+        Membership.objects.all().delete()
+        Place.objects.all().delete()
+        Group.objects.all().delete()
+
+        seed_data(places=300, groups=10, memberships=100, cities=20, seed=5)
+        second = list(Place.objects.order_by('pk').values_list('city', 'country', 'latitude', 'longitude'))
+        self.assertEqual(first, second)
+
+    def test_seed_data_command(self):
+        """
+        Test if seed_data command refuses to fill database which is not empty.
+        """
+        out = StringIO()
+        call_command('seed_data', places=100, groups=5, memberships=20, cities=10, stdout=out)
+        self.assertIn('Created 100 places, 5 groups', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('seed_data', places=100, groups=5, memberships=20, stdout=StringIO())
+
+
+class BenchmarkTest(TransactionTestCase):
+    def setUp(self):
+        seed_data(places=500, groups=20, memberships=200, cities=30, seed=2)
+        # Change log is read once, so numbers of queries compared against baseline do not depend on timing
+        patcher = patch.object(change_log, 'interval', 3600)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        change_log.reset()
+
+    def test_run_scenarios(self):
+        """
+        Test if every scenario runs without errors from several threads.
+        """
+        context = BenchmarkContext.load()
+        for scenario in SCENARIOS:
+            with self.subTest(scenario.name):
+                # Shared in-memory test database locks tables of concurrent writers
+                concurrency = 1 if scenario.writes else 2
+                result = run_scenario(scenario, context, requests=6, concurrency=concurrency, warmup=1,
+                                      host='testserver')
+                self.assertEqual(result['requests'], 6)
+                self.assertEqual(result['errors'], 0)
+                self.assertGreater(result['throughput'], 0)
+                self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            result = run_scenario(SCENARIOS[0], context, requests=2, warmup=0, host='testserver')
+        self.assertGreater(result['queries'], 0)
+        self.assertEqual(Place.objects.filter(country='Benchland').count(), 700)
+        self.assertTrue(Place.objects.filter(country='Benchmarked').exists())
+        # Deleted groups take places which belong to no other group with them
+        self.assertLessEqual(Place.objects.count(), 500 + 700 - 7)
+        self.assertEqual(Group.objects.filter(name__startswith='Bench').count(), 7)
+        self.assertEqual(Group.objects.count(), 20 + 7 - 7)
+
+    def test_compare(self):
+        """
+        Test if slower, query heavier and failing results are regressions and noise is not.
+        """
+        base = {'requests': 100, 'errors': 0, 'throughput': 100.0, 'p50_ms': 10.0, 'p95_ms': 20.0,
+                'p99_ms': 30.0, 'queries': 2.0}
+        self.assertEqual(compare({'a': dict(base, p50_ms=11.0, p99_ms=60.0, throughput=90.0)}, {'a': base}), [])
+        self.assertEqual(compare({'b': dict(base, p50_ms=100.0)}, {'a': base}), [])
+
+        regressions = compare({'a': dict(base, p95_ms=30.0, throughput=50.0, queries=3.0, errors=1)}, {'a': base})
+        self.assertEqual(len(regressions), 4)
+        self.assertTrue(all(regression.startswith('a: ') for regression in regressions))
+        # Small absolute slowdown of fast routes is noise
+        fast = dict(base, p50_ms=0.5, p95_ms=1.0)
+        self.assertEqual(compare({'a': dict(fast, p50_ms=1.0)}, {'a': fast}), [])
+
+    def test_bench_api_command(self):
+        """
+        Test if bench_api command writes results and fails on regressions against baseline.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            out = StringIO()
+            call_command('bench_api', scenarios=['place-detail', 'groups-list'], requests=4, concurrency=2,
+                         warmup=0, host='testserver', output=output, stdout=out, stderr=StringIO())
+            self.assertIn('place-detail', out.getvalue())
+            with open(output) as results_file:
+                results = json.load(results_file)
+            self.assertEqual(list(results['scenarios']), ['place-detail', 'groups-list'])
+            self.assertEqual(results['config']['requests'], 4)
+            self.assertFalse(results['config']['cache'])
+
+            baseline = os.path.join(directory, 'baseline.json')
+            # Only the number of queries regresses, timings are left to chance otherwise
+            results['scenarios']['place-detail'].update(p50_ms=1000.0, p95_ms=1000.0, throughput=0.0)
+            results['scenarios']['place-detail']['queries'] -= 1
+            with open(baseline, 'w') as baseline_file:
+                json.dump(results, baseline_file)
+            with self.assertRaisesRegex(CommandError, '1 regressions'):
+                call_command('bench_api', scenarios=['place-detail'], requests=4, concurrency=1, warmup=0,
+                             host='testserver', baseline=baseline, stdout=StringIO(),
+                             stderr=StringIO())
+
+        with self.assertRaises(CommandError):
+            call_command('bench_api', scenarios=['unknown'], stdout=StringIO(), stderr=StringIO())
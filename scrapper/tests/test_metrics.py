@@ -0,0 +1,135 @@
+import re
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+from django.urls import reverse
+from rest_framework import status
+
+from scrapper.metrics import RequestMetrics, _local, registry, timed
+from scrapper.models import Group, Place
+from scrapper.tests import ScrapperAPITestCase
+
+
+class TimingTest(SimpleTestCase):
+    def test_timed_without_request(self):
+        """
+        Test if timing outside of measured request does nothing
+        """
+        with timed('serialize'):
+            pass
+
+    def test_timed_excludes_sql(self):
+        """
+        Test if SQL time within timed block is not counted twice
+        """
+        metrics = RequestMetrics()
+        _local.metrics = metrics
+        try:
+            with patch('scrapper.metrics.perf_counter', side_effect=[10.0, 12.5]):
+                with timed('serialize'):
+                    metrics.sql += 2.0
+        finally:
+            _local.metrics = None
+
+        self.assertEqual(metrics.serialize, 0.5)
+
+    def test_server_timing(self):
+        """
+        Test if metrics are formatted as Server-Timing header
+        """
+        metrics = RequestMetrics()
+        metrics.sql_queries, metrics.sql, metrics.total, metrics.response_bytes = 3, 0.002, 0.01, 120
+
+        self.assertEqual(metrics.server_timing(), 'sql;dur=2.000;desc="3 queries", serialize;dur=0.000, '
+                                                  'render;dur=0.000, total;dur=10.000, size;desc="120 bytes"')
+
+
+class MetricsMiddlewareTest(ScrapperAPITestCase):
+    def setUp(self):
+        for target in ('scrapper.metrics.METRICS_ENABLED', 'scrapper.views.METRICS_ENABLED'):
+            patcher = patch(target, True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        registry.clear()
+        self.addCleanup(registry.clear)
+        self.place = Place.objects.create(city='Warsaw', country='Poland', latitude=52.25, longitude=21)
+        Group.objects.create(name='Capitals').places.add(self.place)
+
+    def server_timing(self, response):
+        return {
+            name: (float(duration) if duration else None, description)
+            for name, duration, description in re.findall(
+                r'(\w+)(?:;dur=([\d.]+))?(?:;desc="([^"]*)")?', response['Server-Timing'])
+        }
+
+    def test_server_timing_header(self):
+        """
+        Test if request phases are reported in Server-Timing header
+        """
+        response = self.client.get(reverse('group-detail', kwargs={'pk': Group.objects.get().pk}))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        timing = self.server_timing(response)
+        self.assertEqual(set(timing), {'sql', 'serialize', 'render', 'total', 'size'})
+        self.assertEqual(timing['size'][1], '%d bytes' % len(response.content))
+        self.assertRegex(timing['sql'][1], r'^[1-9]\d* queries$')
+        self.assertGreater(timing['render'][0], 0)
+        self.assertGreater(timing['serialize'][0], 0)
+        self.assertGreaterEqual(timing['total'][0], timing['sql'][0] + timing['render'][0])
+
+    def test_render_of_cached_route(self):
+        """
+        Test if render time is measured on routes whose responses are rendered to be cached
+        """
+        response = self.client.get(reverse('places-list'), {'all': 'true'})
+
+        self.assertGreater(self.server_timing(response)['render'][0], 0)
+
+    def test_unknown_method_label(self):
+        """
+        Test if requests with methods out of HTTP vocabulary share single label
+        """
+        self.client.generic('BREW', reverse('places-list'))
+        self.client.generic('STEEP', reverse('places-list'))
+
+        text = registry.exposition()
+        self.assertIn('scrapper_requests_total{route="places-list",method="other",status="405"} 2', text)
+        self.assertNotIn('BREW', text)
+
+    def test_metrics_endpoint(self):
+        """
+        Test if latency histograms are exposed per route in Prometheus format
+        """
+        self.client.get(reverse('places-list'))
+        self.client.get(reverse('places-list'))
+        self.client.get(reverse('place-detail', kwargs={'pk': 0}))
+        self.client.get('/missing/')
+
+        response = self.client.get(reverse('metrics'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn('# TYPE scrapper_request_duration_seconds histogram', text)
+        self.assertIn('scrapper_request_duration_seconds_bucket{route="places-list",method="GET",le="+Inf"} 2', text)
+        self.assertIn('scrapper_request_duration_seconds_count{route="places-list",method="GET"} 2', text)
+        self.assertIn('scrapper_requests_total{route="place-detail",method="GET",status="404"} 1', text)
+        self.assertIn('scrapper_requests_total{route="unmatched",method="GET",status="404"} 1', text)
+        self.assertRegex(text, r'scrapper_sql_queries_total\{route="places-list",method="GET"\} [1-9]')
+        self.assertRegex(text, r'scrapper_response_bytes_total\{route="places-list",method="GET"\} [1-9]')
+
+        buckets = re.findall(r'scrapper_request_duration_seconds_bucket\{route="places-list",method="GET",'
+                             r'le="[^"]+"\} (\d+)', text)
+        self.assertEqual([int(count) for count in buckets], sorted(int(count) for count in buckets))
+
+
+class MetricsDisabledTest(ScrapperAPITestCase):
+    def test_disabled(self):
+        """
+        Test if nothing is measured nor exposed when metrics are disabled
+        """
+        response = self.client.get(reverse('places-list'))
+        self.assertNotIn('Server-Timing', response)
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
@@ -1,14 +1,16 @@
 import json
 from collections import OrderedDict
+from unittest.mock import patch
 
 from django.urls import reverse
 from rest_framework import status
-from rest_framework.test import APITestCase
 
 from scrapper.models import Place
+from scrapper.pagination import PkCursorPagination
+from scrapper.tests import ScrapperAPITestCase
 
 
-class AddNewPlaceTest(APITestCase):
+class AddNewPlaceTest(ScrapperAPITestCase):
     def test_can_add_new_place(self):
         """
         Test if we can add new place to database.
@@ -72,7 +74,7 @@ class AddNewPlaceTest(APITestCase):
         self.assertEqual(Place.objects.count(), 0)
 
 
-class GetPlacesTest(APITestCase):
+class GetPlacesTest(ScrapperAPITestCase):
     def test_get_all_places(self):
         """
         Test if can retrieve all places.
@@ -91,14 +93,156 @@ class GetPlacesTest(APITestCase):
             'country': 'Poland',
             'latitude': 52.25,
             'longitude': 21
-        }, response.data)
+        }, response.data['results'])
         self.assertIn({
             'id': 2,
             'city': 'Berlin',
             'country': 'Germany',
             'latitude': 52.516,
             'longitude': 13.4059
-        }, response.data)
+        }, response.data['results'])
+
+    def test_get_places_paginated(self):
+        """
+        Test if places list is split into pages which can be followed with cursor.
+        """
+        url = reverse('places-list')
+        for i in range(5):
+            Place.objects.create(city='City%d' % i, latitude=i, longitude=i)
+
+        response = self.client.get(url, {'page_size': 2})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p['id'] for p in response.data['results']], [1, 2])
+        self.assertIsNone(response.data['previous'])
+
+        ids = []
+        next_url = url + '?page_size=2'
+        while next_url:
+            page = json.loads(self.client.get(next_url).content.decode())
+            ids.extend(p['id'] for p in page['results'])
+            next_url = page['next']
+
+        self.assertEqual(ids, [1, 2, 3, 4, 5])
+
+    def test_page_size_is_limited(self):
+        """
+        Test if client cannot request page larger than allowed maximum.
+        """
+        url = reverse('places-list')
+        for i in range(3):
+            Place.objects.create(latitude=i, longitude=i)
+
+        with patch.object(PkCursorPagination, 'max_page_size', 2):
+            response = self.client.get(url, {'page_size': 100})
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_get_all_places_unpaginated(self):
+        """
+        Test if whole list can be retrieved when explicitly requested.
+        """
+        url = reverse('places-list')
+        for i in range(3):
+            Place.objects.create(latitude=i, longitude=i)
+
+        response = self.client.get(url, {'all': 'true'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 3)
+
+    def test_get_places_streamed(self):
+        """
+        Test if streamed places dump is the same as unpaginated list.
+        """
+        url = reverse('places-list')
+        Place.objects.create(city='Kraków', country='Poland', latitude=50.06, longitude=19.94)
+        for i in range(4):
+            Place.objects.create(city='City%d' % i, latitude=i, longitude=i + 0.5)
+
+        with patch('scrapper.streaming.STREAM_CHUNK_SIZE', 2):
+            response = self.client.get(url, {'stream': 'true'})
+        streamed = b''.join(response.streaming_content)
+        expected = self.client.get(url, {'all': 'true'}).content
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(streamed, expected)
+
+    def test_get_empty_places_streamed(self):
+        """
+        Test if streaming empty places table gives empty JSON array.
+        """
+        url = reverse('places-list')
+
+        response = self.client.get(url, {'stream': 'true'})
+
+        self.assertEqual(json.loads(b''.join(response.streaming_content).decode()), [])
+
+    def test_get_places_sparse_fields(self):
+        """
+        Test if only requested fields are returned, also without primary key.
+        """
+        url = reverse('places-list')
+        Place.objects.create(city='Warsaw', country='Poland', latitude=52.25, longitude=21)
+
+        response = self.client.get(url, {'fields': 'id,latitude,longitude'})
+        self.assertEqual(json.loads(response.content.decode())['results'],
+                         [{'id': 1, 'latitude': 52.25, 'longitude': 21.0}])
+
+        response = self.client.get(url, {'fields': 'city', 'all': 'true'})
+        self.assertEqual(json.loads(response.content.decode()), [{'city': 'Warsaw'}])
+
+        response = self.client.get(url, {'fields': 'id,population'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('fields', response.data)
+
+    def test_get_places_compact(self):
+        """
+        Test if compact format gives header row followed by arrays of values.
+        """
+        url = reverse('places-list')
+        Place.objects.create(city='Warsaw', country='Poland', latitude=52.25, longitude=21)
+        Place.objects.create(city='Berlin', country='Germany', latitude=52.516, longitude=13.4059)
+
+        response = self.client.get(url, {'fields': 'latitude,longitude', 'format': 'compact', 'page_size': 1})
+        page = json.loads(response.content.decode())
+        self.assertEqual(page['results'], [['latitude', 'longitude'], [52.25, 21.0]])
+
+        page = json.loads(self.client.get(page['next']).content.decode())
+        self.assertEqual(page['results'], [['latitude', 'longitude'], [52.516, 13.4059]])
+
+        response = self.client.get(url, {'format': 'compact', 'all': 'true'})
+        self.assertEqual(json.loads(response.content.decode()), [
+            ['id', 'city', 'country', 'latitude', 'longitude'],
+            [1, 'Warsaw', 'Poland', 52.25, 21.0],
+            [2, 'Berlin', 'Germany', 52.516, 13.4059],
+        ])
+
+    def test_compact_only_on_place_lists(self):
+        """
+        Test if routes not giving compact rows do not accept compact format.
+        """
+        place = Place.objects.create(city='Warsaw', country='Poland', latitude=52.25, longitude=21)
+
+        response = self.client.get(reverse('place-detail', kwargs={'pk': place.pk}), {'format': 'compact'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse('groups-list'), {'format': 'compact'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_get_places_streamed_sparse_compact(self):
+        """
+        Test if streamed places support sparse fields and compact format.
+        """
+        url = reverse('places-list')
+        for i in range(5):
+            Place.objects.create(city='City%d' % i, latitude=i, longitude=i + 0.5)
+
+        for params in [{'fields': 'longitude'}, {'fields': 'city,id', 'format': 'compact'}]:
+            with patch('scrapper.streaming.STREAM_CHUNK_SIZE', 2):
+                response = self.client.get(url, dict(params, stream='true'))
+            streamed = b''.join(response.streaming_content)
+            expected = self.client.get(url, dict(params, all='true')).content
+            self.assertEqual(streamed, expected)
 
     def test_get_place(self):
         """
@@ -130,7 +274,7 @@ class GetPlacesTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
 
-class UpdatePlaceTest(APITestCase):
+class UpdatePlaceTest(ScrapperAPITestCase):
     def test_update_place(self):
         """
         Test if can update place fields. 
@@ -190,7 +334,7 @@ class UpdatePlaceTest(APITestCase):
         self.assertEqual(Place.objects.count(), 0)
 
 
-class DeletePlaceTest(APITestCase):
+class DeletePlaceTest(ScrapperAPITestCase):
     def test_delete_place(self):
         """
         Test if can delete existing place 
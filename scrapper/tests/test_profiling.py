@@ -0,0 +1,118 @@
+import os
+import pstats
+import shutil
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import CommandError, call_command
+from django.urls import reverse
+from rest_framework import status
+
+from scrapper.models import Group, Place
+from scrapper.profiling import check_profile_token, make_profile_token
+from scrapper.tests import ScrapperAPITestCase
+
+
+class ProfilerMiddlewareTest(ScrapperAPITestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        for target, value in (('PROFILE_ROUTES', ('group-places',)), ('PROFILE_DIR', self.directory)):
+            patcher = patch('scrapper.profiling.' + target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.group = Group.objects.create(name='Capitals')
+        self.group.places.add(Place.objects.create(city='Warsaw', country='Poland', latitude=52.25, longitude=21))
+        self.url = reverse('group-places', kwargs={'pk': self.group.pk})
+
+    def reports(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_profiled_request(self):
+        """
+        Test if request with valid token is profiled and its report written
+        """
+        response = self.client.get(self.url, HTTP_X_PROFILE=make_profile_token('group-places'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        name = response['X-Profile-Report']
+        self.assertEqual(self.reports(), [name + '.prof', name + '.sql', name + '.txt'])
+
+        stats = pstats.Stats(os.path.join(self.directory, name + '.prof'))
+        self.assertTrue(any(function == 'group_places' for _, _, function in stats.stats))
+        with open(os.path.join(self.directory, name + '.sql')) as sql_log:
+            sql = sql_log.read()
+        self.assertRegex(sql.splitlines()[0], r'^[1-9]\d* queries, [\d.]+ ms$')
+        self.assertIn('SELECT', sql)
+        with open(os.path.join(self.directory, name + '.txt')) as summary:
+            self.assertTrue(summary.read().startswith('GET %s -> 200 in ' % self.url))
+
+    def test_profiled_request_skips_cache(self):
+        """
+        Test if profiled request runs the view even when it is cached and client has its ETag
+        """
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, HTTP_X_PROFILE=make_profile_token('group-places'),
+                                   HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        stats = pstats.Stats(os.path.join(self.directory, response['X-Profile-Report'] + '.prof'))
+        self.assertTrue(any(function == 'group_places' for _, _, function in stats.stats))
+
+    def test_token_in_query(self):
+        """
+        Test if token can be given as query parameter
+        """
+        response = self.client.get(self.url, {'profile': make_profile_token('group-places')})
+
+        self.assertIn('X-Profile-Report', response)
+        self.assertEqual(len(self.reports()), 3)
+
+    def test_requests_not_profiled(self):
+        """
+        Test if requests without valid token for allowed route are left alone
+        """
+        places_token = make_profile_token('places-list')
+        with self.assertLogs('scrapper.profiling', 'WARNING'):
+            responses = [
+                self.client.get(self.url),
+                self.client.get(self.url, HTTP_X_PROFILE='group-places:forged:token'),
+                self.client.get(self.url, HTTP_X_PROFILE=places_token),
+                self.client.get(reverse('places-list'), HTTP_X_PROFILE=places_token),
+            ]
+            with patch('scrapper.profiling.PROFILE_TOKEN_MAX_AGE', -1):
+                responses.append(self.client.get(self.url, HTTP_X_PROFILE=make_profile_token('group-places')))
+
+        for response in responses:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('X-Profile-Report', response)
+        self.assertEqual(self.reports(), [])
+
+    def test_profile_token_command(self):
+        """
+        Test if command signs tokens only for allowed routes
+        """
+        out = StringIO()
+        call_command('profile_token', 'group-places', stdout=out, stderr=StringIO())
+
+        self.assertTrue(check_profile_token(out.getvalue().strip(), 'group-places'))
+        self.assertFalse(check_profile_token(out.getvalue().strip(), 'places-list'))
+        with self.assertRaises(CommandError):
+            call_command('profile_token', 'places-list')
+
+
+class ProfilerDisabledTest(ScrapperAPITestCase):
+    def test_disabled(self):
+        """
+        Test if nothing is profiled without allowed routes
+        """
+        Group.objects.create(name='Capitals')
+        url = reverse('group-places', kwargs={'pk': Group.objects.get().pk})
+
+        response = self.client.get(url, HTTP_X_PROFILE=make_profile_token('group-places'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('X-Profile-Report', response)
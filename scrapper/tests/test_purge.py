@@ -0,0 +1,61 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from scrapper.membership import Membership, delete_rows
+from scrapper.models import Group, Place
+from scrapper.purge import orphans, purge_group
+
+
+class PurgeGroupTest(TestCase):
+    def setUp(self):
+        self.group1 = Group.objects.create(name='grp1')
+        self.group2 = Group.objects.create(name='grp2')
+        self.places = [Place.objects.create(latitude=i, longitude=i) for i in range(10)]
+        self.group1.places.add(*self.places)
+        self.group2.places.add(*self.places[::3])
+
+    def test_orphans(self):
+        """
+        Test if only places without any group are orphans
+        """
+        self.group1.places.remove(*self.places[:2])
+
+        self.assertEqual(orphans([p.pk for p in self.places]), [self.places[1].pk])
+
+    def test_delete_rows(self):
+        """
+        Test if rows matching all conditions are deleted in chunks and counted
+        """
+        place_pks = [p.pk for p in self.places]
+
+        deleted = delete_rows(Membership, 'place_id', place_pks, chunk_size=4, group_id=self.group2.pk)
+
+        self.assertEqual(deleted, 4)
+        self.assertEqual(self.group2.places.count(), 0)
+        self.assertEqual(self.group1.places.count(), 10)
+
+    def test_purge_group_in_chunks(self):
+        """
+        Test if purge split into many transactions keeps places of other groups
+        """
+        deleted = purge_group(self.group1.pk, chunk_size=3)
+
+        self.assertEqual(deleted, 6)
+        self.assertEqual(list(Group.objects.all()), [self.group2])
+        self.assertEqual(set(Place.objects.all()), set(self.places[::3]))
+        self.assertEqual(set(self.group2.places.all()), set(self.places[::3]))
+
+    def test_gc_ungrouped_places(self):
+        """
+        Test if command deletes places without group only when asked to
+        """
+        loose = Place.objects.create(latitude=1, longitude=1)
+
+        call_command('gc_orphans', stdout=StringIO())
+        self.assertTrue(Place.objects.filter(pk=loose.pk).exists())
+
+        call_command('gc_orphans', '--ungrouped', stdout=StringIO())
+        self.assertFalse(Place.objects.filter(pk=loose.pk).exists())
+        self.assertEqual(Place.objects.count(), 10)
@@ -0,0 +1,98 @@
+import json
+from unittest import skipIf
+
+import numpy as np
+from django.urls import reverse
+from rest_framework import status
+
+from scrapper.models import Group, Place
+from scrapper.renderers import msgpack
+from scrapper.tests import ScrapperAPITestCase
+
+COLUMNS = 'application/x-place-columns'
+
+
+def read_columns(response):
+    count = int(response['X-Row-Count'])
+    content = response.content
+    return (
+        np.frombuffer(content, dtype='<i8', count=count),
+        np.frombuffer(content, dtype='<f8', count=count, offset=8 * count),
+        np.frombuffer(content, dtype='<f8', count=count, offset=16 * count),
+    )
+
+
+class PlaceColumnsRendererTest(ScrapperAPITestCase):
+    def setUp(self):
+        Place.objects.create(city='Warsaw', country='Poland', latitude=52.25, longitude=21)
+        Place.objects.create(city='Berlin', country='Germany', latitude=52.516, longitude=13.4059)
+        Place.objects.create(city='Sydney', latitude=-33.87, longitude=151.21)
+
+    def test_places_as_columns(self):
+        """
+        Test if places list can be loaded by NumPy from binary columns.
+        """
+        response = self.client.get(reverse('places-list'), {'all': 'true'}, HTTP_ACCEPT=COLUMNS)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], COLUMNS)
+        self.assertEqual(len(response.content), 3 * 24)
+        ids, latitudes, longitudes = read_columns(response)
+        self.assertEqual(sorted(zip(ids.tolist(), latitudes.tolist(), longitudes.tolist())), [
+            (1, 52.25, 21.0),
+            (2, 52.516, 13.4059),
+            (3, -33.87, 151.21),
+        ])
+
+    def test_paginated_columns(self):
+        """
+        Test if pages of binary columns are linked by Link header, also when served from cache.
+        """
+        url = reverse('places-list')
+        ids = []
+        next_url = url + '?page_size=2'
+        while next_url:
+            for _ in range(2):
+                response = self.client.get(next_url, HTTP_ACCEPT=COLUMNS)
+            ids.extend(read_columns(response)[0].tolist())
+            link = response.get('Link', '')
+            next_url = link[1:link.index('>')] if 'rel="next"' in link else None
+
+        self.assertEqual(ids, [1, 2, 3])
+
+    def test_group_places_as_columns(self):
+        """
+        Test if group's places can be rendered as binary columns.
+        """
+        group = Group.objects.create(name='grp1')
+        group.places.add(*Place.objects.filter(pk__in=[1, 3]))
+
+        response = self.client.get(reverse('group-places', kwargs={'pk': group.id}), HTTP_ACCEPT=COLUMNS)
+
+        self.assertEqual(sorted(read_columns(response)[0].tolist()), [1, 3])
+
+    def test_errors_rendered_as_json(self):
+        """
+        Test if errors requested as binary columns are rendered as JSON.
+        """
+        response = self.client.get(reverse('places-list'), {'bbox': 'x'}, HTTP_ACCEPT=COLUMNS)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertIn('bbox', json.loads(response.content.decode()))
+
+
+@skipIf(msgpack is None, 'msgpack is not installed')
+class MessagePackRendererTest(ScrapperAPITestCase):
+    def test_places_as_msgpack(self):
+        """
+        Test if places list rendered as MessagePack holds the same data as JSON one.
+        """
+        Place.objects.create(city='Kraków', country='Poland', latitude=50.06, longitude=19.94)
+        url = reverse('places-list')
+
+        response = self.client.get(url, {'fields': 'id,city,latitude'}, HTTP_ACCEPT='application/msgpack')
+
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content, raw=False),
+                         json.loads(self.client.get(url, {'fields': 'id,city,latitude'}).content.decode()))
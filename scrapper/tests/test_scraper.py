@@ -0,0 +1,256 @@
+import asyncio
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from urllib.parse import parse_qs, urlsplit
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TransactionTestCase
+
+from scrapper.models import Group, Place
+from scrapper.scraper import Scraper, TokenBucket, next_page_url, redact_url, retry_after_delay
+
+PLACES = [
+    {'id': str(i), 'name': 'Place %d' % i,
+     'location': {'city': 'City%d' % i, 'country': 'Poland', 'latitude': 50 + i / 100, 'longitude': 20}}
+    for i in range(45)
+]
+# Not a place, counted as invalid
+PLACES[7]['location'] = {'city': 'Nowhere'}
+
+
+class StubGraphHandler(BaseHTTPRequestHandler):
+    """
+    Graph API style source of PLACES, failing some requests once and
+    answering in different encodings.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        self.server.requests.append(self.path)
+        if url.path == '/moved':
+            self.send_response(302)
+            self.send_header('Location', '/places?limit=%s' % query.get('limit', 10))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if url.path == '/loop':
+            self.send_response(301)
+            self.send_header('Location', '/loop')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if url.path == '/broken-chunks':
+            self.send_response(200)
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            self.wfile.write(b'zz\r\n{}\r\n0\r\n\r\n')
+            return
+        if query.get('access_token') != 'secret':
+            return self.respond(403, b'{}')
+        if url.path == '/busy' and self.path not in self.server.failed:
+            self.server.failed.add(self.path)
+            self.send_response(503)
+            self.send_header('Retry-After', '86400')
+            self.send_header('Content-Length', '2')
+            self.end_headers()
+            self.wfile.write(b'{}')
+            return
+        after = int(query.get('after', 0))
+        if after == 20 and self.path not in self.server.failed:
+            self.server.failed.add(self.path)
+            return self.respond(503, b'{}')
+
+        limit = int(query.get('limit', 10))
+        payload = {'data': PLACES[after:after + limit], 'paging': {}}
+        if after + limit < len(PLACES):
+            if url.path == '/cursors':
+                payload['paging']['cursors'] = {'after': str(after + limit)}
+            else:
+                payload['paging']['next'] = 'http://%s:%d%s?access_token=secret&limit=%d&after=%d' % (
+                    self.server.server_address + (url.path, limit, after + limit))
+        self.respond(200, json.dumps(payload).encode(), chunked=after == 10, compressed=after == 30)
+
+    def respond(self, status, body, chunked=False, compressed=False):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        if compressed:
+            body = gzip.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for start in range(0, len(body), 100):
+                chunk = body[start:start + 100]
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+            self.wfile.write(b'0\r\n\r\n')
+        else:
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ScraperTest(TransactionTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubGraphHandler)
+        self.server.requests = []
+        self.server.failed = set()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def scrape(self, *paths, **kwargs):
+        kwargs.setdefault('access_token', 'secret')
+        kwargs.setdefault('backoff', 0.01)
+        kwargs.setdefault('rate', 0)
+        return Scraper([self.base_url + path for path in paths], **kwargs).run()
+
+    def test_scrape_following_cursors(self):
+        """
+        Test if all pages are fetched, following both next links and cursors, and saved.
+        """
+        group = Group.objects.create(name='scraped')
+
+        stats = self.scrape('/places', '/cursors', group=group, page_size=10, batch_size=7, concurrency=4)
+
+        self.assertEqual(stats.pages, 10)
+        self.assertEqual(stats.failed_pages, 0)
+        self.assertEqual(stats.invalid, 2)
+        self.assertEqual(stats.places, 88)
+        self.assertEqual(stats.created, 44)
+        self.assertEqual(Place.objects.count(), 44)
+        self.assertEqual(group.places.count(), 44)
+        self.assertEqual(len(self.server.failed), 2)
+
+    def test_failed_pages_are_skipped(self):
+        """
+        Test if source failing after retries is reported and others are scraped.
+        """
+        with self.assertLogs('scrapper.scraper', 'WARNING'):
+            stats = self.scrape('/places', access_token='wrong', retries=1)
+        self.assertEqual((stats.pages, stats.failed_pages), (0, 1))
+
+        with self.assertLogs('scrapper.scraper', 'WARNING'):
+            stats = self.scrape('/places', page_size=10, retries=0)
+        self.assertEqual((stats.pages, stats.failed_pages), (2, 1))
+        self.assertEqual(Place.objects.count(), 19)
+
+    def test_access_token_not_logged(self):
+        """
+        Test if access token is left out of retry and warning logs, also when source puts it in next links.
+        """
+        with self.assertLogs('scrapper.scraper', 'INFO') as logs:
+            self.scrape('/cursors', page_size=10, retries=1)
+            self.scrape('/places', page_size=10, retries=0)
+
+        self.assertTrue(any('Retrying' in line for line in logs.output))
+        self.assertTrue(any('Skipping' in line for line in logs.output))
+        self.assertNotIn('secret', '\n'.join(logs.output))
+
+    def test_redirects_followed(self):
+        """
+        Test if redirect is followed with access token, and redirect loop fails the page.
+        """
+        stats = self.scrape('/moved', page_size=45)
+        self.assertEqual((stats.pages, stats.places), (1, 44))
+        self.assertIn('access_token=secret', self.server.requests[-1])
+
+        with self.assertLogs('scrapper.scraper', 'WARNING'):
+            stats = self.scrape('/loop', retries=0)
+        self.assertEqual((stats.pages, stats.failed_pages), (0, 1))
+        self.assertEqual(len([path for path in self.server.requests if path.startswith('/loop')]), 6)
+
+    def test_malformed_chunked_body(self):
+        """
+        Test if page with invalid chunk size fails after retries instead of hanging.
+        """
+        with self.assertLogs('scrapper.scraper', 'WARNING') as logs:
+            stats = self.scrape('/broken-chunks', retries=1)
+        self.assertEqual((stats.pages, stats.failed_pages), (0, 1))
+        self.assertIn('Invalid chunk size', logs.output[-1])
+
+    def test_retry_after_is_capped(self):
+        """
+        Test if long Retry-After of source does not park the scraper.
+        """
+        started = time.monotonic()
+        stats = self.scrape('/busy', page_size=45, max_retry_after=0.05)
+
+        self.assertEqual((stats.pages, stats.failed_pages), (1, 0))
+        self.assertLess(time.monotonic() - started, 5)
+
+    def test_max_pages(self):
+        """
+        Test if following cursors stops after given number of pages.
+        """
+        stats = self.scrape('/cursors', page_size=5, max_pages=3)
+
+        self.assertEqual(stats.pages, 3)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_command(self):
+        """
+        Test if scrape command saves places into created group.
+        """
+        out = StringIO()
+
+        call_command('scrape', self.base_url + '/places', group='scraped', access_token='secret',
+                     page_size=50, rate=0, stdout=out)
+
+        self.assertIn('Scraped 44 places', out.getvalue())
+        self.assertEqual(Group.objects.get(name='scraped').places.count(), 44)
+
+
+class ScraperHelpersTest(SimpleTestCase):
+    def test_token_bucket(self):
+        """
+        Test if token bucket lets burst through and spaces out the rest.
+        """
+        async def acquire(count):
+            bucket = TokenBucket(rate=50, burst=2)
+            started = time.monotonic()
+            for _ in range(count):
+                await bucket.acquire()
+            return time.monotonic() - started
+
+        self.assertLess(asyncio.run(acquire(2)), 0.01)
+        self.assertGreaterEqual(asyncio.run(acquire(7)), 0.1 - 0.005)
+
+    def test_next_page_url(self):
+        """
+        Test if next page is taken from link or built from cursor.
+        """
+        url = 'http://graph/places?limit=5&after=a'
+        self.assertEqual(next_page_url(url, {'data': [1], 'paging': {'next': 'http://next'}}), 'http://next')
+        self.assertEqual(next_page_url(url, {'data': [1], 'paging': {'cursors': {'after': 'b'}}}),
+                         'http://graph/places?limit=5&after=b')
+        self.assertIsNone(next_page_url(url, {'data': [], 'paging': {'cursors': {'after': 'b'}}}))
+        self.assertIsNone(next_page_url(url, {'data': [1]}))
+
+    def test_retry_after_delay(self):
+        """
+        Test if Retry-After is read as seconds or HTTP date.
+        """
+        self.assertEqual(retry_after_delay('120'), 120)
+        self.assertEqual(retry_after_delay('Wed, 21 Oct 2015 07:28:00 GMT', now=1445412470), 10)
+        self.assertEqual(retry_after_delay('Wed, 21 Oct 2015 07:28:00 GMT', now=1445412490), 0)
+        self.assertIsNone(retry_after_delay('soon'))
+
+    def test_redact_url(self):
+        """
+        Test if access token is hidden and the rest of URL kept.
+        """
+        self.assertEqual(redact_url('http://graph/places?access_token=secret&limit=5'),
+                         'http://graph/places?access_token=REDACTED&limit=5')
+        self.assertEqual(redact_url('http://graph/places?limit=5'), 'http://graph/places?limit=5')
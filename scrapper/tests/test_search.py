@@ -0,0 +1,205 @@
+from unittest.mock import patch
+
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from rest_framework import status
+
+from scrapper.bulk import bulk_create_places
+from scrapper.models import Change, Group, Place
+from scrapper.purge import purge_group
+from scrapper.search import PlaceSearchIndex, PrefixIndex, search_database, search_index
+from scrapper.tests import ScrapperAPITestCase
+
+PLACES = [
+    ('Berlin', 'Germany', 3),
+    ('berlin ', 'Germany', 1),
+    ('Bern', 'Switzerland', 2),
+    ('Berlin', 'USA', 1),
+    ('Bergen', 'Norway', 1),
+    ('Warsaw', 'Poland', 5),
+    ('', 'Bermuda', 2),
+]
+
+
+def create_places():
+    for city, country, count in PLACES:
+        for index in range(count):
+            Place.objects.create(city=city, country=country, latitude=index, longitude=len(city))
+
+
+class SearchKeysTest(TestCase):
+    def test_keys_are_normalized(self):
+        """
+        Test if search keys are case folded and stripped copies of city and country
+        """
+        place = Place.objects.create(city=' Straße ', country='GERMANY', latitude=1, longitude=2)
+
+        self.assertEqual((place.city_key, place.country_key), ('strasse', 'germany'))
+
+
+class SearchDatabaseTest(TestCase):
+    def setUp(self):
+        create_places()
+
+    def test_cities_by_prefix(self):
+        """
+        Test if cities are grouped by their normalized name and country and ranked by count
+        """
+        self.assertEqual([tuple(row.values()) for row in search_database('city', 'ber', 10)], [
+            ('Berlin', 'Germany', 4),
+            ('Bern', 'Switzerland', 2),
+            ('Bergen', 'Norway', 1),
+            ('Berlin', 'USA', 1),
+        ])
+        self.assertEqual(len(search_database('city', 'ber', 2)), 2)
+        self.assertEqual(search_database('city', 'berlinx', 10), [])
+
+    def test_countries_by_prefix(self):
+        """
+        Test if countries are ranked by count
+        """
+        self.assertEqual([tuple(row.values()) for row in search_database('country', 'ger', 10)],
+                         [('Germany', 4)])
+        self.assertEqual([row['country'] for row in search_database('country', 'b', 10)], ['Bermuda'])
+
+
+class PrefixIndexTest(TestCase):
+    def test_search(self):
+        """
+        Test if keys are found by prefix, most common first, with added keys kept aside
+        """
+        index = PrefixIndex({
+            ('bern', 'ch'): [2, 'Bern'],
+            ('berlin', 'de'): [4, 'Berlin'],
+            ('warsaw', 'pl'): [5, 'Warsaw'],
+            ('', 'bm'): [2, ''],
+        })
+        index.add(('bergen', 'no'), 'Bergen', 3)
+        index.add(('bern', 'ch'), 'Bern', -2)
+
+        self.assertEqual(index.search('ber', 10), [(('berlin', 'de'), 'Berlin', 4), (('bergen', 'no'), 'Bergen', 3)])
+        self.assertEqual(index.search('ber', 1), [(('berlin', 'de'), 'Berlin', 4)])
+        self.assertEqual(index.search('', 10)[0], (('warsaw', 'pl'), 'Warsaw', 5))
+
+    def test_pending_keys_are_merged(self):
+        """
+        Test if arrays are rebuilt once enough keys were added
+        """
+        index = PrefixIndex({})
+        with patch('scrapper.search.SEARCH_PENDING_THRESHOLD', 3):
+            for count, name in enumerate(['a', 'b', 'c', 'd'], 1):
+                index.add((name,), name.upper(), count)
+
+        self.assertEqual(index.keys, [('a',), ('b',), ('c',)])
+        self.assertEqual(index.search('', 10), [(('d',), 'D', 4), (('c',), 'C', 3), (('b',), 'B', 2), (('a',), 'A', 1)])
+
+
+class PlaceSearchIndexTest(TransactionTestCase):
+    def search(self, field, prefix, limit=10):
+        return [tuple(row.values()) for row in search_index.search(field, prefix, limit)]
+
+    def test_index_matches_database(self):
+        """
+        Test if in-memory index gives the same results as database
+        """
+        create_places()
+        index = PlaceSearchIndex()
+
+        for field, prefix in [('city', 'ber'), ('city', 'b'), ('city', 'w'), ('country', 'ger'), ('country', 'b')]:
+            self.assertEqual(index.search(field, prefix, 10), search_database(field, prefix, 10))
+
+    def test_index_follows_saved_places(self):
+        """
+        Test if process wide index is kept in sync by model signals and purge
+        """
+        search_index.rebuild()
+        berlin = Place.objects.create(city='Berlin', country='Germany', latitude=1, longitude=2)
+        Place.objects.create(city='Berlin', country='Germany', latitude=2, longitude=2)
+        self.assertEqual(self.search('city', 'ber'), [('Berlin', 'Germany', 2)])
+
+        berlin.city = 'Bern'
+        berlin.save()
+        self.assertEqual(self.search('city', 'ber'), [('Berlin', 'Germany', 1), ('Bern', 'Germany', 1)])
+
+        berlin.delete()
+        self.assertEqual(self.search('city', 'bern'), [])
+
+        group = Group.objects.create(name='Capitals')
+        group.places.add(*Place.objects.all())
+        purge_group(group.pk)
+        self.assertEqual(self.search('country', 'g'), [])
+
+        bulk_create_places([{'city': 'Bergen', 'country': 'Norway', 'latitude': 1, 'longitude': 1}])
+        self.assertEqual(self.search('city', 'ber'), [('Bergen', 'Norway', 1)])
+
+        # Updated place is counted once
+        bulk_create_places([{'city': 'BERGEN', 'country': 'Norway', 'latitude': 1, 'longitude': 1}])
+        self.assertEqual(self.search('city', 'ber'), [('Bergen', 'Norway', 1)])
+
+    def test_changes_of_other_processes_rebuild(self):
+        """
+        Test if index is rebuilt once interval passed and other process logged changes
+        """
+        index = PlaceSearchIndex()
+        index.rebuild()
+
+        with patch('scrapper.search.threading.Thread') as thread, patch.object(index._log, 'interval', 0):
+            index.search('city', 'ber', 10)
+            thread.assert_not_called()
+            Change.objects.create(kind=Change.PLACE, action=Change.UPSERT, object_id=1)
+            index.search('city', 'ber', 10)
+
+        thread.assert_called_once_with(target=index._background_rebuild, daemon=True)
+
+
+class PlacesSearchApiTest(ScrapperAPITestCase):
+    def setUp(self):
+        create_places()
+
+    def test_search(self):
+        """
+        Test if cities and countries are suggested by prefix
+        """
+        response = self.client.get(reverse('places-search'), {'q': ' BER', 'limit': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [
+            {'city': 'Berlin', 'country': 'Germany', 'places': 4},
+            {'city': 'Bern', 'country': 'Switzerland', 'places': 2},
+        ])
+
+        response = self.client.get(reverse('places-search'), {'q': 'po', 'field': 'country'})
+        self.assertEqual(response.data, [{'country': 'Poland', 'places': 5}])
+
+    def test_short_prefix(self):
+        """
+        Test if single character is searched only in memory
+        """
+        response = self.client.get(reverse('places-search'), {'q': 'b'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('q', response.data)
+
+        with patch('scrapper.search.SEARCH_IN_MEMORY', True), \
+                patch('scrapper.search.search_index', PlaceSearchIndex()):
+            response = self.client.get(reverse('places-search'), {'q': 'b'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['city'], 'Berlin')
+
+    def test_search_in_memory(self):
+        """
+        Test if in-memory index can serve the suggestions
+        """
+        with patch('scrapper.search.SEARCH_IN_MEMORY', True), \
+                patch('scrapper.search.search_index', PlaceSearchIndex()):
+            response = self.client.get(reverse('places-search'), {'q': 'ber'})
+
+        self.assertEqual(len(response.data), 4)
+        self.assertEqual(response.data[0], {'city': 'Berlin', 'country': 'Germany', 'places': 4})
+
+    def test_invalid_params(self):
+        """
+        Test if invalid query parameters are reported
+        """
+        response = self.client.get(reverse('places-search'), {'q': ' ', 'field': 'name', 'limit': 'x'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.data), {'q', 'field', 'limit'})
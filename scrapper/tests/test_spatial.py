@@ -0,0 +1,198 @@
+from unittest.mock import patch
+
+import numpy as np
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from rest_framework import status
+
+from scrapper.bulk import bulk_create_places
+from scrapper.models import Change, Place
+from scrapper.spatial import KDTree, PlaceSpatialIndex, chord_to_km, place_index, to_unit_vectors
+from scrapper.streaming import iterate_in_chunks
+from scrapper.tests import ScrapperAPITestCase
+
+
+class KDTreeTest(TestCase):
+    def setUp(self):
+        random = np.random.RandomState(0)
+        self.latitudes = random.uniform(-90, 90, 2000)
+        self.longitudes = random.uniform(-180, 180, 2000)
+        self.points = to_unit_vectors(self.latitudes, self.longitudes)
+        self.ids = np.arange(1, 2001)
+        self.tree = KDTree(self.ids, self.points, leaf_size=16)
+
+    def brute_force(self, point):
+        distances = ((self.points - point) ** 2).sum(axis=1)
+        return distances, self.ids
+
+    def test_nearest_matches_brute_force(self):
+        """
+        Test if tree finds the same nearest points as brute force search
+        """
+        for lat, lon in [(52.25, 21), (-33.9, 151.2), (89.9, 0), (0, 179.99)]:
+            point = to_unit_vectors(lat, lon)
+            distances, ids = self.brute_force(point)
+            expected = set(ids[np.argsort(distances)[:7]].tolist())
+
+            _, found = self.tree.nearest(point, 7)
+
+            self.assertEqual(set(found.tolist()), expected)
+
+    def test_within_matches_brute_force(self):
+        """
+        Test if tree finds the same points in radius as brute force search
+        """
+        point = to_unit_vectors(10, 20)
+        distances, ids = self.brute_force(point)
+        expected = set(ids[chord_to_km(distances) <= 1500].tolist())
+
+        found_distances, found = self.tree.within(point, distances[np.isin(ids, list(expected))].max())
+
+        self.assertEqual(set(found.tolist()), expected)
+
+    def test_removed_points_are_skipped(self):
+        """
+        Test if removed points are not returned
+        """
+        point = self.points[0]
+        self.tree.remove(int(self.ids[0]))
+
+        _, found = self.tree.nearest(point, 1)
+
+        self.assertNotEqual(found[0], self.ids[0])
+
+
+class PlaceSpatialIndexTest(TestCase):
+    def setUp(self):
+        self.warsaw = Place.objects.create(city='Warsaw', latitude=52.25, longitude=21)
+        self.berlin = Place.objects.create(city='Berlin', latitude=52.516, longitude=13.4059)
+        self.paris = Place.objects.create(city='Paris', latitude=48.8566, longitude=2.3522)
+        self.index = PlaceSpatialIndex()
+
+    def test_nearest(self):
+        """
+        Test if nearest places are returned with great-circle distances
+        """
+        found = self.index.nearest(52.23, 21.01, 2)
+
+        self.assertEqual([pk for pk, _ in found], [self.warsaw.pk, self.berlin.pk])
+        self.assertAlmostEqual(found[1][1], 517, delta=2)
+
+    def test_within(self):
+        """
+        Test if places in radius are returned nearest first
+        """
+        found = self.index.within(52.516, 13.4059, 600)
+
+        self.assertEqual([pk for pk, _ in found], [self.berlin.pk, self.warsaw.pk])
+        self.assertEqual(found[0][1], 0)
+
+    def test_changes_are_applied_without_rebuild(self):
+        """
+        Test if changed and deleted places are found without rebuilding tree
+        """
+        self.index.rebuild()
+        self.index.place_changed(self.paris.pk, 52.4, 16.9)
+        self.index.place_deleted(self.warsaw.pk)
+
+        found = self.index.nearest(52.23, 21.01, 3)
+
+        self.assertEqual([pk for pk, _ in found], [self.paris.pk, self.berlin.pk])
+
+    def test_changes_during_first_build_are_kept(self):
+        """
+        Test if places changed while tree is built for the first time are not lost
+        """
+        def read_places(*args, **kwargs):
+            self.index.place_deleted(self.warsaw.pk)
+            return iterate_in_chunks(*args, **kwargs)
+
+        with patch('scrapper.spatial.iterate_in_chunks', read_places):
+            self.index.rebuild()
+
+        self.assertEqual([pk for pk, _ in self.index.nearest(52.23, 21.01, 3)], [self.berlin.pk, self.paris.pk])
+
+    def test_changes_of_other_processes_rebuild(self):
+        """
+        Test if tree is rebuilt once interval passed and other process logged changes, even without local ones
+        """
+        self.index.rebuild()
+
+        with patch('scrapper.spatial.threading.Thread') as thread, patch.object(self.index._log, 'interval', 0):
+            self.index.nearest(52.23, 21.01, 1)
+            thread.assert_not_called()
+            Change.objects.create(kind=Change.PLACE, action=Change.UPSERT, object_id=self.warsaw.pk)
+            self.index.nearest(52.23, 21.01, 1)
+
+        thread.assert_called_once_with(target=self.index._background_rebuild, daemon=True)
+
+
+class PlaceIndexSignalsTest(TransactionTestCase):
+    def test_index_follows_saved_places(self):
+        """
+        Test if process wide index is kept in sync by model signals
+        """
+        place_index.rebuild()
+        place = Place.objects.create(city='Warsaw', latitude=52.25, longitude=21)
+        self.assertEqual(place_index.nearest(52, 21, 1)[0][0], place.pk)
+
+        place.delete()
+        self.assertEqual(place_index.nearest(52, 21, 1), [])
+
+        with patch.object(place_index, 'mark_stale') as mark_stale:
+            bulk_create_places([{'latitude': 52, 'longitude': 21}])
+        self.assertEqual(len(place_index.nearest(52, 21, 1)), 1)
+        mark_stale.assert_not_called()
+
+    def test_large_bulk_marks_index_stale(self):
+        """
+        Test if bulk upsert over threshold rebuilds index instead of registering places
+        """
+        place_index.rebuild()
+
+        with patch('scrapper.bulk.BULK_INDEX_THRESHOLD', 1), \
+                patch.object(place_index, 'mark_stale') as mark_stale:
+            bulk_create_places([{'latitude': 52, 'longitude': 21}, {'latitude': 50, 'longitude': 20}])
+
+        mark_stale.assert_called_once_with()
+
+
+class NearbyPlacesApiTest(ScrapperAPITestCase):
+    def setUp(self):
+        Place.objects.create(city='Warsaw', country='Poland', latitude=52.25, longitude=21)
+        Place.objects.create(city='Berlin', country='Germany', latitude=52.516, longitude=13.4059)
+        place_index.rebuild()
+
+    def test_nearest_places(self):
+        """
+        Test retrieving k nearest places
+        """
+        url = reverse('places-nearby')
+
+        response = self.client.get(url, {'lat': 52.5, 'lon': 13.4, 'k': 1})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]['city'], 'Berlin')
+        self.assertLess(response.data[0]['distance_km'], 2)
+
+    def test_places_in_radius(self):
+        """
+        Test retrieving places within radius
+        """
+        url = reverse('places-nearby')
+
+        response = self.client.get(url, {'lat': 52.5, 'lon': 13.4, 'radius_km': 100})
+
+        self.assertEqual([p['city'] for p in response.data], ['Berlin'])
+
+    def test_bad_parameters(self):
+        """
+        Test for errors on missing or malformed parameters
+        """
+        url = reverse('places-nearby')
+
+        response = self.client.get(url, {'lat': 'x', 'k': 0})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.data), {'lat', 'lon', 'k'})
@@ -0,0 +1,176 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+
+from scrapper.bulk import upsert_places
+from scrapper.membership import add_places, remove_places, replace_places
+from scrapper.models import Group, GroupStats, Place
+from scrapper.purge import merge_duplicate_places
+from scrapper.stats import Membership, summarize
+from scrapper.tests import ScrapperAPITestCase
+
+
+class GroupStatsTest(TestCase):
+    def setUp(self):
+        self.places = [Place.objects.create(latitude=i * 10 - 40, longitude=i * 20 - 90) for i in range(8)]
+        self.group1 = Group.objects.create(name='grp1')
+        self.group2 = Group.objects.create(name='grp2')
+
+    def assertStatsFresh(self):
+        rows = list(Membership.objects.values_list('group_id', 'place__latitude', 'place__longitude'))
+        expected = summarize(*zip(*rows)) if rows else {}
+        for stats in GroupStats.objects.all():
+            values = expected.get(stats.group_id, {})
+            self.assertEqual(stats.places, values.get('places', 0))
+            for name in ('x', 'y', 'z'):
+                self.assertAlmostEqual(getattr(stats, name), values.get(name, 0))
+            for name in ('min_latitude', 'max_latitude', 'min_longitude', 'max_longitude'):
+                self.assertEqual(getattr(stats, name), values.get(name))
+
+    def test_related_managers(self):
+        """
+        Test if stats follow places added and removed from both sides of relation.
+        """
+        self.group1.places.add(*self.places[:5])
+        self.assertStatsFresh()
+        self.group1.places.remove(self.places[0], self.places[2], self.places[7])
+        self.assertStatsFresh()
+        self.places[7].groups.add(self.group1, self.group2)
+        self.assertStatsFresh()
+        self.places[4].groups.remove(self.group1, self.group2)
+        self.assertStatsFresh()
+        self.group2.places.set(self.places[2:6])
+        self.assertStatsFresh()
+        self.places[3].groups.clear()
+        self.assertStatsFresh()
+        self.group2.places.clear()
+        self.assertStatsFresh()
+
+        stats = GroupStats.objects.get(group=self.group2)
+        self.assertEqual((stats.places, stats.x, stats.centroid, stats.bbox), (0, 0, None, None))
+
+    def test_membership_functions(self):
+        """
+        Test if stats follow places added, removed and replaced without loading them.
+        """
+        pks = [place.pk for place in self.places]
+        add_places(self.group1, pks[:6])
+        self.assertStatsFresh()
+        remove_places(self.group1, pks[4:])
+        self.assertStatsFresh()
+        replace_places(self.group1, pks[2:])
+        self.assertStatsFresh()
+
+    def test_bbox_shrinks(self):
+        """
+        Test if bounding box shrinks when place on its edge leaves and keeps otherwise.
+        """
+        self.group1.places.add(*self.places[:4])
+        self.group1.places.remove(self.places[1])
+        self.assertEqual(GroupStats.objects.get(group=self.group1).bbox, (-90, -40, -30, -10))
+        self.group1.places.remove(self.places[3])
+        self.assertEqual(GroupStats.objects.get(group=self.group1).bbox, (-90, -40, -50, -20))
+
+    def test_place_moved_and_deleted(self):
+        """
+        Test if stats follow saved and deleted places of groups.
+        """
+        self.group1.places.add(*self.places[:3])
+        self.group2.places.add(*self.places[2:5])
+        place = self.places[2]
+        place.latitude, place.longitude = 60, 170
+        place.save()
+        self.assertStatsFresh()
+        place.city = 'Somewhere'
+        place.save()
+        self.assertStatsFresh()
+        self.places[0].delete()
+        place.delete()
+        self.assertStatsFresh()
+
+    def test_upsert_and_merge(self):
+        """
+        Test if stats follow places moved by upsert and memberships moved by merging duplicates.
+        """
+        place = Place.objects.create(city='Warsaw', country='Poland', latitude=52.123456, longitude=21.123456)
+        duplicate = Place.objects.create(city='Warsaw', country='Poland', latitude=52.123459, longitude=21.123459)
+        self.group1.places.add(place, self.places[0])
+        self.group2.places.add(place, duplicate, self.places[1])
+
+        upsert_places([{'city': 'Warsaw', 'country': 'Poland', 'latitude': 52.123461, 'longitude': 21.123461}])
+        self.assertEqual(Place.objects.filter(latitude=52.123461).count(), 1)
+        self.assertStatsFresh()
+        self.assertEqual(merge_duplicate_places(), (1, 1))
+        self.assertStatsFresh()
+        self.assertEqual(GroupStats.objects.get(group=self.group2).places, 2)
+
+    def test_centroid(self):
+        """
+        Test if centroid is spherical, so it does not jump across the globe at antimeridian.
+        """
+        east = Place.objects.create(latitude=10, longitude=179)
+        west = Place.objects.create(latitude=-10, longitude=-179)
+        self.group1.places.add(east, west)
+
+        latitude, longitude = GroupStats.objects.get(group=self.group1).centroid
+        self.assertAlmostEqual(latitude, 0)
+        self.assertAlmostEqual(abs(longitude), 180)
+
+    def test_recompute_command(self):
+        """
+        Test if command recomputes stats of groups which drifted or were never kept.
+        """
+        self.group1.places.add(*self.places)
+        self.group2.places.add(*self.places[:2])
+        GroupStats.objects.filter(group=self.group1).update(places=100, x=5)
+        GroupStats.objects.filter(group=self.group2).delete()
+        out = StringIO()
+
+        call_command('recompute_group_stats', chunk_size=1, stdout=out)
+
+        self.assertIn('Computed stats of 2 groups', out.getvalue())
+        self.assertEqual(GroupStats.objects.count(), 2)
+        self.assertStatsFresh()
+
+
+class GroupDetailStatsTest(ScrapperAPITestCase):
+    def test_stats_inline(self):
+        """
+        Test if group is given with stats, read with the same number of queries for any size.
+        """
+        small = Group.objects.create(name='small')
+        large = Group.objects.create(name='large')
+        large.places.add(*[Place.objects.create(latitude=i / 10, longitude=i / 5) for i in range(100)])
+        small.places.add(Place.objects.get(latitude=0))
+
+        counts = []
+        for group in (small, large):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('group-detail', kwargs={'pk': group.pk}))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+        stats = response.data['stats']
+        self.assertEqual(stats['places'], 100)
+        self.assertEqual(stats['bbox'], [0, 0, 19.8, 9.9])
+        self.assertAlmostEqual(stats['centroid']['latitude'], 4.95, places=1)
+        self.assertAlmostEqual(stats['centroid']['longitude'], 9.9, places=1)
+
+    def test_stats_computed_when_missing(self):
+        """
+        Test if stats of group are computed when they are not kept, like for groups loaded from fixtures.
+        """
+        group = Group.objects.create(name='grp')
+        group.places.add(Place.objects.create(latitude=1, longitude=2))
+        GroupStats.objects.all().delete()
+
+        response = self.client.get(reverse('group-detail', kwargs={'pk': group.pk}))
+
+        self.assertEqual(response.data['stats']['places'], 1)
+        self.assertEqual(response.data['stats']['bbox'], [2, 1, 2, 1])
@@ -4,8 +4,17 @@ from scrapper import views
 
 urlpatterns = [
     url(r'^places/$', views.places_list, name='places-list'),
+    url(r'^places/bulk/$', views.places_bulk, name='places-bulk'),
+    url(r'^places/nearby/$', views.places_nearby, name='places-nearby'),
+    url(r'^places/search/$', views.places_search, name='places-search'),
+    url(r'^places/clusters/$', views.places_clusters, name='places-clusters'),
+    url(r'^places/geocode/$', views.places_geocode, name='places-geocode'),
     url(r'^places/(?P<pk>[0-9]+)$', views.place_detail, name='place-detail'),
     url(r'^groups/$', views.groups_list, name='groups-list'),
     url(r'^groups/(?P<pk>[0-9]+)$', views.group_detail, name='group-detail'),
     url(r'^groups/(?P<pk>[0-9]+)/places/$', views.group_places, name='group-places'),
+    url(r'^groups/(?P<pk>[0-9]+)/clusters/$', views.group_clusters, name='group-clusters'),
+    url(r'^changes/$', views.changes, name='changes'),
+    url(r'^batch/$', views.batch, name='batch'),
+    url(r'^metrics$', views.metrics, name='metrics'),
 ]
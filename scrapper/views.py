@@ -1,29 +1,287 @@
+from collections import OrderedDict
+
+from django.http import Http404, HttpResponse
 from rest_framework import status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, parser_classes, renderer_classes
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
+from scrapper.batch import run_batch, validate_operations
+from scrapper.bulk import bulk_create_places, find_duplicate
+from scrapper.caching import versioned_response
+from scrapper.changes import CHANGES_MAX_PAGE_SIZE, changes_since, latest_token, oldest_token
+from scrapper.clusters import CLUSTER_MAX_ZOOM, cluster_index
+from scrapper.fastjson import (
+    FIELDS_QUERY_PARAM, PLACE_FIELDS, group_rows, is_compact, place_rows, project, requested_fields,
+    rows_response, with_places,
+)
+from scrapper.geo import BBOX_QUERY_PARAM, filter_bbox, parse_bbox
+from scrapper.geocoding import reverse_geocoder
+from scrapper.membership import Membership, add_places, remove_places, replace_places
+from scrapper.metrics import METRICS_ENABLED, registry
 from scrapper.models import Place, Group
-from scrapper.serializers import PlaceSerializer, GroupSerializer
+from scrapper.pagination import query_flag
+from scrapper.parsers import NDJSONParser
+from scrapper.purge import delete_group_in_background, purge_group
+from scrapper.search import SEARCH_FIELDS, SEARCH_MAX_LIMIT, normalize_prefix, search_places
+from scrapper.renderers import PLACE_EXPORT_RENDERERS, CompactJSONRenderer
+from scrapper.serializers import PlaceSerializer, GroupSerializer, GroupStatsSerializer
+from scrapper.spatial import place_index
+from scrapper.stats import group_stats
+from scrapper.streaming import is_streamed, streaming_json_response
+
+# Only place lists give compact rows, other routes answer `?format=compact` with 404.
+# They can be also exported as MessagePack or binary columns, chosen by Accept header.
+PLACE_LIST_RENDERERS = tuple(api_settings.DEFAULT_RENDERER_CLASSES) + (CompactJSONRenderer,) + PLACE_EXPORT_RENDERERS
 
 
+@versioned_response(lambda: ['place'])
 @api_view(['GET', 'POST'])
+@renderer_classes(PLACE_LIST_RENDERERS)
 def places_list(request):
     """
-    List all places or create new place.
+    List all places or create new place, posting duplicate
+    of existing place updates it instead.
+    Listing is cursor paginated unless `?all=true` is given,
+    `?stream=true` streams all places without building them in memory.
+    `?bbox=minLon,minLat,maxLon,maxLat` limits places to bounding box.
+    `?fields=id,latitude,longitude` selects only listed fields and
+    `?format=compact` gives header row followed by arrays of values.
+    Besides JSON, lists are rendered as MessagePack (`application/msgpack`)
+    or id, latitude and longitude arrays (`application/x-place-columns`),
+    streaming is JSON only.
     """
     if request.method == 'GET':
-        places = Place.objects.all()
-        serializer = PlaceSerializer(places, many=True)
-        return Response(serializer.data)
+        try:
+            fields = requested_fields(request, PLACE_FIELDS)
+        except ValueError as exc:
+            return Response({FIELDS_QUERY_PARAM: [str(exc)]}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            places = filter_bbox(request, Place.objects.all())
+        except ValueError as exc:
+            return Response({BBOX_QUERY_PARAM: [str(exc)]}, status=status.HTTP_400_BAD_REQUEST)
+        compact = is_compact(request)
+        if is_streamed(request):
+            return streaming_json_response(places, fields, compact=compact)
+        return rows_response(request, place_rows(places, fields), project(fields, compact))
 
+    # Create place or update existing duplicate of it
     elif request.method == 'POST':
         serializer = PlaceSerializer(data=request.data)
         if serializer.is_valid():
+            duplicate = find_duplicate(serializer.validated_data)
+            if duplicate is not None:
+                serializer.instance = duplicate
+                serializer.save()
+                return Response(serializer.data)
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['POST'])
+@parser_classes((JSONParser, NDJSONParser))
+def places_bulk(request):
+    """
+    Create many places at once from JSON array or NDJSON body.
+    Invalid places are reported by their index and do not stop the others,
+    duplicates of existing places update them.
+    """
+    if not isinstance(request.data, list):
+        return Response({'non_field_errors': ['Expected a list of places.']},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    created, updated, errors = bulk_create_places(request.data)
+    if errors and not created and not updated:
+        response_status = status.HTTP_400_BAD_REQUEST
+    else:
+        response_status = status.HTTP_201_CREATED
+    return Response({'created': created, 'updated': updated, 'errors': errors}, status=response_status)
+
+
+@api_view(['POST'])
+def batch(request):
+    """
+    Run many operations on places and groups in one request and transaction.
+    Takes `{"operations": [{"method", "path", "body"}], "atomic": true}`,
+    with `atomic` false failed operations do not roll back the others.
+    Responds with status and data of every operation.
+    """
+    data = request.data if isinstance(request.data, dict) else {}
+    operations, errors = validate_operations(data.get('operations'))
+    if errors:
+        return Response({'operations': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+    atomic = data.get('atomic', True)
+    if not isinstance(atomic, bool):
+        return Response({'atomic': ['Must be a valid boolean.']}, status=status.HTTP_400_BAD_REQUEST)
+
+    committed, results = run_batch(request, operations, atomic)
+    if atomic and not committed and operations:
+        response_status = status.HTTP_400_BAD_REQUEST
+    else:
+        response_status = status.HTTP_200_OK
+    return Response(OrderedDict([('committed', committed), ('results', results)]), status=response_status)
+
+
+# Maximum number of places returned by nearby search
+NEARBY_MAX_RESULTS = 1000
+
+
+def _point_params(request, optional=()):
+    """
+    Parse required `lat` and `lon` and given optional numeric query parameters,
+    `k` being integer. Returns tuple of parsed parameters and errors dict.
+    """
+    errors = {}
+    params = {}
+    for name in ('lat', 'lon') + tuple(optional):
+        value = request.query_params.get(name)
+        if value is None:
+            continue
+        try:
+            params[name] = int(value) if name == 'k' else float(value)
+        except ValueError:
+            errors[name] = ['A valid number is required.']
+    for name in ('lat', 'lon'):
+        if name not in params and name not in errors:
+            errors[name] = ['This field is required.']
+    if 'lat' in params and not -90 <= params['lat'] <= 90:
+        errors['lat'] = ['Latitude must be in [-90, 90] range.']
+    if 'lon' in params and not -180 <= params['lon'] <= 180:
+        errors['lon'] = ['Longitude must be in [-180, 180] range.']
+    return params, errors
+
+
+@api_view(['GET'])
+def places_nearby(request):
+    """
+    Find places nearest to `?lat=&lon=` point.
+    Either `k` nearest places or those within `radius_km` are returned,
+    ordered by distance which is added to every place as `distance_km`.
+    """
+    params, errors = _point_params(request, ('k', 'radius_km'))
+    if not 0 < params.get('k', 1) <= NEARBY_MAX_RESULTS:
+        errors['k'] = ['Ensure this value is between 1 and %d.' % NEARBY_MAX_RESULTS]
+    if params.get('radius_km', 0) < 0:
+        errors['radius_km'] = ['Ensure this value is greater than or equal to 0.']
+    if errors:
+        return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+    if 'radius_km' in params:
+        found = place_index.within(params['lat'], params['lon'], params['radius_km'],
+                                   limit=params.get('k', NEARBY_MAX_RESULTS))
+    else:
+        found = place_index.nearest(params['lat'], params['lon'], params.get('k', 10))
+
+    places = Place.objects.in_bulk([pk for pk, _ in found])
+    data = []
+    for pk, distance in found:
+        if pk in places:
+            place_data = PlaceSerializer(places[pk]).data
+            place_data['distance_km'] = distance
+            data.append(place_data)
+    return Response(data)
+
+
+@versioned_response(lambda: ['place'])
+@api_view(['GET'])
+def places_search(request):
+    """
+    Suggest cities, or countries with `?field=country`, starting with `?q=`
+    prefix, ignoring case. Suggestions are ordered by their number of places,
+    `?limit=` of them is returned. Unless they are served from memory, see
+    SCRAPPER_SEARCH_IN_MEMORY, prefix must have at least 2 characters.
+    """
+    errors = {}
+    prefix = normalize_prefix(request.query_params.get('q'))
+    if not prefix:
+        errors['q'] = ['This field is required.']
+    field = request.query_params.get('field', 'city')
+    if field not in SEARCH_FIELDS:
+        errors['field'] = ['Expected one of: %s.' % ', '.join(SEARCH_FIELDS)]
+    limit = None
+    if 'limit' in request.query_params:
+        try:
+            limit = int(request.query_params['limit'])
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= SEARCH_MAX_LIMIT:
+            errors['limit'] = ['Ensure this value is between 1 and %d.' % SEARCH_MAX_LIMIT]
+    if errors:
+        return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        return Response(search_places(field, prefix, limit))
+    except ValueError as exc:
+        return Response({'q': [str(exc)]}, status=status.HTTP_400_BAD_REQUEST)
+
+
+def _clusters_response(request, group_pk=None):
+    """
+    Cluster places, or group's places, in grid cells of `?z=` zoom level
+    intersecting `?bbox=`. Returns response with list of clusters.
+    """
+    errors = {}
+    try:
+        zoom = int(request.query_params.get('z', ''))
+    except ValueError:
+        zoom = None
+    if zoom is None or not 0 <= zoom <= CLUSTER_MAX_ZOOM:
+        errors['z'] = ['Ensure this value is between 0 and %d.' % CLUSTER_MAX_ZOOM]
+    bbox = None
+    if BBOX_QUERY_PARAM in request.query_params:
+        try:
+            bbox = parse_bbox(request.query_params[BBOX_QUERY_PARAM])
+        except ValueError as exc:
+            errors[BBOX_QUERY_PARAM] = [str(exc)]
+    if errors:
+        return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        clusters = cluster_index.clusters(zoom, bbox, group_pk)
+    except ValueError as exc:
+        return Response({BBOX_QUERY_PARAM: [str(exc)]}, status=status.HTTP_400_BAD_REQUEST)
+    return Response([
+        OrderedDict([('count', count), ('latitude', latitude), ('longitude', longitude)])
+        for count, latitude, longitude in clusters
+    ])
+
+
+@versioned_response(lambda: ['place'])
+@api_view(['GET'])
+def places_clusters(request):
+    """
+    Cluster places for map at `?z=` zoom level, optionally within `?bbox=`.
+    Places are counted in cells of grid made of map tiles, every non-empty
+    cell intersecting the box gives `count` of its places and `latitude`
+    and `longitude` of their centroid.
+    """
+    return _clusters_response(request)
+
+
+@api_view(['GET'])
+def places_geocode(request):
+    """
+    Find city and country of `?lat=&lon=` point in offline gazetteer,
+    together with `distance_km` to the city.
+    """
+    if not reverse_geocoder.is_available:
+        return Response({'detail': 'Reverse geocoding is not configured.'},
+                        status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    params, errors = _point_params(request)
+    if errors:
+        return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+    found = reverse_geocoder.lookup(params['lat'], params['lon'])
+    if found is None:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+    city, country, distance = found
+    return Response(OrderedDict([('city', city), ('country', country), ('distance_km', distance)]))
+
+
+@versioned_response(lambda pk: ['place'])
 @api_view(['GET', 'PUT', 'DELETE'])
 def place_detail(request, pk):
     """
@@ -50,15 +308,15 @@ def place_detail(request, pk):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+@versioned_response(lambda: ['group', 'place'])
 @api_view(['GET', 'POST'])
 def groups_list(request):
     """
     List all groups or create new group. 
+    Listing is cursor paginated unless `?all=true` is given.
     """
     if request.method == 'GET':
-        groups = Group.objects.all()
-        serializer = GroupSerializer(groups, many=True)
-        return Response(serializer.data)
+        return rows_response(request, group_rows(Group.objects.active()), with_places)
 
     elif request.method == 'POST':
         serializer = GroupSerializer(data=request.data)
@@ -68,20 +326,28 @@ def groups_list(request):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+# Query parameter which makes group deletion return before places are purged
+ASYNC_QUERY_PARAM = 'async'
+
+
+@versioned_response(lambda pk: ['group:%s' % pk, 'place'])
 @api_view(['GET', 'PUT', 'DELETE'])
 def group_detail(request, pk):
     """
     Get, update or delete single group object. 
+    Group is given with `stats` of its places: their number, spherical
+    centroid and bounding box, which are kept precomputed.
     """
     try:
-        group = Group.objects.get(pk=pk)
+        group = Group.objects.active().get(pk=pk)
     except Group.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
 
     # Get group details
     if request.method == 'GET':
-        serializer = GroupSerializer(group)
-        return Response(serializer.data)
+        data = GroupSerializer(group).data
+        data['stats'] = GroupStatsSerializer(group_stats(group)).data
+        return Response(data)
 
     # Update group
     elif request.method == 'PUT':
@@ -91,37 +357,125 @@ def group_detail(request, pk):
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    # Delete group
+    # Delete group with places that belong to no other group.
+    # With `?async=true` group is only hidden and purged in background.
     elif request.method == 'DELETE':
-        # Exclude places that belong to other groups
-        places = group.places.exclude(groups__pk__lt=group.pk).exclude(groups__pk__gt=group.pk)
-        places.delete()
-        group.delete()
+        if query_flag(request, ASYNC_QUERY_PARAM):
+            delete_group_in_background(group)
+            return Response(status=status.HTTP_202_ACCEPTED)
+        purge_group(group.pk)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-@api_view(['GET', 'POST', 'DELETE'])
+@versioned_response(lambda pk: ['group:%s' % pk, 'place'])
+@api_view(['GET', 'POST', 'PUT', 'DELETE'])
+@renderer_classes(PLACE_LIST_RENDERERS)
 def group_places(request, pk):
+    """
+    List places of group, add (POST), remove (DELETE) or replace (PUT) them.
+    Changes take `{"places": [ids]}`, ids of nonexistent places are skipped.
+    Listing supports `?bbox=`, `?fields=` and `?format=compact` as places list does.
+    """
     try:
-        group = Group.objects.get(pk=pk)
+        group = Group.objects.active().get(pk=pk)
     except Group.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
 
-    # Get places in group
+    # Get places in group, optionally limited to bounding box
     if request.method == 'GET':
-        serializer = PlaceSerializer(group.places.all(), many=True)
-        return Response(serializer.data)
+        try:
+            fields = requested_fields(request, PLACE_FIELDS)
+        except ValueError as exc:
+            return Response({FIELDS_QUERY_PARAM: [str(exc)]}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            places = filter_bbox(request, group.places.all())
+        except ValueError as exc:
+            return Response({BBOX_QUERY_PARAM: [str(exc)]}, status=status.HTTP_400_BAD_REQUEST)
+        transform = project(fields, is_compact(request))
+        return Response(transform(place_rows(places, fields)))
 
-    # Add places to group
-    elif request.method == 'POST':
-        places = Place.objects.filter(pk__in=request.data['places'])
-        group.places.add(*places)
-        serializer = GroupSerializer(group)
-        return Response(serializer.data)
+    # Add, remove or replace places of group, working on memberships only
+    place_pks = request.data.get('places') if isinstance(request.data, dict) else None
+    # Strings and booleans would pass int(), so only true lists of ints are taken
+    if not isinstance(place_pks, list) or not all(
+            isinstance(place_pk, int) and not isinstance(place_pk, bool) for place_pk in place_pks):
+        return Response({'places': ['Expected a list of place ids.']},
+                        status=status.HTTP_400_BAD_REQUEST)
 
-    # Delete places from group
+    if request.method == 'POST':
+        add_places(group, place_pks)
     elif request.method == 'DELETE':
-        places = group.places.filter(pk__in=request.data['places'])
-        group.places.remove(*places)
-        serializer = GroupSerializer(group)
-        return Response(serializer.data)
+        remove_places(group, place_pks)
+    elif request.method == 'PUT':
+        replace_places(group, place_pks)
+
+    # Same representation as GroupSerializer gives, without loading places
+    places = Membership.objects.filter(group_id=group.pk).order_by('place_id')
+    return Response(OrderedDict([
+        ('id', group.pk),
+        ('name', group.name),
+        ('places', list(places.values_list('place_id', flat=True))),
+    ]))
+
+
+@versioned_response(lambda pk: ['group:%s' % pk, 'place'])
+@api_view(['GET'])
+def group_clusters(request, pk):
+    """
+    Cluster places of group for map, the same way as places clusters does.
+    """
+    if not Group.objects.active().filter(pk=pk).exists():
+        return Response(status=status.HTTP_404_NOT_FOUND)
+    return _clusters_response(request, int(pk))
+
+
+@versioned_response(lambda: ['place', 'group'])
+@api_view(['GET'])
+def changes(request):
+    """
+    List changes of places, groups and groups' places logged after `?since=` token,
+    at most `?page_size=` of them. Response gives `next` token to continue from
+    and `more` telling if further changes wait. `since=0` replays everything
+    until old changes are pruned, see `manage.py prune_changes`. Token older
+    than the kept changes gets 410 with `next` token, client lists all data
+    again and continues from it.
+    """
+    errors = {}
+    params = {}
+    for name in ('since', 'page_size'):
+        value = request.query_params.get(name)
+        if value is None:
+            continue
+        try:
+            params[name] = int(value)
+        except ValueError:
+            errors[name] = ['A valid integer is required.']
+    if params.get('since', 0) < 0:
+        errors['since'] = ['Ensure this value is greater than or equal to 0.']
+    if not 0 < params.get('page_size', 1) <= CHANGES_MAX_PAGE_SIZE:
+        errors['page_size'] = ['Ensure this value is between 1 and %d.' % CHANGES_MAX_PAGE_SIZE]
+    if errors:
+        return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+    if params.get('since', 0) < oldest_token():
+        return Response(OrderedDict([
+            ('detail', 'Changes after this token were pruned, sync again from scratch.'),
+            ('next', latest_token()),
+        ]), status=status.HTTP_410_GONE)
+
+    entries, next_token, has_more = changes_since(params.get('since', 0), params.get('page_size'))
+    return Response(OrderedDict([
+        ('changes', entries),
+        ('next', next_token),
+        ('more', has_more),
+    ]))
+
+
+def metrics(request):
+    """
+    Expose latency histograms and request phase totals of this process
+    in Prometheus text format, when SCRAPPER_METRICS_ENABLED is set.
+    """
+    if not METRICS_ENABLED:
+        raise Http404
+    return HttpResponse(registry.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')